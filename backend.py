@@ -0,0 +1,107 @@
+import sys
+
+
+class DDCBackend:
+    """
+    Interface to the DDC/CI channel of physical monitors.
+
+    Handles returned by enumerate() are opaque to the rest of the bridge and
+    are only passed back to the same backend. Like the functions in ddc.py,
+    failures are reported through the return value rather than exceptions.
+    """
+    name = None
+
+    def enumerate(self):
+        """
+        Opens a handle to every physical monitor that is currently attached.
+
+        Returns:
+            list: A list of tuples containing (handle, description) for each physical monitor
+        """
+        raise NotImplementedError
+
+    def topology(self):
+        """
+        Returns a cheap value that changes when displays are added, removed or
+        reconfigured, or None if the backend cannot tell.
+        """
+        return None
+
+    def edid(self, handle):
+        """
+        Gets the EDID of a monitor, which identifies it across enumerations.
+
+        Returns:
+            bytes: The EDID base block, or None if unable to determine
+        """
+        return None
+
+    def get_vcp(self, handle, code):
+        """
+        Gets the current value of a VCP feature.
+
+        Returns:
+            tuple: (current_value, maximum_value) if successful, (None, None) otherwise
+        """
+        raise NotImplementedError
+
+    def set_vcp(self, handle, code, value):
+        """
+        Sets a VCP feature.
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        raise NotImplementedError
+
+    def capabilities(self, handle):
+        """
+        Gets the MCCS capabilities string of a monitor.
+
+        Returns:
+            str: The capabilities string, or None if unable to determine
+        """
+        return None
+
+    def last_error(self):
+        """
+        Returns the error of the last failed call made on the current thread,
+        e.g. a Win32 error code, or None if unknown.
+        """
+        return None
+
+    def close(self, handle):
+        """
+        Releases a handle returned by enumerate().
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        return True
+
+
+def get_backend(name="auto", **options):
+    """
+    Creates a DDC backend by name.
+
+    Args:
+        name: "dxva2", "i2c", "simulator" or "auto" to pick by platform
+        **options: Backend specific options from the ddc section of config.yml
+
+    Returns:
+        DDCBackend: The backend instance
+    """
+    if name == "auto":
+        name = "dxva2" if sys.platform == "win32" else "i2c"
+
+    if name == "dxva2":
+        from ddc import Dxva2Backend
+        return Dxva2Backend()
+    if name == "i2c":
+        from i2c import I2CBackend
+        return I2CBackend(**options)
+    if name == "simulator":
+        from simulator import SimulatedBackend
+        return SimulatedBackend(**options)
+
+    raise ValueError(f"Unknown DDC backend: {name}")
@@ -0,0 +1,773 @@
+"""
+Benchmarks for the bridge that run without a monitor or a broker.
+
+Usage:
+    python bench.py [scenario ...]
+    python bench.py replay --monitors 16 --rounds 10 --memory
+    python bench.py replay --trace trace.jsonl  # recorded with broker.py --record
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+
+from commands import CommandWriter
+from monitors import MonitorRegistry
+from scheduler import Scheduler
+from simulator import SimulatedBackend
+from timer import Timer
+from workers import WorkerPool
+from router import Router
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def report(name, samples):
+    print(f"  {name}: p50={percentile(samples, 50) * 1000:.3f}ms "
+          f"p99={percentile(samples, 99) * 1000:.3f}ms max={max(samples) * 1000:.3f}ms")
+
+
+class _Poller:
+    def __init__(self):
+        self.polls = 0
+
+    def on_timer(self, timer, elapsed):
+        self.polls += 1
+        timer.start()
+
+
+def bench_loop(args):
+    """
+    Idle CPU of the event loop, and latency from an incoming MQTT command to its DDC write.
+    """
+    from start import Service
+
+    duration = args.duration
+
+    # Baseline: the old busy loop stepping timers by measured dt
+    deadline = time.perf_counter() + duration
+    cpu = time.process_time()
+    iterations = 0
+    while time.perf_counter() < deadline:
+        iterations += 1
+    spin_cpu = time.process_time() - cpu
+    print(f"  busy-spin: {spin_cpu / duration * 100:.1f}% CPU, {iterations} iterations")
+
+    scheduler = Scheduler()
+    poller = _Poller()
+    Timer(0.1, poller, scheduler)
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    cpu = time.process_time()
+    thread.start()
+    time.sleep(duration)
+    idle_cpu = time.process_time() - cpu
+    print(f"  scheduler idle: {idle_cpu / duration * 100:.2f}% CPU, {poller.polls} polls")
+    scheduler.stop()
+    thread.join()
+
+    # Command messages handed over from another thread, as the MQTT network thread does, timed until
+    # the simulated monitor receives the write. DDC calls take no time, only the bridge is measured.
+    config = simulator_config(args, os.devnull)
+    config["ddc"].update(capabilities=False, latency=0)
+    config["commands"] = {"settle": 0, "throttle": 0}
+    config["display"] = config["display"][:1]
+    service = Service(config)
+    entity = service.entities[0]["input"]
+    written = threading.Event()
+    set_vcp = service.backend.set_vcp
+
+    def traced(handle, code, value):
+        written.set()
+        return set_vcp(handle, code, value)
+    service.backend.set_vcp = traced
+
+    thread = threading.Thread(target=service.scheduler.run, daemon=True)
+    thread.start()
+    latencies = []
+    for index in range(args.count):
+        target = ("HDMI", "DisplayPort")[index % 2]
+        written.clear()
+        sent = time.perf_counter()
+        service.scheduler.call_soon(service.on_message, entity["command"], target.encode())
+        written.wait()
+        latencies.append(time.perf_counter() - sent)
+        # The next command is sent once this one is confirmed, so no write waits behind another
+        while entity["state"] != target:
+            time.sleep(0.001)
+    report("command message -> DDC write", latencies)
+    service.scheduler.stop()
+    thread.join()
+    service.workers.stop()
+    service.monitors.close()
+    service.log_listener.stop()
+
+
+def bench_workers(args):
+    """
+    Slider sweeps on several monitors, inline on one thread versus per-monitor workers.
+    """
+    steps = 50
+
+    backend = SimulatedBackend(args.monitors, latency=args.latency)
+    handles = [handle for handle, _ in backend.enumerate()]
+    start = time.perf_counter()
+    for value in range(steps):
+        for handle in handles:
+            backend.set_vcp(handle, 0x10, value)
+    inline = time.perf_counter() - start
+    print(f"  inline: {inline:.2f}s, {backend.calls['set']} writes")
+
+    backend = SimulatedBackend(args.monitors, latency=args.latency)
+    handles = [handle for handle, _ in backend.enumerate()]
+    remaining = threading.Semaphore(0)
+    pool = WorkerPool(lambda callback, result: callback(result))
+    start = time.perf_counter()
+    for value in range(steps):
+        for display_id, handle in enumerate(handles):
+            pool.submit(display_id, partial(backend.set_vcp, handle, 0x10, value),
+                        lambda result: None, key=("set", 0x10))
+        # An HA slider drag sends a command every few milliseconds
+        time.sleep(0.005)
+    for display_id in range(len(handles)):
+        pool.submit(display_id, lambda: None, lambda result: remaining.release())
+    for _ in handles:
+        remaining.acquire()
+    pooled = time.perf_counter() - start
+    stats = pool.stats()
+    pool.stop()
+    print(f"  workers: {pooled:.2f}s, {backend.calls['set']} writes, "
+          f"{sum(s['coalesced'] for s in stats.values())} coalesced, "
+          f"max depth {max(s['max_depth'] for s in stats.values())}, "
+          f"final values {sorted(set(backend.get_vcp(handle, 0x10)[0] for handle in handles))}")
+
+
+def legacy_route(topic, payload):
+    """
+    The topic parsing on_message did before the routing table.
+    """
+    parts = topic.split("/")
+    if len(parts) < 4:
+        return None
+    try:
+        display_parts = parts[2].split("_")
+        display_id = int(display_parts[1])
+        command_type = "_".join(display_parts[2:])
+    except (IndexError, ValueError):
+        return None
+    return display_id, command_type, payload.decode("utf-8")
+
+
+def bench_router(args):
+    """
+    Command messages dispatched per second, topic parsing versus the routing table.
+    """
+    handled = []
+    router = Router()
+    topics = []
+    for display_id in range(args.monitors):
+        for key in ("input", "gamer_mode"):
+            topic = f"homeassistant/select/display_{display_id}_{key}/command"
+            router.add(topic, handled.append)
+            topics.append(topic)
+    messages = [(topics[i % len(topics)], b"HDMI") for i in range(args.count * 100)]
+
+    for name, dispatch in (("split", legacy_route), ("table", router.dispatch)):
+        start = time.perf_counter()
+        for topic, payload in messages:
+            dispatch(topic, payload)
+        elapsed = time.perf_counter() - start
+        print(f"  {name}: {len(messages) / elapsed:,.0f} messages/s")
+
+    start = time.perf_counter()
+    for _ in messages:
+        router.dispatch("homeassistant/select/display_x_unknown/command", b"HDMI")
+    print(f"  unknown topics: {len(messages) / (time.perf_counter() - start):,.0f} messages/s")
+
+
+def bench_commands(args):
+    """
+    Input switches on monitors that drop writes and apply them late, write only versus write-verify-retry.
+    """
+    commands = max(1, args.count // 50)
+    values = (0x0F, 0x11)
+
+    def flaky_backend():
+        return SimulatedBackend(args.monitors, latency=args.latency, failure_rate=0.05, ignore_rate=0.2,
+                                apply_delay=0.08, seed=1)
+
+    # Write only: the state published after the write is wrong whenever the monitor did not apply it
+    backend = flaky_backend()
+    handles = [handle for handle, _ in backend.enumerate()]
+    wrong = 0
+    for index in range(commands):
+        for handle in handles:
+            backend.set_vcp(handle, 0x60, values[index % 2])
+        time.sleep(0.2)
+        wrong += sum(backend.get_vcp(handle, 0x60)[0] != values[index % 2] for handle in handles)
+    print(f"  write only: {wrong} of {commands * len(handles)} published states wrong")
+
+    backend = flaky_backend()
+    monitors = MonitorRegistry(backend)
+    pool = WorkerPool(lambda callback, result: callback(result))
+    writer = CommandWriter(backend, monitors, pool)
+    results = []
+    done = threading.Semaphore(0)
+
+    def on_result(result):
+        results.append(result)
+        done.release()
+
+    start = time.perf_counter()
+    for index in range(commands):
+        for display_id in range(args.monitors):
+            writer.submit(display_id, 0x60, values[index % 2], on_result)
+        for _ in range(args.monitors):
+            done.acquire()
+    elapsed = time.perf_counter() - start
+    pool.stop()
+    monitors.close()
+
+    confirmed = [result for result in results if result.confirmed]
+    print(f"  verified: {len(confirmed)} of {len(results)} confirmed, "
+          f"{sum(result.attempts for result in results) / len(results):.2f} writes per command, "
+          f"{elapsed:.2f}s for {args.monitors} monitors in parallel")
+    report("confirm latency", [result.seconds for result in confirmed])
+
+
+def simulator_config(args, cache):
+    """
+    Bridge config for args.monitors simulated displays, without a reachable broker.
+    """
+    return {
+        "mqtt": {"username": "", "password": "", "host": "127.0.0.1", "port": 1},
+        "ddc": {"backend": "simulator", "monitors": args.monitors, "latency": args.latency, "poll_delay": 0,
+                "capabilities_latency": args.capabilities_latency, "capabilities_cache": cache},
+        "logging": {"level": "WARNING"},
+        "snapshot": False,
+        "display": [{"id": display_id, "inputs": {"HDMI": 17, "DisplayPort": 15}}
+                    for display_id in range(args.monitors)],
+    }
+
+
+def bench_startup(args):
+    """
+    Time from constructing the bridge until a command is accepted and confirmed and until every
+    entity has a state, cold, with cached capabilities and from the snapshot of the previous run.
+    """
+    from start import Service
+
+    def ready(service):
+        return all(service.entities.get(display_id)
+                   and all(entity["state"] is not None for entity in service.entities[display_id].values())
+                   for display_id in service.displays)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = os.path.join(directory, "capabilities.json")
+        snapshot = os.path.join(directory, "snapshot.json")
+        # Only the last start finds the snapshot the one before saved
+        for name in ("cold", "cached", "snapshot"):
+            config = simulator_config(args, cache)
+            config["snapshot"] = {"path": snapshot}
+            start = time.perf_counter()
+            service = Service(config)
+            built = time.perf_counter() - start
+
+            # The command is accepted once the entity is available, then confirmed by its state
+            accepted = confirmed = None
+            while confirmed is None or not ready(service):
+                entity = service.entities.get(0, {}).get("input")
+                if accepted is None and entity is not None and entity["state"] is not None:
+                    accepted = time.perf_counter() - start
+                    target = "DisplayPort" if entity["state"] != "DisplayPort" else "HDMI"
+                    service.on_message(entity["command"], target.encode())
+                if confirmed is None and accepted is not None and entity["state"] == target:
+                    confirmed = time.perf_counter() - start
+                service.scheduler.run_once(0.01)
+            elapsed = time.perf_counter() - start
+            entities = service.discovery.entities.values()
+            print(f"  {name}: construct {built * 1000:.1f}ms, first command accepted {accepted * 1000:.1f}ms, "
+                  f"confirmed {confirmed * 1000:.1f}ms, ready {elapsed * 1000:.1f}ms for {len(entities)} entities")
+
+            if name == "cached":
+                service.save_snapshot()
+            service.workers.stop()
+            service.monitors.close()
+            service.log_listener.stop()
+
+    full = sum(len(json.dumps(entity.config)) for entity in entities)
+    compact = sum(len(entity.payload) for entity in entities)
+    print(f"  discovery: {compact} bytes, {full} bytes unabbreviated, "
+          f"unchanged configs republished: {service.discovery.publish()}")
+
+
+def bench_slider(args):
+    """
+    A Home Assistant slider drag: DDC writes sent and time until the final value is confirmed.
+    """
+    from start import Service
+
+    # A one second drag sends a command every 10ms, ending on the value the user let go at
+    values = list(range(0, 101))
+    for name, throttle in (("unthrottled", 0), ("throttled", 0.25)):
+        config = simulator_config(args, os.devnull)
+        config["ddc"]["capabilities"] = False
+        config["commands"] = {"throttle": throttle}
+        config["display"] = [{"id": 0, "numbers": ["brightness"]}]
+        service = Service(config)
+        entity = service.entities[0]["brightness"]
+        while entity["state"] is None:
+            service.scheduler.run_once(0.1)
+
+        backend = service.backend
+        set_vcp = backend.set_vcp
+        writes = []
+
+        def counted(handle, code, value):
+            writes.append(value)
+            return set_vcp(handle, code, value)
+        backend.set_vcp = counted
+
+        for index, value in enumerate(values):
+            service.scheduler.call_later(index * 0.01, service.command, 0, "brightness", str(value))
+        released = time.perf_counter() + (len(values) - 1) * 0.01
+        final = str(values[-1])
+        while entity["state"] != final:
+            service.scheduler.run_once(0.01)
+        elapsed = time.perf_counter() - released
+        print(f"  {name}: {len(values)} commands, {len(writes)} writes, final value confirmed "
+              f"{elapsed * 1000:.0f}ms after release")
+
+        service.workers.stop()
+        service.monitors.close()
+        service.log_listener.stop()
+
+
+def bench_presets(args):
+    """
+    Time to apply a preset to one display and to all of them, which run in parallel.
+    """
+    from start import Service
+
+    config = simulator_config(args, os.devnull)
+    config["ddc"]["capabilities"] = False
+    values = {"input": "HDMI", "brightness": 60}
+    config["presets"] = {
+        "one": {0: values},
+        "all": {display_id: values for display_id in range(args.monitors)},
+    }
+    service = Service(config)
+    finished = []
+    write_many = service.write_many
+
+    def traced(writes, callback):
+        def on_results(results):
+            callback(results)
+            finished.append(results)
+        write_many(writes, on_results)
+    service.write_many = traced
+
+    for name in ("one", "all"):
+        times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            service.apply_preset(name)
+            while not finished:
+                service.scheduler.run_once(0.01)
+            times.append(time.perf_counter() - start)
+            confirmed = sum(result is not None and result.confirmed for result in finished.pop())
+        print(f"  {name}: {len(service.presets[name].displays)} displays, {confirmed} writes confirmed, "
+              f"mean {sum(times) / len(times) * 1000:.0f}ms")
+
+    service.workers.stop()
+    service.monitors.close()
+    service.log_listener.stop()
+
+
+def bench_reload(args):
+    """
+    Time to apply an edited config and the discovery configs it publishes, against a restart.
+    """
+    import copy
+    from start import Service
+
+    config = simulator_config(args, os.devnull)
+    config["ddc"]["capabilities"] = False
+    service = Service(config)
+    while not all(entity["state"] is not None for entity in service.entities[0].values()):
+        service.scheduler.run_once(0.1)
+
+    edited = copy.deepcopy(config)
+    edited["interval"] = 30
+    edited["display"][0]["inputs"] = {"HDMI 1": 17, "DisplayPort": 15}
+    start = time.perf_counter()
+    changed = service.apply_config(edited)
+    elapsed = time.perf_counter() - start
+    print(f"  reload: {elapsed * 1000:.2f}ms, {changed} discovery configs published, "
+          f"{service.discovery.publish(force=True)} on a restart")
+
+    service.workers.stop()
+    service.monitors.close()
+    service.log_listener.stop()
+
+
+def bench_states(args):
+    """
+    MQTT messages per poll cycle in which every value changed, one state topic per entity versus
+    one JSON document per display.
+    """
+    from start import Service
+
+    for name, json_state in (("per entity", False), ("json", True)):
+        config = simulator_config(args, os.devnull)
+        config["ddc"]["capabilities"] = False
+        config["json_state"] = json_state
+        for display in config["display"]:
+            display["numbers"] = ["brightness", "contrast", "volume"]
+        service = Service(config)
+        while not all(entity["state"] is not None
+                      for display_id in service.displays for entity in service.entities[display_id].values()):
+            service.scheduler.run_once(0.1)
+        # Only the synthetic polls below are counted
+        for display_id in service.displays:
+            service.poll_schedule.remove(display_id)
+        service.workers.stop()
+        service.scheduler.run_once(0.05)
+
+        publish = service.mqtt.publish
+        sent = []
+
+        def counted(topic, payload, retain=False):
+            sent.append(len(payload))
+            return publish(topic, payload, retain)
+        service.mqtt.publish = counted
+
+        for cycle in range(args.rounds):
+            for display_id, display in service.displays.items():
+                results = {}
+                for code, feature in display.by_code.items():
+                    if feature.component == "select":
+                        values = sorted(feature.to_code.values())
+                        results[code] = (values[cycle % len(values)], None)
+                    else:
+                        results[code] = (40 + cycle % 2 * 20, 100)
+                service.on_poll(display_id, results)
+            while service.documents:
+                service.scheduler.run_once(0)
+        features = sum(len(display.features) for display in service.displays.values())
+        print(f"  {name}: {len(sent) / args.rounds:.1f} messages and {sum(sent) / args.rounds:.0f} bytes per cycle "
+              f"for {len(service.displays)} displays with {features} entities")
+
+        service.monitors.close()
+        service.log_listener.stop()
+
+
+def bench_standby(args):
+    """
+    DDC calls and worker time spent on a monitor in standby, and how soon it is noticed when it wakes up.
+    """
+    from start import Service
+
+    duration = 10
+    # Without capabilities the power mode is not read, and the high threshold never suspends polling
+    for name, capabilities, health in (("without health", False, {"threshold": 10 ** 9}),
+                                       ("with health", True, {"probe_interval": 2})):
+        with tempfile.TemporaryDirectory() as directory:
+            config = simulator_config(args, os.path.join(directory, "capabilities.json"))
+            config["ddc"].update(capabilities=capabilities, capabilities_latency=0, timeout=0.5)
+            config["interval"] = 1
+            config["health"] = health
+            for display in config["display"]:
+                display["numbers"] = ["brightness", "contrast", "volume"]
+            service = Service(config)
+            sleeping = service.backend.monitors[0]
+            sleeping.vcp[0xD6][0] = 4  # Off
+
+            calls = []
+            for operation in ("get_vcp", "set_vcp"):
+                def counted(handle, *args, call=getattr(service.backend, operation)):
+                    started = time.perf_counter()
+                    try:
+                        return call(handle, *args)
+                    finally:
+                        if handle.monitor is sleeping:
+                            calls.append(time.perf_counter() - started)
+                setattr(service.backend, operation, counted)
+
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                service.scheduler.run_once(0.1)
+
+            sleeping.vcp[0xD6][0] = 1
+            woke = time.perf_counter()
+            while not service.health[0].active and time.perf_counter() - woke < 10:
+                service.scheduler.run_once(0.1)
+            noticed = f"{time.perf_counter() - woke:.1f}s" if service.health[0].active else "never"
+            print(f"  {name}: {len(calls)} DDC calls to the sleeping monitor in {duration}s, "
+                  f"{sum(calls):.1f}s blocked, wake-up noticed after {noticed}")
+
+            service.workers.stop()
+            service.monitors.close()
+            service.log_listener.stop()
+
+
+def generate_trace(monitors, rounds):
+    """
+    A synthetic command trace: input switches, a preset, slider drags on every display and a Home Assistant restart.
+
+    Returns:
+        list: Trace events {"t", "topic", "payload"}, the last event of each
+              gesture with "expect", the state topic -> payload it must lead to
+    """
+    events = []
+    for index in range(rounds):
+        start = index * 4.0
+        for display_id in range(monitors):
+            events.append({"t": start + display_id * 0.01,
+                           "topic": f"homeassistant/select/display_{display_id}_input/command", "payload": "HDMI",
+                           "expect": {f"homeassistant/select/display_{display_id}_input/state": "HDMI"}})
+        events.append({"t": start + 1.0, "topic": "homeassistant/scene/preset_work/command", "payload": "ON",
+                       "expect": {f"homeassistant/number/display_{display_id}_brightness/state": "60"
+                                  for display_id in range(monitors)}})
+        # Overlapping one second drags, a command every 10ms
+        final = 20 if index % 2 else 80
+        for display_id in range(monitors):
+            for step in range(101):
+                value = round(60 + (final - 60) * step / 100)
+                event = {"t": start + 2.0 + display_id * 0.02 + step * 0.01,
+                         "topic": f"homeassistant/number/display_{display_id}_brightness/command",
+                         "payload": str(value)}
+                if step == 100:
+                    event["expect"] = {f"homeassistant/number/display_{display_id}_brightness/state": str(value)}
+                events.append(event)
+        events.append({"t": start + 3.5, "topic": "homeassistant/status", "payload": "online"})
+    events.sort(key=lambda event: event["t"])
+    return events
+
+
+def load_trace(path):
+    with open(path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def bench_replay(args):
+    """
+    Replays a command trace through a local broker into the bridge, e.g. --monitors 16.
+
+    Reports the latency from the last command of a gesture to the state it
+    leads to, process CPU per command (bridge, broker and client together)
+    and publishes by kind. With --memory it also reports the growth of the
+    bridge's memory from the end of the first round to the end of the trace,
+    which slows everything down while tracing.
+    """
+    import tracemalloc
+    import paho.mqtt.client as mqtt
+    from broker import Broker
+    from start import Service
+
+    trace = load_trace(args.trace) if args.trace else generate_trace(args.monitors, args.rounds)
+    if args.save_trace:
+        with open(args.save_trace, "w") as file:
+            file.writelines(json.dumps(event) + "\n" for event in trace)
+
+    broker = Broker().start()
+    received = []
+    broker.listeners.append(lambda topic, payload: received.append((time.perf_counter(), topic, payload)))
+
+    if args.memory:
+        tracemalloc.start()
+    config = simulator_config(args, os.devnull)
+    config["mqtt"]["port"] = broker.port
+    config["ddc"]["capabilities"] = False
+    for display in config["display"]:
+        display["numbers"] = ["brightness"]
+    config["presets"] = {"work": {display_id: {"input": "DisplayPort", "brightness": 60}
+                                  for display_id in range(args.monitors)}}
+    service = Service(config)
+    thread = threading.Thread(target=service.start, name="bridge", daemon=True)
+    thread.start()
+
+    client = mqtt.Client()
+    client.connect(broker.host, broker.port)
+    client.loop_start()
+    while not (service.mqtt.connected and all(entity["state"] is not None
+                                              for display_id in range(args.monitors)
+                                              for entity in list(service.entities.get(display_id, {}).values()))):
+        time.sleep(0.05)
+    time.sleep(0.5)
+
+    # Allocations of the benchmark itself and the broker are not the bridge's
+    ignored = [tracemalloc.Filter(False, "*bench.py"), tracemalloc.Filter(False, "*broker.py"),
+               tracemalloc.Filter(False, tracemalloc.__file__)]
+
+    def traced():
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignored)
+        return sum(stat.size for stat in snapshot.statistics("filename"))
+
+    round_length = 4.0
+    memory = []
+    sent = []
+    cpu = time.process_time()
+    start = time.perf_counter()
+    for event in trace:
+        if args.memory and not memory and event["t"] >= round_length:
+            memory.append(traced())
+        delay = start + event["t"] - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        client.publish(event["topic"], event["payload"])
+        sent.append((time.perf_counter(), event))
+    time.sleep(2.0)
+    cpu = time.process_time() - cpu
+    if memory:
+        memory.append(traced())
+    tracemalloc.stop()
+
+    client.loop_stop()
+    client.disconnect()
+    service.scheduler.stop()
+    thread.join()
+    broker.stop()
+
+    latencies = []
+    missing = 0
+    for sent_at, event in sent:
+        for topic, payload in (event.get("expect") or {}).items():
+            payload = payload.encode("utf-8")
+            seen = [at for at, received_topic, received_payload in received
+                    if at >= sent_at and received_topic == topic and received_payload == payload]
+            if seen:
+                latencies.append(seen[0] - sent_at)
+            else:
+                missing += 1
+
+    # Publishes by the bridge, by the last topic level
+    commands = {event["topic"] for event in trace}
+    kinds = {}
+    for at, topic, _ in received:
+        if at >= start and topic not in commands:
+            kind = topic.rsplit("/", 1)[-1]
+            kinds[kind] = kinds.get(kind, 0) + 1
+    print(f"  {len(trace)} commands to {args.monitors} monitors, {cpu / len(trace) * 1000:.3f}ms CPU per command, "
+          f"{sum(kinds.values())} publishes: " + ", ".join(f"{count} {kind}" for kind, count in sorted(kinds.items())))
+    if latencies:
+        report(f"command to state ({len(latencies)} confirmed, {missing} missing)", latencies)
+    if memory:
+        print(f"  memory: {(memory[1] - memory[0]) / 1024:+.1f}KiB from the end of round 1, "
+              f"{memory[1] / 1024:.0f}KiB traced")
+
+
+def bench_control(args):
+    """
+    Round trip of an input switch through the broker, from command to state, against the local control API.
+    """
+    import paho.mqtt.client as mqtt
+    from broker import Broker
+    from control import ControlServer, call
+    from start import Service
+
+    broker = Broker().start()
+    config = simulator_config(args, os.devnull)
+    config["mqtt"]["port"] = broker.port
+    config["ddc"]["capabilities"] = False
+    service = Service(config)
+    control = ControlServer(service, port=0)
+    url = f"http://127.0.0.1:{control.server.server_address[1]}/displays/0/input"
+    thread = threading.Thread(target=service.start, name="bridge", daemon=True)
+    thread.start()
+
+    entity = service.entities[0]["input"]
+    states = {}
+    changed = threading.Condition()
+
+    def on_message(client, userdata, msg):
+        with changed:
+            states[msg.topic] = msg.payload.decode()
+            changed.notify_all()
+
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(broker.host, broker.port)
+    client.subscribe(entity["topic"])
+    client.loop_start()
+    while not service.mqtt.connected or entity["state"] is None:
+        time.sleep(0.05)
+
+    options = ("HDMI", "DisplayPort")
+    commands = max(2, args.count // 50)
+    latencies = {"mqtt": [], "local": []}
+    for index in range(commands):
+        option = options[index % 2]
+        # Spaced out like hotkey presses, a burst would be throttled on the MQTT path
+        time.sleep(service.throttle.interval)
+        # Alternate the paths so both see the same monitor state
+        start = time.perf_counter()
+        if index % 4 < 2:
+            client.publish(entity["command"], option)
+            with changed:
+                changed.wait_for(lambda: states.get(entity["topic"]) == option, timeout=5)
+            latencies["mqtt"].append(time.perf_counter() - start)
+        else:
+            status, result = call(url, "POST", {"value": option})
+            if status == 200 and result["confirmed"]:
+                latencies["local"].append(time.perf_counter() - start)
+
+    client.loop_stop()
+    client.disconnect()
+    service.scheduler.stop()
+    thread.join()
+    control.shutdown()
+    broker.stop()
+    for name, samples in latencies.items():
+        report(name, samples)
+
+
+SCENARIOS = {
+    "loop": bench_loop,
+    "workers": bench_workers,
+    "router": bench_router,
+    "startup": bench_startup,
+    "commands": bench_commands,
+    "slider": bench_slider,
+    "presets": bench_presets,
+    "reload": bench_reload,
+    "states": bench_states,
+    "standby": bench_standby,
+    "replay": bench_replay,
+    "control": bench_control,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", nargs="*", help=f"one of: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per timed phase")
+    parser.add_argument("--count", type=int, default=1000, help="number of operations")
+    parser.add_argument("--monitors", type=int, default=4, help="number of simulated monitors")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated DDC call latency in seconds")
+    parser.add_argument("--capabilities-latency", type=float, default=1.0,
+                        help="simulated capabilities request latency in seconds")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds of the generated replay trace")
+    parser.add_argument("--trace", help="JSON lines trace to replay, e.g. recorded with broker.py --record")
+    parser.add_argument("--save-trace", help="write the replayed trace to this file")
+    parser.add_argument("--memory", action="store_true", help="trace memory growth during the replay")
+    args = parser.parse_args()
+    unknown = set(args.scenario) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    for name in args.scenario or SCENARIOS:
+        print(f"{name}:")
+        SCENARIOS[name](args)
+
+
+if __name__ == "__main__":
+    main()
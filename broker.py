@@ -0,0 +1,316 @@
+"""
+Minimal in-process MQTT broker for benchmarks and local testing.
+
+Run it on its own to record the commands a Home Assistant instance sends
+into a trace that bench.py replay can play back:
+
+    python broker.py --port 1883 --record trace.jsonl
+"""
+import argparse
+import json
+import logging
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value):
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return struct.pack("!H", len(value)) + value
+
+
+def packet(kind, flags, body):
+    return bytes([(kind << 4) | flags]) + encode_length(len(body)) + body
+
+
+def topic_matches(pattern, topic):
+    """
+    Returns True if an MQTT topic filter with + and # wildcards matches a topic.
+    """
+    pattern = pattern.split("/")
+    topic = topic.split("/")
+    for index, level in enumerate(pattern):
+        if level == "#":
+            return True
+        if index >= len(topic) or (level != "+" and level != topic[index]):
+            return False
+    return len(pattern) == len(topic)
+
+
+class Session(socketserver.BaseRequestHandler):
+    """
+    One client connection, reads packets on its own thread.
+    """
+    def setup(self):
+        self.broker = self.server.broker
+        self.subscriptions = set()
+        self.will = None
+        self.lock = threading.Lock()
+        self.client_id = None
+
+    def send(self, data):
+        with self.lock:
+            try:
+                self.request.sendall(data)
+            except OSError:
+                pass
+
+    def read_exact(self, length):
+        data = bytearray()
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("closed")
+            data += chunk
+        return bytes(data)
+
+    def read_packet(self):
+        header = self.read_exact(1)[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self.read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header >> 4, header & 0x0F, self.read_exact(length) if length else b""
+
+    def handle(self):
+        clean = False
+        try:
+            while True:
+                kind, flags, body = self.read_packet()
+                if kind == CONNECT:
+                    self.on_connect(body)
+                elif kind == PUBLISH:
+                    self.on_publish(flags, body)
+                elif kind == SUBSCRIBE:
+                    self.on_subscribe(body)
+                elif kind == UNSUBSCRIBE:
+                    self.on_unsubscribe(body)
+                elif kind == PINGREQ:
+                    self.send(packet(PINGRESP, 0, b""))
+                elif kind == DISCONNECT:
+                    clean = True
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.broker.detach(self)
+            if not clean and self.will is not None:
+                self.broker.publish(*self.will)
+
+    def on_connect(self, body):
+        offset = 2 + struct.unpack("!H", body[:2])[0]
+        offset += 1  # protocol level
+        flags = body[offset]
+        offset += 3  # flags and keepalive
+
+        def read_string():
+            nonlocal offset
+            length = struct.unpack("!H", body[offset:offset + 2])[0]
+            value = body[offset + 2:offset + 2 + length]
+            offset += 2 + length
+            return value
+
+        self.client_id = read_string().decode("utf-8")
+        if flags & 0x04:
+            topic = read_string().decode("utf-8")
+            payload = read_string()
+            self.will = (topic, payload, bool(flags & 0x20))
+        self.broker.attach(self)
+        self.send(packet(CONNACK, 0, b"\x00\x00"))
+
+    def on_publish(self, flags, body):
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        length = struct.unpack("!H", body[:2])[0]
+        topic = body[2:2 + length].decode("utf-8")
+        offset = 2 + length
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            self.send(packet(PUBACK, 0, packet_id))
+        self.broker.publish(topic, body[offset:], retain)
+
+    def on_subscribe(self, body):
+        packet_id = body[:2]
+        offset = 2
+        filters = []
+        while offset < len(body):
+            length = struct.unpack("!H", body[offset:offset + 2])[0]
+            filters.append(body[offset + 2:offset + 2 + length].decode("utf-8"))
+            offset += 3 + length
+        self.subscriptions.update(filters)
+        self.send(packet(SUBACK, 0, packet_id + bytes(len(filters))))
+        for topic, payload in self.broker.retained_for(filters):
+            self.deliver(topic, payload, True)
+
+    def on_unsubscribe(self, body):
+        offset = 2
+        while offset < len(body):
+            length = struct.unpack("!H", body[offset:offset + 2])[0]
+            self.subscriptions.discard(body[offset + 2:offset + 2 + length].decode("utf-8"))
+            offset += 2 + length
+        self.send(packet(UNSUBACK, 0, body[:2]))
+
+    def deliver(self, topic, payload, retain=False):
+        self.send(packet(PUBLISH, 1 if retain else 0, encode_string(topic) + payload))
+
+
+class Broker:
+    """
+    Minimal in-process MQTT 3.1.1 broker.
+
+    Supports QoS 0 delivery (QoS 1 publishes are acknowledged and delivered
+    at QoS 0), retained messages, wildcard subscriptions and last wills.
+    Every publish it routes is counted per topic.
+    """
+    def __init__(self, host="127.0.0.1", port=0):
+        self.sessions = set()
+        self.retained = {}
+        self.published = 0
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.listeners = []
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Session, bind_and_activate=False)
+        self.server.allow_reuse_address = True
+        self.server.daemon_threads = True
+        self.server.broker = self
+        self.server.server_bind()
+        self.server.server_activate()
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="broker", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.drop_clients()
+
+    def drop_clients(self):
+        """
+        Closes every client connection without a DISCONNECT, like a broker restart.
+        """
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            try:
+                session.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def attach(self, session):
+        with self.lock:
+            self.sessions.add(session)
+
+    def detach(self, session):
+        with self.lock:
+            self.sessions.discard(session)
+
+    def retained_for(self, filters):
+        with self.lock:
+            return [(topic, payload) for topic, payload in self.retained.items()
+                    if any(topic_matches(pattern, topic) for pattern in filters)]
+
+    def publish(self, topic, payload, retain=False):
+        with self.lock:
+            self.published += 1
+            self.counts[topic] = self.counts.get(topic, 0) + 1
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            sessions = [session for session in self.sessions
+                        if any(topic_matches(pattern, topic) for pattern in session.subscriptions)]
+            listeners = list(self.listeners)
+        for session in sessions:
+            session.deliver(topic, payload)
+        for listener in listeners:
+            listener(topic, payload)
+
+
+class TraceRecorder:
+    """
+    Writes the publishes on command topics and the Home Assistant birth topic to a JSON lines trace.
+
+    Each line holds the seconds since the first recorded message, the
+    topic and the payload, the format bench.py replay reads.
+    """
+    def __init__(self, file, birth_topic="homeassistant/status"):
+        self.file = file
+        self.birth_topic = birth_topic
+        self.started = None
+        self.lock = threading.Lock()
+
+    def __call__(self, topic, payload):
+        if not topic.endswith("/command") and topic != self.birth_topic:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if self.started is None:
+                self.started = now
+            self.file.write(json.dumps({"t": round(now - self.started, 3), "topic": topic,
+                                        "payload": payload.decode("utf-8", errors="replace")}) + "\n")
+            self.file.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal MQTT broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--record", help="write the commands received to this JSON lines trace")
+    args = parser.parse_args()
+
+    broker = Broker(args.host, args.port)
+    trace = None
+    if args.record:
+        trace = open(args.record, "w")
+        broker.listeners.append(TraceRecorder(trace))
+    print(f"Listening on {broker.host}:{broker.port}")
+    try:
+        broker.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.server.server_close()
+        if trace is not None:
+            trace.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+# MCCS names of the VCP codes the bridge knows about
+VCP_NAMES = {
+    0x10: "Brightness",
+    0x12: "Contrast",
+    0x14: "Color Preset",
+    0x16: "Red Gain",
+    0x18: "Green Gain",
+    0x1A: "Blue Gain",
+    0x60: "Input Source",
+    0x62: "Volume",
+    0x8D: "Audio Mute",
+    0xD6: "Power Mode",
+    0xDC: "Display Mode",
+}
+
+# MCCS names of the values of non-continuous VCP codes
+VALUE_NAMES = {
+    0x14: {
+        0x01: "sRGB", 0x02: "Native", 0x03: "4000 K", 0x04: "5000 K", 0x05: "6500 K", 0x06: "7500 K",
+        0x07: "8200 K", 0x08: "9300 K", 0x09: "10000 K", 0x0A: "11500 K", 0x0B: "User 1",
+        0x0C: "User 2", 0x0D: "User 3",
+    },
+    0x60: {
+        0x01: "VGA 1", 0x02: "VGA 2", 0x03: "DVI 1", 0x04: "DVI 2", 0x05: "Composite 1",
+        0x06: "Composite 2", 0x07: "S-Video 1", 0x08: "S-Video 2", 0x09: "Tuner 1", 0x0A: "Tuner 2",
+        0x0B: "Tuner 3", 0x0C: "Component 1", 0x0D: "Component 2", 0x0E: "Component 3",
+        0x0F: "DisplayPort 1", 0x10: "DisplayPort 2", 0x11: "HDMI 1", 0x12: "HDMI 2",
+    },
+    0x8D: {
+        0x01: "Muted", 0x02: "Unmuted",
+    },
+    0xD6: {
+        0x01: "On", 0x02: "Standby", 0x03: "Suspend", 0x04: "Off", 0x05: "Off (power button)",
+    },
+    0xDC: {
+        0x00: "Standard", 0x01: "Productivity", 0x02: "Mixed", 0x03: "Movie", 0x04: "User Defined",
+        0x05: "Games", 0x06: "Sports", 0x07: "Professional", 0x08: "Standard (intermediate)",
+        0x09: "Low Power", 0x0A: "Demonstration", 0xF0: "Dynamic Contrast",
+    },
+}
+
+
+def value_name(code, value):
+    """
+    Returns the MCCS name of a VCP value, or its hex value if unknown.
+    """
+    return VALUE_NAMES.get(code, {}).get(value, f"{value:#04x}")
+
+
+class Capabilities:
+    """
+    A parsed MCCS capabilities string.
+
+    Attributes:
+        text: The raw capabilities string
+        model: Model name reported by the monitor, or None
+        type: Display technology, e.g. "LCD", or None
+        mccs_version: MCCS version, e.g. "2.2", or None
+        commands: Tuple of supported DDC/CI command codes
+        vcp: Dict of supported VCP code to the tuple of its allowed values,
+             empty for continuous codes and codes that list no values
+    """
+    def __init__(self, text, model=None, type=None, mccs_version=None, commands=(), vcp=None):
+        self.text = text
+        self.model = model
+        self.type = type
+        self.mccs_version = mccs_version
+        self.commands = tuple(commands)
+        self.vcp = vcp or {}
+
+    def supports(self, code):
+        return code in self.vcp
+
+    def values(self, code):
+        """
+        Returns:
+            tuple: The allowed values of a VCP code, empty if none are listed
+        """
+        return self.vcp.get(code, ())
+
+    def __repr__(self):
+        return f"Capabilities(model={self.model!r}, vcp={sorted(self.vcp)!r})"
+
+
+def split_groups(text):
+    """
+    Splits "a(1 2)b(c(3))" into [("a", "1 2"), ("b", "c(3)")].
+
+    Raises:
+        ValueError: If the parentheses are unbalanced
+    """
+    groups = []
+    name_start = 0
+    depth = 0
+    for index, char in enumerate(text):
+        if char == "(":
+            if depth == 0:
+                name = text[name_start:index].strip()
+                content_start = index + 1
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                raise ValueError(f"Unbalanced ')' at {index}")
+            if depth == 0:
+                groups.append((name, text[content_start:index]))
+                name_start = index + 1
+    if depth:
+        raise ValueError("Unbalanced '('")
+    return groups
+
+
+def parse_hex_list(text):
+    """
+    Parses space separated hex bytes, which some monitors write without spaces.
+    """
+    values = []
+    for token in text.split():
+        for index in range(0, len(token) - 1, 2):
+            values.append(int(token[index:index + 2], 16))
+    return values
+
+
+def closing(text, index):
+    """
+    Returns the index of the parenthesis closing the one at text[index].
+    """
+    depth = 0
+    for end in range(index, len(text)):
+        if text[end] == "(":
+            depth += 1
+        elif text[end] == ")":
+            depth -= 1
+            if depth == 0:
+                return end
+    raise ValueError(f"Unbalanced '(' at {index}")
+
+
+def outside_groups(text):
+    """
+    Yields the parts of text that are not inside parentheses.
+    """
+    depth = 0
+    start = 0
+    for index, char in enumerate(text):
+        if char == "(":
+            if depth == 0:
+                yield text[start:index]
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                start = index + 1
+    if depth == 0:
+        yield text[start:]
+
+
+def parse_vcp(text):
+    """
+    Parses the content of the vcp() group into a dict of code to allowed values.
+    """
+    vcp = {}
+    code = None
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char.isspace():
+            index += 1
+        elif char == "(":
+            # Values of the previous code, nested groups are ignored
+            end = closing(text, index)
+            if code is not None:
+                vcp[code] = tuple(parse_hex_list(" ".join(outside_groups(text[index + 1:end]))))
+            index = end + 1
+        else:
+            code = int(text[index:index + 2], 16)
+            vcp[code] = ()
+            index += 2
+    return vcp
+
+
+def parse_capabilities(text):
+    """
+    Parses an MCCS capabilities string, e.g. "(prot(monitor)type(LCD)model(X)cmds(01 02)vcp(10 60(0F 11)))".
+
+    Args:
+        text: The capabilities string returned by the monitor
+
+    Returns:
+        Capabilities: The parsed capabilities
+
+    Raises:
+        ValueError: If the string is malformed
+    """
+    body = text.strip().rstrip("\x00").strip()
+    if body.startswith("(") and body.endswith(")"):
+        body = body[1:-1]
+
+    entries = {}
+    for name, content in split_groups(body):
+        entries.setdefault(name.lower(), content)
+
+    try:
+        commands = parse_hex_list(entries.get("cmds", ""))
+        vcp = parse_vcp(entries.get("vcp", ""))
+    except ValueError as e:
+        raise ValueError(f"Invalid capabilities string: {e}") from e
+
+    return Capabilities(text, entries.get("model"), entries.get("type"), entries.get("mccs_ver"), commands, vcp)
+
+
+class CapabilitiesCache:
+    """
+    Capabilities strings of known monitors, persisted to a JSON file.
+
+    Reading capabilities takes a second or more per monitor, so they are
+    only requested from monitors missing from the cache. The file is
+    replaced atomically on every change.
+
+    Args:
+        path: JSON file holding monitor identity -> capabilities string
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring capabilities cache %s: %s", self.path, e)
+            return {}
+        if not isinstance(entries, dict):
+            log.warning("Ignoring capabilities cache %s: not a mapping", self.path)
+            return {}
+        return entries
+
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key, text):
+        """
+        Stores the capabilities string of a monitor and saves the cache.
+        """
+        # Workers of several monitors may store at once, the last write must include every entry
+        with self.lock:
+            self.entries[key] = text
+            try:
+                write_atomic(self.path, json.dumps(self.entries, indent=2, sort_keys=True))
+            except OSError as e:
+                log.warning("Could not save capabilities cache %s: %s", self.path, e)
+
+
+def write_atomic(path, data):
+    """
+    Writes a file through a temporary file in the same directory, so readers
+    never see a partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,140 @@
+import logging
+import time
+
+from metrics import COMMAND_ATTEMPTS, COMMAND_SECONDS, record_ddc
+
+log = logging.getLogger(__name__)
+
+
+class WriteResult:
+    """
+    Outcome of a verified write.
+
+    Attributes:
+        confirmed: True if a read-back matched the written value
+        value: Last value read back, or None if no read succeeded
+        maximum: Maximum reported by the last successful read, or None
+        attempts: Number of writes sent
+        seconds: Time from the first write to the outcome
+    """
+    def __init__(self, confirmed, value, maximum, attempts, seconds):
+        self.confirmed = confirmed
+        self.value = value
+        self.maximum = maximum
+        self.attempts = attempts
+        self.seconds = seconds
+
+    @property
+    def outcome(self):
+        if self.confirmed:
+            return "confirmed"
+        return "mismatch" if self.value is not None else "failed"
+
+    def __repr__(self):
+        return f"WriteResult({self.outcome}, value={self.value}, attempts={self.attempts})"
+
+
+def matches(written, read):
+    """
+    Returns True if a read-back value confirms a write.
+
+    Some monitors report garbage in the high byte of non-continuous codes
+    such as the input source, so a match on the low byte is accepted too.
+    """
+    return read == written or (written <= 0xFF and read & 0xFF == written)
+
+
+class CommandWriter:
+    """
+    Writes VCP values and reads them back until the monitor confirms them.
+
+    Monitors often acknowledge a write and then ignore it, or take a while
+    before a read reflects it. Each write is followed by a read after
+    settle seconds, and a mismatching or failed read-back is retried up to
+    retries more times, waiting backoff seconds doubled on every attempt.
+    The whole exchange runs as one job on the display's worker, so it
+    holds the monitor's cached handle and never delays other monitors.
+
+    Args:
+        backend: DDCBackend used for the writes and reads
+        monitors: MonitorRegistry providing the cached handles
+        workers: WorkerPool running the jobs
+        settle: Seconds between a write and its read-back
+        retries: Extra attempts after the first write
+        backoff: Seconds before the first retry, doubled on every retry
+    """
+    def __init__(self, backend, monitors, workers, settle=0.1, retries=2, backoff=0.2):
+        self.backend = backend
+        self.monitors = monitors
+        self.workers = workers
+        self.settle = settle
+        self.retries = retries
+        self.backoff = backoff
+
+    def write(self, display_id, code, value):
+        """
+        Writes a VCP value and waits for the monitor to confirm it. Runs on the worker thread.
+
+        Returns:
+            WriteResult: The outcome, or None if the monitor is missing
+        """
+        monitor_handle = self.monitors.handle(display_id)
+        if monitor_handle is None:
+            return None
+
+        started = time.perf_counter()
+        current = maximum = None
+        attempts = 0
+        confirmed = False
+        while not confirmed and attempts <= self.retries:
+            if attempts:
+                time.sleep(self.backoff * 2 ** (attempts - 1))
+            attempts += 1
+
+            call_started = time.perf_counter()
+            written = self.backend.set_vcp(monitor_handle, code, value)
+            record_ddc(self.backend, display_id, "set", code, time.perf_counter() - call_started, written)
+            if not written:
+                continue
+
+            if self.settle:
+                time.sleep(self.settle)
+            call_started = time.perf_counter()
+            read, read_maximum = self.backend.get_vcp(monitor_handle, code)
+            record_ddc(self.backend, display_id, "get", code, time.perf_counter() - call_started,
+                       read is not None)
+            if read is not None:
+                current, maximum = read, read_maximum
+                confirmed = matches(value, read)
+
+            if not confirmed:
+                log.debug("Display %s: write of %#04x=%s not confirmed (read %s), attempt %d",
+                          display_id, code, value, read, attempts)
+
+        result = WriteResult(confirmed, current, maximum, attempts, time.perf_counter() - started)
+        COMMAND_SECONDS.observe(result.seconds, code=f"{code:#04x}", outcome=result.outcome)
+        COMMAND_ATTEMPTS.inc(attempts, code=f"{code:#04x}")
+        if result.outcome == "failed":
+            # Nothing answered, the handle may be stale
+            self.monitors.invalidate(display_id)
+        return result
+
+    def submit(self, display_id, code, value, callback):
+        """
+        Queues a verified write on the display's worker.
+
+        A write to the same code still waiting in the queue is replaced,
+        so only the last value of a burst is sent. The callbacks of the
+        replaced writes get the result of the last value.
+
+        Args:
+            display_id: Display to write to
+            code: VCP code
+            value: Value to write
+            callback: Called on the scheduler with the WriteResult, or None if the monitor is missing
+
+        Returns:
+            bool: False if the display's queue is full
+        """
+        return self.workers.submit(display_id, lambda: self.write(display_id, code, value), callback,
+                                   key=("set", code))
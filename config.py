@@ -0,0 +1,183 @@
+import os
+from numbers import Number
+
+import yaml
+
+from features import NUMBER_FEATURES, SELECT_FEATURES
+
+CONFIG_PATHS = ("config.yml", "rename_to_config.yml")
+
+# Sections that are only read at startup
+RESTART_SECTIONS = ("mqtt", "ddc", "metrics", "logging", "queue_size", "reload", "snapshot", "json_state", "control")
+
+
+def config_path():
+    """
+    Returns the first existing config file, config.yml unless only the example is present.
+    """
+    for path in CONFIG_PATHS:
+        if os.path.exists(path):
+            return path
+    return CONFIG_PATHS[0]
+
+
+def load_config(path=None):
+    with open(path or config_path(), "r") as config:
+        return yaml.safe_load(config)
+
+
+def check_mapping(value, where):
+    if not isinstance(value, dict):
+        raise ValueError(f"{where} must be a mapping")
+
+
+def check_interval(value, where):
+    if isinstance(value, bool) or not isinstance(value, Number) or value <= 0:
+        raise ValueError(f"{where} must be a positive number of seconds, got {value!r}")
+
+
+def check_code(value, where):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= 0xFF:
+        raise ValueError(f"{where}: {value!r} is not a VCP code")
+
+
+def check_delay(value, where):
+    if isinstance(value, bool) or not isinstance(value, Number) or value < 0:
+        raise ValueError(f"{where} must be a number of seconds, got {value!r}")
+
+
+def check_count(value, where, minimum=0):
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f"{where} must be a whole number of at least {minimum}, got {value!r}")
+
+
+def check_positive_count(value, where):
+    check_count(value, where, 1)
+
+
+# Options of the reloadable sections passed on to the service's components
+SECTION_OPTIONS = {
+    "polling": {"boost_interval": check_interval, "boost_count": check_count, "max_backoff": check_interval,
+                "window": check_delay},
+    "commands": {"settle": check_delay, "retries": check_count, "backoff": check_delay, "throttle": check_delay},
+    "health": {"threshold": check_positive_count, "probe_interval": check_interval},
+}
+
+
+def validate_config(config):
+    """
+    Checks the structure of a config loaded from config.yml.
+
+    Only the sections that can be reloaded are checked in depth, a broken
+    reload must not replace a working config.
+
+    Raises:
+        ValueError: Describing the first problem found
+    """
+    check_mapping(config, "The config")
+    check_mapping(config.get("mqtt"), "mqtt")
+    for key in ("username", "password", "host", "port"):
+        if key not in config["mqtt"]:
+            raise ValueError(f"mqtt.{key} is missing")
+    if "interval" in config:
+        check_interval(config["interval"], "interval")
+    for section, options in SECTION_OPTIONS.items():
+        values = config.get(section) or {}
+        check_mapping(values, section)
+        for key, value in values.items():
+            if key not in options:
+                raise ValueError(f"{section}.{key} is not an option")
+            options[key](value, f"{section}.{key}")
+
+    displays = config.get("display")
+    if not isinstance(displays, list) or not displays:
+        raise ValueError("display must be a list with at least one display")
+    ids = set()
+    for index, display in enumerate(displays):
+        check_mapping(display, f"display[{index}]")
+        if "id" not in display:
+            raise ValueError(f"display[{index}] has no id")
+        if display["id"] in ids:
+            raise ValueError(f"display id {display['id']!r} is used twice")
+        ids.add(display["id"])
+        if "interval" in display:
+            check_interval(display["interval"], f"display {display['id']} interval")
+        for section in SELECT_FEATURES:
+            if display.get(section):
+                check_mapping(display[section], f"display {display['id']} {section}")
+                for option, value in display[section].items():
+                    if isinstance(value, bool) or not isinstance(value, int):
+                        raise ValueError(f"display {display['id']} {section}: {option} must be a VCP value")
+        for number in display.get("numbers") or []:
+            if number not in NUMBER_FEATURES:
+                raise ValueError(f"display {display['id']}: unknown number {number!r}")
+        # Either a list of codes or a mapping of code to interval
+        poll = display.get("poll") or []
+        if not isinstance(poll, (list, dict)):
+            raise ValueError(f"display {display['id']} poll must be a list or mapping of VCP codes")
+        for code in poll:
+            check_code(code, f"display {display['id']} poll")
+            if isinstance(poll, dict):
+                check_interval(poll[code], f"display {display['id']} poll interval of {code:#04x}")
+
+    groups = config.get("groups") or {}
+    check_mapping(groups, "groups")
+    for name, group in groups.items():
+        check_mapping(group, f"group {name}")
+        if not isinstance(group.get("displays"), list):
+            raise ValueError(f"group {name} needs a list of displays")
+        for number in group.get("numbers") or []:
+            if number not in NUMBER_FEATURES:
+                raise ValueError(f"group {name}: unknown number {number!r}")
+    presets = config.get("presets") or {}
+    check_mapping(presets, "presets")
+    for name, preset in presets.items():
+        check_mapping(preset, f"preset {name}")
+        for display_id, values in preset.items():
+            check_mapping(values, f"preset {name} display {display_id}")
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (str, Number)):
+                    raise ValueError(f"preset {name} display {display_id}: {key} must be an option or a number")
+
+
+class ConfigWatcher:
+    """
+    Calls callback(path) when the config file changed, checking every interval seconds.
+
+    A change is only reported once the file's size and modification time
+    are the same on two checks in a row, so an editor still writing the
+    file does not trigger a reload of half a config.
+
+    Runs on the Scheduler thread.
+    """
+    def __init__(self, path, scheduler, callback, interval=2):
+        self.path = path
+        self.scheduler = scheduler
+        self.callback = callback
+        self.interval = interval
+        self.loaded = self.signature()
+        self.seen = self.loaded
+        self.call = scheduler.call_later(interval, self.check)
+
+    def signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        signature = self.signature()
+        try:
+            if signature is not None and signature == self.seen and signature != self.loaded:
+                self.loaded = signature
+                self.callback(self.path)
+        finally:
+            # A reload that fails in an unexpected way must not stop watching for the fix
+            self.seen = signature
+            self.call = self.scheduler.call_later(self.interval, self.check)
+
+    def stop(self):
+        if self.call is not None:
+            self.call.cancel()
+            self.call = None
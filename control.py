@@ -0,0 +1,296 @@
+"""
+Local control API of the bridge, and a command line client for it.
+
+Usage:
+    python control.py displays
+    python control.py set 0 input HDMI
+    python control.py set 0 brightness 40
+    python control.py get 0 0x10
+    python control.py vcp 0 0xD6 1
+    python control.py preset work
+"""
+import argparse
+import json
+import logging
+import sys
+import threading
+import urllib.error
+import urllib.request
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from commands import matches
+
+log = logging.getLogger(__name__)
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.check_host():
+            self.respond(*self.server.control.request("GET", self.path, None))
+
+    def do_POST(self):
+        if not self.check_host():
+            return
+        # Browsers only send JSON to another origin after a preflight, which is never answered
+        if self.headers.get_content_type() != "application/json":
+            self.respond(415, {"error": "expected application/json"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError as e:
+            self.respond(400, {"error": f"invalid JSON: {e}"})
+            return
+        if not isinstance(body, dict):
+            self.respond(400, {"error": "expected a JSON object"})
+            return
+        self.respond(*self.server.control.request("POST", self.path, body))
+
+    def check_host(self):
+        """
+        Rejects requests addressed to another host name.
+
+        A web page that rebinds its own name to 127.0.0.1 is same-origin with
+        the API and could send it any request, but its Host header still
+        carries that name.
+        """
+        if (self.headers.get("Host") or "").lower() not in self.server.control.hosts:
+            self.respond(403, {"error": "unexpected Host header"})
+            return False
+        return True
+
+    def respond(self, status, result):
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+class ControlServer:
+    """
+    Local HTTP API running commands through the same pipeline as MQTT, without the broker round trip.
+
+    Requests are handed to the scheduler like MQTT messages and answered
+    once the monitor confirmed the write, while the new state is published
+    to MQTT as usual. Requests must name the loopback address or host in
+    their Host header, so a web page cannot reach the API by rebinding its
+    own name to 127.0.0.1.
+
+        GET  /displays                      Health and entity states of every display
+        POST /displays/<id>/<key>           {"value": "HDMI"}, any select or number feature
+        GET  /displays/<id>/vcp/<code>      Reads a VCP code, e.g. 0x10
+        POST /displays/<id>/vcp/<code>      {"value": 1}, writes a VCP code
+        POST /presets/<name>                Applies a preset
+
+    Args:
+        service: Service whose displays and presets are controlled
+        host: Address to listen on, keep it on loopback
+        port: Port to listen on
+        timeout: Seconds to wait for a result before answering 504
+    """
+    def __init__(self, service, host="127.0.0.1", port=9878, timeout=10):
+        self.service = service
+        self.timeout = timeout
+        self.server = ThreadingHTTPServer((host, port), ControlHandler)
+        self.server.daemon_threads = True
+        self.server.control = self
+        port = self.server.server_address[1]
+        self.hosts = {f"{name}:{port}" for name in ("127.0.0.1", "localhost", "[::1]", host.lower())}
+        threading.Thread(target=self.server.serve_forever, name="control", daemon=True).start()
+        log.info("Serving the control API on http://%s:%s", host, self.server.server_address[1])
+
+    def request(self, method, path, body):
+        """
+        Runs a request on the scheduler and waits for its result. Runs on an HTTP thread.
+
+        Returns:
+            tuple: HTTP status and JSON result
+        """
+        done = threading.Event()
+        reply = []
+
+        def respond(status, result):
+            reply.append((status, result))
+            done.set()
+
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        self.service.scheduler.call_soon(self.handle, method, parts, body, respond)
+        if not done.wait(self.timeout):
+            return 504, {"error": f"no result within {self.timeout}s"}
+        return reply[0]
+
+    def handle(self, method, parts, body, respond):
+        """
+        Dispatches a request, answering 500 rather than letting the client wait out the timeout on an error.
+        """
+        try:
+            self.dispatch(method, parts, body, respond)
+        except Exception as e:
+            log.exception("Error handling %s /%s", method, "/".join(parts))
+            respond(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def dispatch(self, method, parts, body, respond):
+        """
+        Routes a request to the service. Runs on the scheduler.
+        """
+        service = self.service
+        if parts == ["displays"] and method == "GET":
+            respond(200, self.states())
+        elif len(parts) == 2 and parts[0] == "presets" and method == "POST":
+            if parts[1] not in service.presets:
+                respond(404, {"error": f"unknown preset {parts[1]}"})
+                return
+            service.apply_preset(parts[1], callback=partial(self.on_preset, respond))
+        elif len(parts) in (3, 4) and parts[0] == "displays":
+            display_id = next((display_id for display_id in service.displays if str(display_id) == parts[1]), None)
+            if display_id is None:
+                respond(404, {"error": f"unknown display {parts[1]}"})
+            elif len(parts) == 4 and parts[2] == "vcp":
+                self.vcp(method, display_id, parts[3], body, respond)
+            elif len(parts) == 3 and method == "POST":
+                self.command(display_id, parts[2], body, respond)
+            else:
+                respond(404, {"error": "not found"})
+        else:
+            respond(404, {"error": "not found"})
+
+    def states(self):
+        return {
+            str(display_id): {
+                "health": self.service.health[display_id].state,
+                "states": {key: entity["state"] for key, entity in self.service.entities.get(display_id, {}).items()},
+            }
+            for display_id in self.service.displays
+        }
+
+    def command(self, display_id, key, body, respond):
+        service = self.service
+        feature = service.displays[display_id].features.get(key)
+        if feature is None:
+            respond(404, {"error": f"display {display_id} has no feature {key}"})
+            return
+        payload = str(body.get("value"))
+        _, maximum = service.vcp_state[display_id].get(feature.code, (None, None))
+        value = feature.value_for(payload, maximum)
+        if value is None:
+            respond(400, {"error": f"invalid {feature.name}: {payload}"})
+            return
+
+        callback = partial(self.on_written, respond, display_id, feature, value)
+        if key == "input":
+            service.activate_input(display_id, payload, callback)
+        elif key == "gamer_mode":
+            service.set_gamer_mode(display_id, payload, callback)
+        else:
+            service.command(display_id, key, payload, callback)
+
+    def vcp(self, method, display_id, code, body, respond):
+        try:
+            code = int(code, 0)
+        except ValueError:
+            code = None
+        if code is None or not 0 <= code <= 0xFF:
+            respond(400, {"error": "invalid VCP code"})
+            return
+        if method == "GET":
+            self.service.read_vcp(display_id, code, partial(self.on_read, respond, display_id))
+            return
+
+        value = body.get("value")
+        if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= 0xFFFF:
+            respond(400, {"error": f"invalid VCP value {value!r}"})
+            return
+        feature = self.service.displays[display_id].by_code.get(code)
+        self.service.write_vcp(display_id, code, value, partial(self.on_written, respond, display_id, feature, value))
+
+    def on_read(self, respond, display_id, result):
+        if result is None or result[0] is None:
+            respond(503, {"error": f"display {display_id} did not answer"})
+        else:
+            respond(200, {"value": result[0], "maximum": result[1]})
+
+    def on_written(self, respond, display_id, feature, value, result):
+        if result is None:
+            respond(503, {"error": f"display {display_id} is {self.service.health[display_id].state} or busy"})
+            return
+        # A write replaced by a later value while queued gets the result of that value, which confirms
+        # the later value rather than this one
+        confirmed = result.confirmed and matches(value, result.value)
+        reply = {"confirmed": confirmed, "value": result.value, "attempts": result.attempts,
+                 "seconds": round(result.seconds, 3)}
+        if feature is not None and result.value is not None:
+            reply["state"] = feature.state_for(result.value, result.maximum)
+        respond(200, reply)
+
+    def on_preset(self, respond, results):
+        confirmed = sum(result is not None and result.confirmed for result in results)
+        respond(200, {"confirmed": confirmed == len(results), "writes": len(results), "confirmed_writes": confirmed})
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def call(url, method="GET", body=None, timeout=15):
+    """
+    Sends a request to the control API.
+
+    Returns:
+        tuple: HTTP status and JSON result
+    """
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data, {"Content-Type": "application/json"}, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:9878", help="control API of the bridge")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("displays", help="show the health and states of every display")
+    command = commands.add_parser("set", help="set a feature, e.g. input HDMI or brightness 40")
+    command.add_argument("display")
+    command.add_argument("key")
+    command.add_argument("value")
+    command = commands.add_parser("get", help="read a VCP code")
+    command.add_argument("display")
+    command.add_argument("code")
+    command = commands.add_parser("vcp", help="write a VCP code")
+    command.add_argument("display")
+    command.add_argument("code")
+    command.add_argument("value", type=lambda value: int(value, 0))
+    command = commands.add_parser("preset", help="apply a preset")
+    command.add_argument("name")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    try:
+        if args.command == "displays":
+            status, result = call(f"{url}/displays")
+        elif args.command == "set":
+            status, result = call(f"{url}/displays/{args.display}/{args.key}", "POST", {"value": args.value})
+        elif args.command == "get":
+            status, result = call(f"{url}/displays/{args.display}/vcp/{args.code}")
+        elif args.command == "vcp":
+            status, result = call(f"{url}/displays/{args.display}/vcp/{args.code}", "POST", {"value": args.value})
+        else:
+            status, result = call(f"{url}/presets/{args.name}", "POST", {})
+    except (urllib.error.URLError, OSError) as e:
+        print(f"Could not reach the bridge at {url}: {getattr(e, 'reason', e)}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result, indent=2))
+    # Writes that the monitor did not confirm fail like errors
+    sys.exit(0 if status == 200 and result.get("confirmed", True) else 1)
+
+
+if __name__ == "__main__":
+    main()
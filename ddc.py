@@ -1,12 +1,41 @@
-from ctypes import windll, byref, Structure, WinError, POINTER, WINFUNCTYPE, c_int
+import logging
+import sys
+import threading
+from ctypes import byref, sizeof, Structure, POINTER, c_int, create_string_buffer
 from ctypes.wintypes import BOOL, HMONITOR, HDC, RECT, LPARAM, DWORD, BYTE, WCHAR, HANDLE
+from backend import DDCBackend
 
-_MONITORENUMPROC = WINFUNCTYPE(BOOL, HMONITOR, HDC, POINTER(RECT), LPARAM)
+log = logging.getLogger(__name__)
+
+# Error code of the last failed call, per thread since monitors are driven in parallel
+_errors = threading.local()
+
+# The dxva2 API only exists on Windows, the constants below are shared by all backends
+if sys.platform == "win32":
+    from ctypes import windll, WinError, WINFUNCTYPE
+    _MONITORENUMPROC = WINFUNCTYPE(BOOL, HMONITOR, HDC, POINTER(RECT), LPARAM)
 
 class _PHYSICAL_MONITOR(Structure):
     _fields_ = [('handle', HANDLE),
                 ('description', WCHAR * 128)]
 
+class _MONITORINFOEXW(Structure):
+    _fields_ = [('cbSize', DWORD),
+                ('rcMonitor', RECT),
+                ('rcWork', RECT),
+                ('dwFlags', DWORD),
+                ('szDevice', WCHAR * 32)]
+
+class _DISPLAY_DEVICEW(Structure):
+    _fields_ = [('cb', DWORD),
+                ('DeviceName', WCHAR * 32),
+                ('DeviceString', WCHAR * 128),
+                ('StateFlags', DWORD),
+                ('DeviceID', WCHAR * 128),
+                ('DeviceKey', WCHAR * 128)]
+
+_EDD_GET_DEVICE_INTERFACE_NAME = 0x00000001
+
 # Gamer Mode constants
 GAMER_MODE_OFF = 0
 GAMER_MODE_FPS = 11
@@ -20,12 +49,15 @@ GAMER_MODE_GAMER3 = 16
 INPUT_SOURCE_DP = 15
 INPUT_SOURCE_HDMI = 17
 
-def get_physical_monitors():
+def get_display_monitors():
     """
-    Returns a list of physical monitor handles and their descriptions.
+    Returns the logical display monitors currently attached.
+    
+    This is cheap compared to opening physical monitor handles, so it is
+    also used to detect display changes.
     
     Returns:
-        list: A list of tuples containing (handle, description) for each physical monitor
+        list: A list of HMONITOR values, one per logical display
     """
     monitors = []
     
@@ -36,25 +68,97 @@ def get_physical_monitors():
     if not windll.user32.EnumDisplayMonitors(None, None, _MONITORENUMPROC(callback), None):
         raise WinError('EnumDisplayMonitors failed')
     
+    return monitors
+
+def get_physical_monitors_from(monitor):
+    """
+    Returns the physical monitor handles of one logical display.
+    
+    Args:
+        monitor: HMONITOR of the logical display
+        
+    Returns:
+        list: A list of tuples containing (handle, description) for each physical monitor
+    """
+    # Get physical monitor count
+    count = DWORD()
+    if not windll.dxva2.GetNumberOfPhysicalMonitorsFromHMONITOR(monitor, byref(count)):
+        log.warning("Failed to get number of physical monitors for a display. Skipping.")
+        return []
+        
+    # Get physical monitor handles
+    physical_array = (_PHYSICAL_MONITOR * count.value)()
+    if not windll.dxva2.GetPhysicalMonitorsFromHMONITOR(monitor, count.value, physical_array):
+        log.warning("Failed to get physical monitors for a display. Skipping.")
+        return []
+    
+    return [(physical.handle, physical.description) for physical in physical_array]
+
+def get_physical_monitors():
+    """
+    Returns a list of physical monitor handles and their descriptions.
+    
+    Returns:
+        list: A list of tuples containing (handle, description) for each physical monitor
+    """
     result = []
-    for monitor in monitors:
-        # Get physical monitor count
-        count = DWORD()
-        if not windll.dxva2.GetNumberOfPhysicalMonitorsFromHMONITOR(monitor, byref(count)):
-            print(f"Warning: Failed to get number of physical monitors for a display. Skipping.")
-            continue
-            
-        # Get physical monitor handles
-        physical_array = (_PHYSICAL_MONITOR * count.value)()
-        if not windll.dxva2.GetPhysicalMonitorsFromHMONITOR(monitor, count.value, physical_array):
-            print(f"Warning: Failed to get physical monitors for a display. Skipping.")
-            continue
-            
-        for physical in physical_array:
-            result.append((physical.handle, physical.description))
+    for monitor in get_display_monitors():
+        result.extend(get_physical_monitors_from(monitor))
     
     return result
 
+def get_monitor_device_ids(monitor):
+    """
+    Returns the device interface names of the monitors showing a logical display.
+    
+    The names are listed in the same order as the physical monitors of the
+    display, e.g. "\\\\?\\DISPLAY#AOC2402#5&2a9e&0&UID4352#{e6f07b5f-...}".
+    
+    Args:
+        monitor: HMONITOR of the logical display
+        
+    Returns:
+        list: Device interface names, empty if unable to determine
+    """
+    info = _MONITORINFOEXW()
+    info.cbSize = sizeof(info)
+    if not windll.user32.GetMonitorInfoW(monitor, byref(info)):
+        return []
+    
+    device_ids = []
+    while True:
+        device = _DISPLAY_DEVICEW()
+        device.cb = sizeof(device)
+        if not windll.user32.EnumDisplayDevicesW(info.szDevice, len(device_ids), byref(device),
+                                                 _EDD_GET_DEVICE_INTERFACE_NAME):
+            return device_ids
+        device_ids.append(device.DeviceID)
+
+def read_edid(device_id):
+    """
+    Reads the EDID Windows stores in the registry for a monitor device.
+    
+    Args:
+        device_id: Device interface name from get_monitor_device_ids()
+        
+    Returns:
+        bytes: The EDID, or None if unable to determine
+    """
+    import winreg
+    
+    # \\?\DISPLAY#<hardware id>#<instance>#{class} -> Enum\DISPLAY\<hardware id>\<instance>
+    parts = device_id.split("#")
+    if len(parts) < 3:
+        return None
+    path = f"SYSTEM\\CurrentControlSet\\Enum\\DISPLAY\\{parts[1]}\\{parts[2]}\\Device Parameters"
+    try:
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, path) as key:
+            value, _ = winreg.QueryValueEx(key, "EDID")
+            return bytes(value)
+    except OSError as e:
+        log.debug("No EDID for %s: %s", device_id, e)
+        return None
+
 def safe_close_monitor(handle):
     """
     Safely close a physical monitor handle.
@@ -67,11 +171,11 @@ def safe_close_monitor(handle):
     """
     try:
         if not windll.dxva2.DestroyPhysicalMonitor(handle):
-            print(f"Warning: Failed to destroy monitor handle {handle}")
+            log.warning("Failed to destroy monitor handle %s", handle)
             return False
         return True
     except Exception as e:
-        print(f"Error closing monitor handle: {e}")
+        log.error("Error closing monitor handle: %s", e)
         return False
 
 def set_vcp_feature(monitor, code, value):
@@ -89,11 +193,13 @@ def set_vcp_feature(monitor, code, value):
     try:
         if not windll.dxva2.SetVCPFeature(HANDLE(monitor), BYTE(code), DWORD(value)):
             error_code = windll.kernel32.GetLastError()
-            print(f"Error setting VCP feature: {error_code}")
+            _errors.code = error_code
+            log.warning("Error setting VCP feature %#04x: %s", code, error_code)
             return False
         return True
     except Exception as e:
-        print(f"Exception setting VCP feature: {e}")
+        _errors.code = type(e).__name__
+        log.error("Exception setting VCP feature %#04x: %s", code, e)
         return False
 
 def get_vcp_feature(monitor, code):
@@ -114,13 +220,48 @@ def get_vcp_feature(monitor, code):
         if not windll.dxva2.GetVCPFeatureAndVCPFeatureReply(
             HANDLE(monitor), BYTE(code), None, byref(current_value), byref(maximum_value)):
             error_code = windll.kernel32.GetLastError()
-            print(f"Error getting VCP feature: {error_code}")
+            _errors.code = error_code
+            log.warning("Error getting VCP feature %#04x: %s", code, error_code)
             return None, None
         return current_value.value, maximum_value.value
     except Exception as e:
-        print(f"Exception getting VCP feature: {e}")
+        _errors.code = type(e).__name__
+        log.error("Exception getting VCP feature %#04x: %s", code, e)
         return None, None
 
+def get_capabilities(monitor):
+    """
+    Gets the MCCS capabilities string of the specified monitor.
+    
+    This is a slow call, monitors commonly take over a second to answer.
+    
+    Args:
+        monitor: Physical monitor handle
+        
+    Returns:
+        str: The capabilities string, or None if unable to determine
+    """
+    length = DWORD()
+    
+    try:
+        if not windll.dxva2.GetCapabilitiesStringLength(HANDLE(monitor), byref(length)):
+            error_code = windll.kernel32.GetLastError()
+            _errors.code = error_code
+            log.warning("Error getting capabilities length: %s", error_code)
+            return None
+        
+        buffer = create_string_buffer(length.value)
+        if not windll.dxva2.CapabilitiesRequestAndCapabilitiesReply(HANDLE(monitor), buffer, length):
+            error_code = windll.kernel32.GetLastError()
+            _errors.code = error_code
+            log.warning("Error getting capabilities: %s", error_code)
+            return None
+        return buffer.value.decode("ascii", errors="replace")
+    except Exception as e:
+        _errors.code = type(e).__name__
+        log.error("Exception getting capabilities: %s", e)
+        return None
+
 def get_input_source(monitor):
     """
     Gets the current input source of the monitor.
@@ -173,3 +314,45 @@ def set_gamer_mode(monitor, mode):
     """
     return set_vcp_feature(monitor, 0xDC, mode)
 
+class Dxva2Backend(DDCBackend):
+    """
+    DDC backend using the Windows dxva2 monitor configuration API.
+    """
+    name = "dxva2"
+
+    def __init__(self):
+        self.device_ids = {}
+
+    def enumerate(self):
+        result = []
+        for monitor in get_display_monitors():
+            physical = get_physical_monitors_from(monitor)
+            device_ids = get_monitor_device_ids(monitor)
+            for index, (handle, description) in enumerate(physical):
+                if index < len(device_ids):
+                    self.device_ids[handle] = device_ids[index]
+                result.append((handle, description))
+        return result
+
+    def edid(self, handle):
+        device_id = self.device_ids.get(handle)
+        return read_edid(device_id) if device_id else None
+
+    def topology(self):
+        return tuple(monitor.value for monitor in get_display_monitors())
+
+    def get_vcp(self, handle, code):
+        return get_vcp_feature(handle, code)
+
+    def set_vcp(self, handle, code, value):
+        return set_vcp_feature(handle, code, value)
+
+    def capabilities(self, handle):
+        return get_capabilities(handle)
+
+    def last_error(self):
+        return getattr(_errors, "code", None)
+
+    def close(self, handle):
+        self.device_ids.pop(handle, None)
+        return safe_close_monitor(handle)
\ No newline at end of file
@@ -36,4 +36,68 @@ display_input_entity = {
         "name": "Input Source",
         "device": display_device
     }
+}
+
+# Discovery template of select features without their own template
+generic_select_entity = {
+    "generic_select": "homeassistant/select/display_{display_id}_{key}/config",
+    "generic_select_config": {
+        "availability_topic": "homeassistant/select/display_{display_id}_{key}/availability",
+        "state_topic": "homeassistant/select/display_{display_id}_{key}/state",
+        "command_topic": "homeassistant/select/display_{display_id}_{key}/command",
+        "options": [],
+        "payload_available": "online",
+        "payload_not_available": "offline",
+        "unique_id": "display_{display_id}_{key}",
+        "object_id": "display_{display_id}_{key}",
+        "name": "",
+        "device": {}
+    }
+}
+
+# Discovery template of number features, sliders in percent of the monitor's maximum
+generic_number_entity = {
+    "generic_number": "homeassistant/number/{object_id}/config",
+    "generic_number_config": {
+        "availability_topic": "homeassistant/number/{object_id}/availability",
+        "state_topic": "homeassistant/number/{object_id}/state",
+        "command_topic": "homeassistant/number/{object_id}/command",
+        "min": 0,
+        "max": 100,
+        "step": 1,
+        "mode": "slider",
+        "unit_of_measurement": "%",
+        "payload_available": "online",
+        "payload_not_available": "offline",
+        "unique_id": "{object_id}",
+        "object_id": "{object_id}",
+        "name": "",
+        "device": {}
+    }
+}
+
+# Discovery template of presets, activated as scenes and reporting their last apply time as attributes
+generic_scene_entity = {
+    "generic_scene": "homeassistant/scene/{object_id}/config",
+    "generic_scene_config": {
+        "availability_topic": "homeassistant/scene/{object_id}/availability",
+        "command_topic": "homeassistant/scene/{object_id}/command",
+        "json_attributes_topic": "homeassistant/scene/{object_id}/attributes",
+        "payload_available": "online",
+        "payload_not_available": "offline",
+        "unique_id": "{object_id}",
+        "object_id": "{object_id}",
+        "name": "",
+        "device": {}
+    }
+}
+
+# Topics shared by every entity of a display when its states are published as one JSON document
+display_state_topic = "winddc/display_{display_id}/state"
+display_availability_topic = "winddc/display_{display_id}/availability"
+
+# Discovery templates of the select features, by feature key
+select_entities = {
+    "input": display_input_entity,
+    "gamer_mode": gamer_mode_entity
 }
\ No newline at end of file
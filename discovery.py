@@ -0,0 +1,307 @@
+import hashlib
+import json
+import logging
+
+from devices import (
+    display_availability_topic, display_device, display_state_topic, generic_number_entity, generic_scene_entity,
+    generic_select_entity, select_entities
+)
+
+log = logging.getLogger(__name__)
+
+# Home Assistant's abbreviated discovery keys
+ABBREVIATIONS = {
+    "availability": "avty",
+    "availability_mode": "avty_mode",
+    "availability_topic": "avty_t",
+    "command_topic": "cmd_t",
+    "device": "dev",
+    "identifiers": "ids",
+    "json_attributes_topic": "json_attr_t",
+    "manufacturer": "mf",
+    "model": "mdl",
+    "object_id": "obj_id",
+    "options": "ops",
+    "payload_available": "pl_avail",
+    "payload_not_available": "pl_not_avail",
+    "state_topic": "stat_t",
+    "topic": "t",
+    "unique_id": "uniq_id",
+    "unit_of_measurement": "unit_of_meas",
+    "value_template": "val_tpl",
+}
+
+# Values Home Assistant assumes when the key is missing
+DEFAULTS = {
+    "payload_available": "online",
+    "payload_not_available": "offline",
+}
+
+
+def compact(config, base=None):
+    """
+    Shrinks a discovery config with abbreviated keys and a "~" base topic.
+
+    Args:
+        config: Discovery config using full key names
+        base: Topic prefix replaced by "~" in every topic value
+
+    Returns:
+        dict: The compacted config
+    """
+    result = {}
+    if base is not None:
+        result["~"] = base
+    for key, value in config.items():
+        if DEFAULTS.get(key) == value:
+            continue
+        if isinstance(value, dict):
+            value = compact(value)
+        elif isinstance(value, list):
+            value = [compact(item) if isinstance(item, dict) else item for item in value]
+        elif base is not None and isinstance(value, str) and (key == "topic" or key.endswith("_topic")) \
+                and value.startswith(base + "/"):
+            value = "~" + value[len(base):]
+        result[ABBREVIATIONS.get(key, key)] = value
+    return result
+
+
+class Entity:
+    """
+    A rendered discovery entity with its serialized payload.
+    """
+    def __init__(self, topic, state_topic, command_topic, availability_topic, config):
+        self.topic = topic
+        self.state_topic = state_topic
+        self.command_topic = command_topic
+        self.availability_topic = availability_topic
+        self.config = config
+        base = topic.rsplit("/", 1)[0]
+        self.payload = json.dumps(compact(config, base), separators=(",", ":")).encode("utf-8")
+        self.hash = hashlib.sha1(self.payload).hexdigest()
+
+
+def render_device(display_id, full=True, model=None):
+    """
+    Returns the device block of a display.
+
+    Only one entity per display needs the full block, Home Assistant links
+    the others to the same device by its identifiers.
+    """
+    identifiers = [f"display_{display_id}"]  # Unique identifier for each monitor
+    if not full:
+        return {"identifiers": identifiers}
+    device = display_device.copy()
+    device["name"] = device["name"].format(display_id=display_id)
+    device["identifiers"] = identifiers
+    if model:
+        device["model"] = model
+    return device
+
+
+def render_group_device(name, full=True):
+    """
+    Returns the device block of a group of displays.
+    """
+    identifiers = [f"group_{name}"]
+    if not full:
+        return {"identifiers": identifiers}
+    return {
+        "name": f"Display group {name}",
+        "model": "Display group",
+        "identifiers": identifiers,
+        "via_device": display_device["via_device"]
+    }
+
+
+def render_entity(component, entity, names, name, bridge_topic, device, **fields):
+    """
+    Renders the discovery config of an entity from its template.
+
+    Args:
+        component: Home Assistant component, e.g. "select"
+        entity: Template with the generic_<component> topic and generic_<component>_config
+        names: Values of the template wildcards, object_id is also the unique id
+        name: Entity name
+        bridge_topic: Availability topic of the bridge itself
+        device: Device block of the entity
+        **fields: Component specific config such as the options of a select
+
+    Returns:
+        Entity: The rendered entity
+    """
+    template = entity[f"generic_{component}_config"]
+
+    # Replace wildcards in the topic templates
+    topic = entity[f"generic_{component}"].format(**names)
+    availability_topic = template["availability_topic"].format(**names)
+    command_topic = template["command_topic"].format(**names)
+
+    config = template.copy()
+    config["unique_id"] = names["object_id"]
+    config["object_id"] = names["object_id"]
+    config["name"] = name
+    config.update(fields)
+    config["command_topic"] = command_topic
+    # Scenes have no state
+    state_topic = None
+    if "state_topic" in template:
+        state_topic = config["state_topic"] = template["state_topic"].format(**names)
+    if "json_attributes_topic" in template:
+        config["json_attributes_topic"] = template["json_attributes_topic"].format(**names)
+
+    # Unavailable when either the bridge or the entity is offline
+    del config["availability_topic"]
+    config["availability"] = [{"topic": bridge_topic}, {"topic": availability_topic}]
+    config["availability_mode"] = "all"
+
+    config["device"] = device
+
+    return Entity(topic, state_topic, command_topic, availability_topic, config)
+
+
+def render_select(display_id, feature, bridge_topic, full_device=True, model=None):
+    """
+    Renders the discovery config of a select feature.
+
+    Args:
+        display_id: Display the feature belongs to
+        feature: SelectFeature to expose
+        bridge_topic: Availability topic of the bridge itself
+        full_device: Include the full device block rather than only its identifiers
+        model: Model name reported by the monitor, or None for the default
+
+    Returns:
+        Entity: The rendered entity
+    """
+    names = {"display_id": display_id, "key": feature.key, "object_id": f"display_{display_id}_{feature.key}"}
+    return render_entity("select", select_entities.get(feature.key, generic_select_entity), names, feature.name,
+                         bridge_topic, render_device(display_id, full_device, model), options=list(feature.options))
+
+
+def render_number(object_id, feature, bridge_topic, device):
+    """
+    Renders the discovery config of a number feature, as a 0-100 % slider.
+
+    Args:
+        object_id: Unique id of the entity, e.g. "display_0_brightness"
+        feature: NumberFeature to expose
+        bridge_topic: Availability topic of the bridge itself
+        device: Device block of the display or group
+
+    Returns:
+        Entity: The rendered entity
+    """
+    return render_entity("number", generic_number_entity, {"object_id": object_id, "key": feature.key},
+                         feature.name, bridge_topic, device)
+
+
+def render_scene(name, bridge_topic, full_device=True):
+    """
+    Renders the discovery config of a preset, as a scene of the presets device.
+
+    Args:
+        name: Preset name from the config
+        bridge_topic: Availability topic of the bridge itself
+        full_device: Include the full device block rather than only its identifiers
+
+    Returns:
+        Entity: The rendered entity
+    """
+    device = {"identifiers": ["display_presets"]}
+    if full_device:
+        device.update(name="Display presets", model="Presets", via_device=display_device["via_device"])
+    return render_entity("scene", generic_scene_entity, {"object_id": f"preset_{name}"}, name, bridge_topic,
+                         device)
+
+
+def render_shared(entity, display_id, key):
+    """
+    Moves an entity of a display to the JSON state and availability topics shared by the whole display.
+
+    Args:
+        entity: Entity rendered with its own state and availability topics
+        display_id: Display the entity belongs to
+        key: Feature key, the field of the document holding the entity's state
+
+    Returns:
+        Entity: The entity reading its state from the display's JSON document
+    """
+    state_topic = display_state_topic.format(display_id=display_id)
+    availability_topic = display_availability_topic.format(display_id=display_id)
+    config = entity.config.copy()
+    config["state_topic"] = state_topic
+    config["value_template"] = f"{{{{ value_json.{key} }}}}"
+    config["availability"] = [config["availability"][0], {"topic": availability_topic}]
+    return Entity(entity.topic, state_topic, entity.command_topic, availability_topic, config)
+
+
+class Discovery:
+    """
+    Publishes Home Assistant discovery configs, each one only when it changed.
+
+    Payloads are rendered and serialized once when an entity is added. A
+    payload is published again only if its hash differs from the one last
+    published, or when forced after Home Assistant restarts.
+
+    Hashes restored from a previous run count as published while the
+    broker still holds their configs, so a restart with unchanged entities
+    sends no discovery at all.
+    """
+    def __init__(self, mqtt):
+        self.mqtt = mqtt
+        self.entities = {}
+        self.published = {}
+        self.restored = {}
+
+    def restore(self, published):
+        """
+        Takes the hashes of the configs a previous run left on the broker, as topic: hash.
+        """
+        self.restored = dict(published)
+
+    def add(self, entity):
+        self.entities[entity.topic] = entity
+
+    def remove(self, topic):
+        """
+        Deletes an entity from Home Assistant by clearing its retained config.
+        """
+        self.entities.pop(topic, None)
+        if self.published.pop(topic, None) is not None:
+            self.mqtt.publish(topic, "", retain=True)
+
+    def publish(self, force=False):
+        """
+        Publishes every entity whose payload changed since it was last published.
+
+        Returns:
+            int: Number of configs published
+        """
+        count = 0
+        for topic, entity in self.entities.items():
+            if not force and self.published.get(topic) == entity.hash:
+                continue
+            if not force and self.restored.get(topic) == entity.hash:
+                # Still retained by the broker, only needed again after a reconnect
+                self.mqtt.restore(topic, entity.payload)
+                self.published[topic] = entity.hash
+                continue
+            self.mqtt.publish(topic, entity.payload, retain=True)
+            self.published[topic] = entity.hash
+            count += 1
+        log.debug("Published %d of %d discovery configs", count, len(self.entities))
+        return count
+
+    def remove_stale(self):
+        """
+        Clears the configs a previous run left for entities that no longer exist.
+
+        Returns:
+            int: Number of configs cleared
+        """
+        stale = [topic for topic in self.restored if topic not in self.entities]
+        for topic in stale:
+            self.mqtt.publish(topic, "", retain=True)
+        self.restored = {}
+        return len(stale)
@@ -0,0 +1,113 @@
+EDID_HEADER = bytes([0x00, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0x00])
+
+# Display descriptor tags
+SERIAL_TAG = 0xFF
+NAME_TAG = 0xFC
+
+DESCRIPTOR_OFFSETS = (54, 72, 90, 108)
+
+
+class Edid:
+    """
+    Identity of a monitor read from its EDID base block.
+
+    Attributes:
+        manufacturer: Three letter PNP id, e.g. "AOC"
+        product_code: Manufacturer product code
+        serial_number: Numeric serial number, 0 if not set
+        serial: Serial number descriptor text, or None
+        name: Monitor name descriptor text, or None
+    """
+    def __init__(self, manufacturer, product_code, serial_number=0, serial=None, name=None):
+        self.manufacturer = manufacturer
+        self.product_code = product_code
+        self.serial_number = serial_number
+        self.serial = serial
+        self.name = name
+
+    @property
+    def serial_id(self):
+        """
+        The serial descriptor text, else the numeric serial number, or None if neither is set.
+        """
+        return self.serial or (str(self.serial_number) if self.serial_number else None)
+
+    @property
+    def id(self):
+        """
+        Stable identity of the monitor, e.g. "AOC-2402-ABC123".
+
+        Monitors without a serial number share the id of their model.
+        """
+        model = f"{self.manufacturer}-{self.product_code:04X}"
+        return f"{model}-{self.serial_id}" if self.serial_id else model
+
+    def __repr__(self):
+        return f"Edid({self.id!r}, name={self.name!r})"
+
+
+def descriptor_text(descriptor):
+    return descriptor[5:].split(b"\x0a")[0].decode("ascii", errors="replace").strip()
+
+
+def parse_edid(data):
+    """
+    Parses the identity fields of an EDID base block.
+
+    Args:
+        data: At least the first 128 bytes of the EDID, or None
+
+    Returns:
+        Edid: The parsed identity, or None if data is not a valid EDID
+    """
+    if not data or len(data) < 128 or bytes(data[:8]) != EDID_HEADER:
+        return None
+    data = bytes(data[:128])
+    # The bytes of the block add up to 0, a read garbled on the bus would give the wrong identity
+    if sum(data) & 0xFF:
+        return None
+
+    packed = int.from_bytes(data[8:10], "big")
+    manufacturer = "".join(chr(((packed >> shift) & 0x1F) + 64) for shift in (10, 5, 0))
+    product_code = int.from_bytes(data[10:12], "little")
+    serial_number = int.from_bytes(data[12:16], "little")
+
+    serial = name = None
+    for offset in DESCRIPTOR_OFFSETS:
+        descriptor = data[offset:offset + 18]
+        if descriptor[:3] != b"\x00\x00\x00":
+            continue
+        if descriptor[3] == SERIAL_TAG:
+            serial = descriptor_text(descriptor) or None
+        elif descriptor[3] == NAME_TAG:
+            name = descriptor_text(descriptor) or None
+
+    return Edid(manufacturer, product_code, serial_number, serial, name)
+
+
+def build_edid(manufacturer, product_code, serial_number=0, serial=None, name=None):
+    """
+    Builds an EDID base block carrying only identity fields, for simulated monitors.
+
+    Returns:
+        bytes: The 128 byte EDID
+    """
+    data = bytearray(128)
+    data[:8] = EDID_HEADER
+    packed = 0
+    for char in manufacturer.upper()[:3]:
+        packed = (packed << 5) | (ord(char) - 64)
+    data[8:10] = packed.to_bytes(2, "big")
+    data[10:12] = product_code.to_bytes(2, "little")
+    data[12:16] = serial_number.to_bytes(4, "little")
+    data[18:20] = bytes([1, 4])  # EDID 1.4
+
+    descriptors = [(tag, text) for tag, text in ((SERIAL_TAG, serial), (NAME_TAG, name)) if text]
+    for offset, (tag, text) in zip(DESCRIPTOR_OFFSETS, descriptors):
+        text = text.encode("ascii")[:13]
+        if len(text) < 13:
+            text += b"\x0a" + b" " * (12 - len(text))
+        data[offset:offset + 18] = bytes([0, 0, 0, tag, 0]) + text
+
+    data[127] = -sum(data[:127]) & 0xFF
+    return bytes(data)
@@ -0,0 +1,317 @@
+import math
+from types import MappingProxyType
+
+from capabilities import value_name
+from health import POWER_MODE
+from ddc import (
+    INPUT_SOURCE_DP, INPUT_SOURCE_HDMI,
+    GAMER_MODE_OFF, GAMER_MODE_FPS, GAMER_MODE_RTS,
+    GAMER_MODE_RACING, GAMER_MODE_GAMER1, GAMER_MODE_GAMER2, GAMER_MODE_GAMER3
+)
+
+# Select features read from each display entry of config.yml:
+# config section -> (feature key, entity name, VCP code, default options)
+SELECT_FEATURES = {
+    "inputs": ("input", "Input Source", 0x60, {
+        "HDMI": INPUT_SOURCE_HDMI,
+        "DisplayPort": INPUT_SOURCE_DP
+    }),
+    "gamer_modes": ("gamer_mode", "Gamer Mode", 0xDC, {
+        "OFF": GAMER_MODE_OFF,
+        "FPS": GAMER_MODE_FPS,
+        "RTS": GAMER_MODE_RTS,
+        "Racing": GAMER_MODE_RACING,
+        "Gamer 1": GAMER_MODE_GAMER1,
+        "Gamer 2": GAMER_MODE_GAMER2,
+        "Gamer 3": GAMER_MODE_GAMER3
+    }),
+}
+
+# Further select features created for monitors whose capabilities list their values:
+# VCP code -> (feature key, entity name)
+CAPABILITY_FEATURES = {
+    0x14: ("color_preset", "Color Preset"),
+    0x8D: ("audio_mute", "Audio Mute"),
+}
+
+
+# Continuous features that can be listed in the numbers entry of a display:
+# name -> (feature key, entity name, VCP code)
+NUMBER_FEATURES = {
+    "brightness": ("brightness", "Brightness", 0x10),
+    "contrast": ("contrast", "Contrast", 0x12),
+    "volume": ("volume", "Volume", 0x62),
+}
+
+
+def option_name(option):
+    """
+    Returns the option name of a config key.
+
+    YAML reads unquoted keys such as Off or On as booleans.
+    """
+    if isinstance(option, bool):
+        return "ON" if option else "OFF"
+    return str(option)
+
+
+class SelectFeature:
+    """
+    A non-continuous VCP code exposed as a select entity.
+
+    Attributes:
+        key: Feature key used in topics, e.g. "input"
+        name: Entity name shown in Home Assistant
+        code: VCP code
+        options: Option names in config order
+        to_code: Read-only map of option name to VCP value
+        to_name: Read-only map of VCP value to option name
+    """
+    component = "select"
+
+    def __init__(self, key, name, code, options):
+        self.key = key
+        self.name = name
+        self.code = code
+        self.to_code = MappingProxyType({option_name(option): int(value) for option, value in options.items()})
+        # When two names share a value the first one is reported
+        to_name = {}
+        for option, value in self.to_code.items():
+            to_name.setdefault(value, option)
+        self.to_name = MappingProxyType(to_name)
+        self.options = tuple(self.to_code)
+
+    @property
+    def default(self):
+        return self.options[0] if self.options else None
+
+    def name_for(self, value):
+        """
+        Returns the option name of a VCP value, or "Unknown".
+        """
+        return self.to_name.get(value, "Unknown")
+
+    def state_for(self, value, maximum=None):
+        return self.name_for(value)
+
+    def value_for(self, payload, maximum=None):
+        """
+        Returns the VCP value of an option name, or None if it is not an option.
+        """
+        return self.to_code.get(payload)
+
+
+class NumberFeature:
+    """
+    A continuous VCP code exposed as a number entity in percent of the monitor's maximum.
+
+    Attributes:
+        key: Feature key used in topics, e.g. "brightness"
+        name: Entity name shown in Home Assistant
+        code: VCP code
+    """
+    component = "number"
+
+    # Maximum assumed until the monitor reported its own
+    DEFAULT_MAXIMUM = 100
+
+    def __init__(self, key, name, code):
+        self.key = key
+        self.name = name
+        self.code = code
+
+    def state_for(self, value, maximum=None):
+        """
+        Returns the state of a VCP value, in percent of the maximum.
+        """
+        maximum = maximum or self.DEFAULT_MAXIMUM
+        return str(round(value * 100 / maximum))
+
+    def value_for(self, payload, maximum=None):
+        """
+        Returns the VCP value of a percentage, or None if the payload is not a finite number.
+        """
+        try:
+            percent = float(payload)
+        except ValueError:
+            return None
+        if not math.isfinite(percent):
+            return None
+        maximum = maximum or self.DEFAULT_MAXIMUM
+        return round(min(max(percent, 0), 100) * maximum / 100)
+
+
+class DisplayModel:
+    """
+    Features and polling of one display, compiled from config.yml and the monitor's capabilities.
+
+    Attributes:
+        id: Display id from the config
+        features: Read-only map of feature key to feature
+        by_code: Read-only map of VCP code to feature
+        poll: Read-only map of every polled VCP code to its interval
+        model: Model name reported by the monitor, or None
+    """
+    def __init__(self, display_id, features, poll, model=None):
+        self.id = display_id
+        self.model = model
+        self.features = MappingProxyType({feature.key: feature for feature in features})
+        self.by_code = MappingProxyType({feature.code: feature for feature in features})
+        self.poll = MappingProxyType(poll)
+
+
+def capability_options(code, values, default):
+    """
+    Returns the options of a select feature limited to the values a monitor supports.
+
+    Default names are kept for the supported values they cover, the other
+    values are named after MCCS.
+    """
+    if not values:
+        return default
+    options = {option: value for option, value in default.items() if value in values}
+    known = set(options.values())
+    for value in values:
+        if value not in known:
+            options.setdefault(value_name(code, value), value)
+    return options
+
+
+def compile_display(display, interval, capabilities=None):
+    """
+    Builds the feature model of a display entry from config.yml.
+
+    Features configured in the display entry are always used as is. With
+    the capabilities of the monitor, default features the monitor does not
+    support are left out, the others only offer the supported values, and
+    further features are added for the supported codes in CAPABILITY_FEATURES.
+
+    Args:
+        display: The display entry
+        interval: Global poll interval, used unless the display sets its own
+        capabilities: Capabilities read from the monitor, or None
+
+    Returns:
+        DisplayModel: The compiled display
+    """
+    features = []
+    for section, (key, name, code, default) in SELECT_FEATURES.items():
+        if display.get(section):
+            options = display[section]
+        elif capabilities is None:
+            options = default
+        elif capabilities.supports(code):
+            options = capability_options(code, capabilities.values(code), default)
+        else:
+            continue
+        features.append(SelectFeature(key, name, code, options))
+
+    if capabilities is not None:
+        configured = {feature.code for feature in features}
+        for code, (key, name) in CAPABILITY_FEATURES.items():
+            if code not in configured and capabilities.values(code):
+                features.append(SelectFeature(key, name, code, capability_options(code, capabilities.values(code), {})))
+
+    # Continuous features are the ones listed, or every known one the monitor supports
+    numbers = display.get("numbers")
+    if numbers is None:
+        numbers = [number for number, (_, _, code) in NUMBER_FEATURES.items()
+                   if capabilities is not None and capabilities.supports(code) and not capabilities.values(code)]
+    features.extend(number_features(numbers))
+
+    # Extra VCP codes such as brightness (0x10) can be polled with the poll entry,
+    # either a list of codes or a mapping of code to its own interval
+    display_interval = display.get("interval", interval)
+    poll = {feature.code: display_interval for feature in features}
+    extra_codes = display.get("poll") or {}
+    if isinstance(extra_codes, dict):
+        poll.update(extra_codes)
+    else:
+        poll.update((code, display_interval) for code in extra_codes)
+    # The power mode tells a monitor in standby from one that stopped answering
+    if capabilities is not None and capabilities.supports(POWER_MODE):
+        poll.setdefault(POWER_MODE, display_interval)
+
+    return DisplayModel(display["id"], features, poll, capabilities.model if capabilities is not None else None)
+
+
+def number_features(names):
+    """
+    Returns:
+        list: The NumberFeature of each name in NUMBER_FEATURES
+
+    Raises:
+        ValueError: If a name is not in NUMBER_FEATURES
+    """
+    features = []
+    for number in names:
+        if number not in NUMBER_FEATURES:
+            raise ValueError(f"Unknown number feature {number!r}, expected one of {', '.join(NUMBER_FEATURES)}")
+        features.append(NumberFeature(*NUMBER_FEATURES[number]))
+    return features
+
+
+class DisplayGroup:
+    """
+    Displays whose number features are set together from one entity each.
+
+    Attributes:
+        name: Group name from the config
+        displays: Tuple of member display ids
+        features: Read-only map of feature key to NumberFeature
+    """
+    def __init__(self, name, displays, features):
+        self.name = name
+        self.displays = tuple(displays)
+        self.features = MappingProxyType({feature.key: feature for feature in features})
+
+
+def compile_groups(config):
+    """
+    Returns:
+        dict: Group name to DisplayGroup for every entry of the groups section of config.yml
+    """
+    return {name: DisplayGroup(name, group["displays"], number_features(group.get("numbers") or []))
+            for name, group in (config.get("groups") or {}).items()}
+
+
+def preset_feature(display, key):
+    """
+    Returns the feature of a display that a preset sets, or None if the display has no such feature.
+
+    Number features can be set by presets without being exposed as entities.
+    """
+    feature = display.features.get(key)
+    if feature is None and key in NUMBER_FEATURES:
+        feature = NumberFeature(*NUMBER_FEATURES[key])
+    return feature
+
+
+class Preset:
+    """
+    Named feature values applied to several displays at once.
+
+    Attributes:
+        name: Preset name from the config
+        displays: Read-only map of display id to the tuple of (feature key, payload) to write, in order
+    """
+    def __init__(self, name, displays):
+        self.name = name
+        self.displays = MappingProxyType({display_id: tuple(values.items())
+                                          for display_id, values in displays.items()})
+
+
+def compile_presets(config):
+    """
+    Returns:
+        dict: Preset name to Preset for every entry of the presets section of config.yml
+    """
+    return {str(name): Preset(str(name), displays) for name, displays in (config.get("presets") or {}).items()}
+
+
+def compile_displays(config, interval):
+    """
+    Returns:
+        dict: Display id to DisplayModel for every display in config.yml
+    """
+    return {display["id"]: compile_display(display, interval) for display in config["display"]}
@@ -0,0 +1,56 @@
+# VCP code of the power mode, and its value while the monitor is on
+POWER_MODE = 0xD6
+POWER_ON = 0x01
+
+ACTIVE = "active"
+STANDBY = "standby"
+UNREACHABLE = "unreachable"
+
+
+class DisplayHealth:
+    """
+    Whether a display is on and answering DDC, from the outcome of its reads.
+
+    A display is active while it answers, standby while its power mode
+    (VCP 0xD6) reads as anything but on, and unreachable after threshold
+    passes in a row in which no read succeeded. Displays that are not
+    active are not polled, only probed every probe_interval seconds.
+
+    Args:
+        threshold: Failed passes in a row before an active display is unreachable
+        probe_interval: Seconds between probes of a display that is not active
+    """
+    def __init__(self, threshold=3, probe_interval=30):
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self.state = ACTIVE
+        self.failures = 0
+
+    @property
+    def active(self):
+        return self.state == ACTIVE
+
+    def report(self, results):
+        """
+        Updates the state from the results of a polling pass or probe.
+
+        Args:
+            results: VCP code to (current, maximum), or None if the monitor is missing
+
+        Returns:
+            bool: True if the state changed
+        """
+        previous = self.state
+        power = (results or {}).get(POWER_MODE, (None, None))[0]
+        if power is not None:
+            self.failures = 0
+            self.state = ACTIVE if power == POWER_ON else STANDBY
+        elif results and any(current is not None for current, _ in results.values()):
+            self.failures = 0
+            self.state = ACTIVE
+        else:
+            self.failures += 1
+            # A display in standby that stops answering is still asleep
+            if self.state == ACTIVE and self.failures >= self.threshold:
+                self.state = UNREACHABLE
+        return self.state != previous
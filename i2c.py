@@ -0,0 +1,287 @@
+import glob
+import logging
+import os
+import threading
+import time
+
+from backend import DDCBackend
+from edid import parse_edid
+
+log = logging.getLogger(__name__)
+
+I2C_SLAVE = 0x0703
+
+# 7-bit I2C addresses of the DDC/CI channel and the EDID EEPROM
+DDC_ADDRESS = 0x37
+EDID_ADDRESS = 0x50
+
+# Source address of host messages and the virtual host address used in reply checksums
+HOST_ADDRESS = 0x51
+REPLY_CHECKSUM_SEED = 0x50
+DISPLAY_ADDRESS = 0x6E
+
+VCP_REQUEST = 0x01
+VCP_REPLY = 0x02
+VCP_SET = 0x03
+CAPABILITIES_REQUEST = 0xF3
+CAPABILITIES_REPLY = 0xE3
+
+# Adapter names of buses that are never display buses, even below a graphics card
+IGNORED_BUSES = ("SMBus", "AMDGPU SMU")
+
+
+class DDCError(Exception):
+    pass
+
+
+def checksum(seed, data):
+    for byte in data:
+        seed ^= byte
+    return seed
+
+
+def encode_message(payload):
+    """
+    Frames a DDC/CI payload sent from the host to the display.
+
+    Args:
+        payload: Opcode and arguments, at most 127 bytes
+
+    Returns:
+        bytes: Source address, length byte, payload and checksum
+    """
+    message = bytes([HOST_ADDRESS, 0x80 | len(payload)]) + bytes(payload)
+    return message + bytes([checksum(DISPLAY_ADDRESS, message)])
+
+
+def decode_message(data):
+    """
+    Validates a DDC/CI reply read from the display.
+
+    Args:
+        data: Raw bytes starting with the display's source address
+
+    Returns:
+        bytes: The reply payload
+
+    Raises:
+        DDCError: If the reply is truncated, empty or fails the checksum
+    """
+    if len(data) < 3 or data[0] != DISPLAY_ADDRESS:
+        raise DDCError(f"Invalid reply header: {bytes(data[:2]).hex()}")
+    length = data[1] & 0x7F
+    if len(data) < length + 3:
+        raise DDCError("Truncated reply")
+    if checksum(REPLY_CHECKSUM_SEED, data[:length + 2]) != data[length + 2]:
+        raise DDCError("Reply checksum mismatch")
+    if length == 0:
+        # Null message, the display is busy or does not support the request
+        raise DDCError("Null reply")
+    return bytes(data[2:length + 2])
+
+
+def display_bus(path, sysfs="/sys/class/i2c-dev"):
+    """
+    Returns True if an I2C bus belongs to a graphics card.
+
+    Other buses, e.g. the SMBus holding the SPD EEPROMs of the memory,
+    must not be probed: writing to their address 0x50 can corrupt them.
+
+    Args:
+        path: Device path of the bus, e.g. /dev/i2c-3
+        sysfs: Directory holding the i2c-dev class entries
+    """
+    entry = os.path.join(sysfs, os.path.basename(path))
+    try:
+        with open(os.path.join(entry, "name"), "r") as file:
+            name = file.read().strip()
+    except OSError:
+        return False
+    if name.startswith(IGNORED_BUSES):
+        return False
+
+    adapter = os.path.realpath(os.path.join(entry, "device"))
+    # DisplayPort AUX channels hang below their DRM connector
+    if f"{os.sep}drm{os.sep}" in adapter:
+        return True
+    # Other display buses belong to a PCI display controller, class 0x03xxxx
+    try:
+        with open(os.path.join(os.path.dirname(adapter), "class"), "r") as file:
+            return file.read().strip().startswith("0x03")
+    except OSError:
+        return False
+
+
+def error_name(error):
+    """
+    Returns a short label for a failed transaction, the errno for OS errors.
+    """
+    if isinstance(error, OSError) and error.errno:
+        return f"errno {error.errno}"
+    return type(error).__name__
+
+
+class FileTransport:
+    """
+    Raw reads and writes to an I2C slave through a /dev/i2c-* file descriptor.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR)
+        self.address = None
+
+    def set_address(self, address):
+        if address != self.address:
+            import fcntl
+            fcntl.ioctl(self.fd, I2C_SLAVE, address)
+            self.address = address
+
+    def write(self, data):
+        os.write(self.fd, bytes(data))
+
+    def read(self, length):
+        return os.read(self.fd, length)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class I2CDevice:
+    """
+    Handle to a monitor reached over an I2C bus.
+    """
+    def __init__(self, path, transport, edid):
+        self.path = path
+        self.transport = transport
+        self.edid = edid
+        self.lock = threading.Lock()
+        self.ready_at = 0
+
+    def __repr__(self):
+        return f"I2CDevice({self.path})"
+
+
+class I2CBackend(DDCBackend):
+    """
+    DDC/CI over the Linux i2c-dev interface.
+
+    Args:
+        buses: Device paths to probe, defaults to the /dev/i2c-* buses of graphics cards
+        transport: Factory taking a device path and returning a transport
+        reply_delay: Seconds to wait between a request and reading its reply
+        command_delay: Minimum seconds between two commands to the same display
+        sysfs: Directory holding the i2c-dev class entries that tell the display buses apart
+    """
+    name = "i2c"
+
+    def __init__(self, buses=None, transport=FileTransport, reply_delay=0.04, command_delay=0.05,
+                 sysfs="/sys/class/i2c-dev"):
+        self.buses = buses
+        self.sysfs = sysfs
+        self.transport = transport
+        self.reply_delay = reply_delay
+        self.command_delay = command_delay
+        self.errors = threading.local()
+
+    def enumerate(self):
+        result = []
+        paths = self.buses
+        if paths is None:
+            paths = [path for path in sorted(glob.glob("/dev/i2c-*")) if display_bus(path, self.sysfs)]
+        for path in paths:
+            try:
+                transport = self.transport(path)
+            except OSError:
+                continue
+            try:
+                transport.set_address(EDID_ADDRESS)
+                transport.write(b"\x00")
+                edid = bytes(transport.read(128))
+            except OSError:
+                transport.close()
+                continue
+            identity = parse_edid(edid)
+            if identity is None:
+                transport.close()
+                continue
+            device = I2CDevice(path, transport, edid)
+            result.append((device, identity.name or path))
+        return result
+
+    def topology(self):
+        return tuple(sorted(glob.glob("/dev/i2c-*")))
+
+    def edid(self, handle):
+        return handle.edid
+
+    def transact(self, device, payload, reply_length=0, delay=None):
+        """
+        Sends one DDC/CI message and optionally reads the reply.
+
+        Returns:
+            bytes: The reply payload, or None when no reply was requested
+        """
+        with device.lock:
+            wait = device.ready_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                device.transport.set_address(DDC_ADDRESS)
+                device.transport.write(encode_message(payload))
+                if not reply_length:
+                    return None
+                time.sleep(self.reply_delay if delay is None else delay)
+                return decode_message(device.transport.read(reply_length))
+            finally:
+                device.ready_at = time.monotonic() + self.command_delay
+
+    def get_vcp(self, handle, code):
+        try:
+            reply = self.transact(handle, bytes([VCP_REQUEST, code]), 11)
+            if len(reply) < 8 or reply[0] != VCP_REPLY or reply[2] != code:
+                raise DDCError(f"Unexpected reply: {reply.hex()}")
+            if reply[1] != 0:
+                raise DDCError(f"Unsupported VCP code {code:#04x}")
+            return (reply[6] << 8) | reply[7], (reply[4] << 8) | reply[5]
+        except (OSError, DDCError) as e:
+            self.errors.code = error_name(e)
+            log.warning("Error getting VCP feature %#04x on %s: %s", code, handle.path, e)
+            return None, None
+
+    def set_vcp(self, handle, code, value):
+        try:
+            self.transact(handle, bytes([VCP_SET, code, (value >> 8) & 0xFF, value & 0xFF]))
+            return True
+        except OSError as e:
+            self.errors.code = error_name(e)
+            log.warning("Error setting VCP feature %#04x on %s: %s", code, handle.path, e)
+            return False
+
+    def capabilities(self, handle):
+        data = b""
+        try:
+            while True:
+                offset = len(data)
+                reply = self.transact(handle, bytes([CAPABILITIES_REQUEST, offset >> 8, offset & 0xFF]), 38)
+                if len(reply) < 3 or reply[0] != CAPABILITIES_REPLY:
+                    raise DDCError(f"Unexpected reply: {reply.hex()}")
+                fragment = reply[3:]
+                if not fragment:
+                    break
+                data += fragment
+        except (OSError, DDCError) as e:
+            self.errors.code = error_name(e)
+            log.warning("Error getting capabilities on %s: %s", handle.path, e)
+            return None
+        return data.rstrip(b"\x00").decode("ascii", errors="replace")
+
+    def last_error(self):
+        return getattr(self.errors, "code", None)
+
+    def close(self, handle):
+        try:
+            handle.transport.close()
+            return True
+        except OSError as e:
+            log.error("Error closing %s: %s", handle.path, e)
+            return False
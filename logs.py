@@ -0,0 +1,88 @@
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops repeats of the same log message for a while.
+
+    Records are considered the same when they come from the same logger
+    with the same message template and arguments, e.g. the same DDC error
+    from a sleeping monitor on every poll. The first one is logged, the
+    next ones are dropped for interval seconds, and the record that ends
+    the quiet period reports how many were suppressed.
+    """
+    def __init__(self, interval=300, clock=time.monotonic):
+        super().__init__()
+        self.interval = interval
+        self.clock = clock
+        self.seen = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        try:
+            key = (record.name, record.msg, record.args)
+            hash(key)
+        except TypeError:
+            return True
+
+        now = self.clock()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            self.seen[key] = [now, 0]
+            if len(self.seen) > 1024:
+                self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.interval}
+
+        if suppressed:
+            record.msg = f"{record.msg} (repeated {suppressed} times)"
+        return True
+
+
+def setup(level="INFO", rate_limit=300, levels=None, stream=None):
+    """
+    Configures logging with a non-blocking queue handler.
+
+    Log calls only put the record on a queue, a background listener thread
+    formats it and writes it to the console.
+
+    Args:
+        level: Root log level
+        rate_limit: Seconds during which repeated warnings and errors are dropped, 0 to disable
+        levels: Optional mapping of logger name to level, e.g. {"ddc": "DEBUG"}
+        stream: Output stream, defaults to stderr
+
+    Returns:
+        logging.handlers.QueueListener: The running listener, stop it on shutdown to flush
+    """
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(logging.Formatter(FORMAT))
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+
+    handler = logging.handlers.QueueHandler(records)
+    if rate_limit:
+        handler.addFilter(RateLimitFilter(rate_limit))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level.upper() if isinstance(logger_level, str) else logger_level)
+
+    listener.start()
+    return listener
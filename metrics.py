@@ -0,0 +1,232 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    """
+    A named metric with a fixed set of label names.
+
+    A metric can also be backed by a function that returns a dict of label
+    value tuples to values, evaluated on every scrape.
+    """
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.function = None
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            return [(self.name, key, (), value) for key, value in self.function().items()]
+        with self.lock:
+            return [(self.name, key, (), value) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{format_labels(self.labels, key, extra)} {format_value(value)}")
+        return lines
+
+    def snapshot(self):
+        return {",".join(key) or "": value for name, key, extra, value in self.samples() if not extra}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self.lock:
+            values = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self.values.items()]
+        samples = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                samples.append((f"{self.name}_bucket", key, (("le", format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_bucket", key, (("le", "+Inf"),), count))
+            samples.append((f"{self.name}_sum", key, (), total))
+            samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+    def snapshot(self):
+        with self.lock:
+            return {",".join(key) or "": {"count": entry[2], "sum": entry[1]} for key, entry in self.values.items()}
+
+
+class Registry:
+    """
+    Collection of metrics rendered in the Prometheus text format.
+    """
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                log.exception("Failed to collect metric %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Metric name to {labels: value}, histograms report count and sum
+        """
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+REGISTRY = Registry()
+
+DDC_SECONDS = REGISTRY.histogram(
+    "winddc_ddc_request_seconds", "Duration of DDC/CI requests", ("display", "operation", "code"))
+DDC_ERRORS = REGISTRY.counter(
+    "winddc_ddc_errors_total", "Failed DDC/CI requests by error code", ("display", "operation", "error"))
+ENUMERATION_SECONDS = REGISTRY.histogram(
+    "winddc_enumeration_seconds", "Duration of physical monitor enumeration")
+QUEUE_DEPTH = REGISTRY.gauge(
+    "winddc_queue_depth", "DDC jobs waiting in each display's worker queue", ("display",))
+QUEUE_JOBS = REGISTRY.counter(
+    "winddc_queue_jobs_total", "DDC jobs by outcome", ("display", "outcome"))
+PUBLISHES = REGISTRY.counter(
+    "winddc_state_publishes_total", "State publishes sent or suppressed as unchanged", ("result",))
+COMMAND_SECONDS = REGISTRY.histogram(
+    "winddc_command_seconds", "Time from sending a write until the monitor confirmed or the retries ran out",
+    ("code", "outcome"))
+COMMAND_ATTEMPTS = REGISTRY.counter(
+    "winddc_command_attempts_total", "Writes sent by verified commands, including retries", ("code",))
+PRESET_SECONDS = REGISTRY.histogram(
+    "winddc_preset_seconds", "Time from activating a preset until every display finished its writes", ("preset",))
+MQTT_MESSAGES = REGISTRY.counter(
+    "winddc_mqtt_messages_received_total", "MQTT messages received")
+MQTT_CONNECTIONS = REGISTRY.counter(
+    "winddc_mqtt_connection_events_total", "MQTT connects, refused connects and disconnects", ("event",))
+MQTT_RECONNECT_SECONDS = REGISTRY.histogram(
+    "winddc_mqtt_reconnect_seconds", "Time from losing the broker connection to being connected again",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+LOOP_SECONDS = REGISTRY.histogram(
+    "winddc_loop_iteration_seconds", "Time spent running callbacks per main loop iteration",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+
+
+def record_ddc(backend, display_id, operation, code, seconds, success):
+    """
+    Records the duration and outcome of a DDC request.
+    """
+    code = f"{code:#04x}"
+    DDC_SECONDS.observe(seconds, display=display_id, operation=operation, code=code)
+    if not success:
+        DDC_ERRORS.inc(display=display_id, operation=operation, error=backend.last_error() or "unknown")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+def serve(host="127.0.0.1", port=9877, registry=REGISTRY):
+    """
+    Serves the registry on http://host:port/metrics from a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server, call shutdown() to stop it
+    """
+    handler = type("Handler", (MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Serving metrics on http://%s:%s/metrics", host, server.server_address[1])
+    return server
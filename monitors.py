@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+
+from edid import parse_edid
+from metrics import ENUMERATION_SECONDS
+
+log = logging.getLogger(__name__)
+
+
+class Monitor:
+    """
+    An open physical monitor handle together with its identity.
+
+    Attributes:
+        key: Stable identity of the monitor, survives re-enumeration and reordering
+        handle: Physical monitor handle owned by the registry
+        description: Description reported by the enumeration backend
+        edid: Edid identity read from the monitor, or None if unavailable
+    """
+    def __init__(self, key, handle, description, edid=None):
+        self.key = key
+        self.handle = handle
+        self.description = description
+        self.edid = edid
+
+
+class MonitorRegistry:
+    """
+    Enumerates physical monitors once and keeps their handles open.
+
+    The backend must provide enumerate(), returning a list of
+    (handle, description) tuples, and close(handle). It may also provide
+    edid(handle), returning the monitor's EDID bytes, and topology(), a
+    cheap value that changes when displays are added, removed or
+    reconfigured.
+
+    Monitors are identified by their EDID manufacturer, product code and
+    serial, so a display keeps addressing the same screen when the
+    enumeration order changes. Displays are bound either to a serial or
+    EDID id with assign(), or to their position in enumeration order.
+
+    Handles are reused for every DDC call until the registry is
+    invalidated, either by a display-change signal or after a DDC
+    failure. The next lookup then re-enumerates: monitors that are still
+    attached keep their open handle, unless a DDC call on it failed, and
+    only the handles of new or failing monitors are replaced.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.monitors = []
+        self.by_key = {}
+        self.by_serial = {}
+        self.selectors = {}
+        self.suspect = set()
+        self.stale = True
+        self.topology = None
+        self.lock = threading.RLock()
+
+    def assign(self, display_id, selector):
+        """
+        Binds a display to the monitor with the given EDID serial or id
+        instead of its position in enumeration order.
+        """
+        with self.lock:
+            if selector is None:
+                self.selectors.pop(display_id, None)
+            else:
+                self.selectors[display_id] = str(selector)
+
+    def identify(self, handle, description, seen):
+        """
+        Returns the key and Edid of a newly enumerated handle.
+        """
+        edid = parse_edid(self.backend.edid(handle))
+        base = edid.id if edid is not None else description
+        # Monitors without a serial are told apart by their order of appearance
+        ordinal = seen.get(base, 0)
+        seen[base] = ordinal + 1
+        return (base if ordinal == 0 else f"{base} #{ordinal}"), edid
+
+    def refresh(self):
+        """
+        Re-enumerates the physical monitors, keeping the handles of unchanged ones.
+
+        Returns:
+            list: The current list of Monitor entries in enumeration order
+        """
+        with self.lock:
+            if getattr(self.backend, "topology", None) is not None:
+                self.topology = self.backend.topology()
+            started = time.perf_counter()
+            found = self.backend.enumerate()
+            ENUMERATION_SECONDS.observe(time.perf_counter() - started)
+
+            old = self.by_key
+            monitors = []
+            seen = {}
+            for handle, description in found:
+                key, edid = self.identify(handle, description, seen)
+                previous = old.get(key)
+                if previous is not None and key not in self.suspect:
+                    # Still attached and working, the new handle is not needed
+                    self.backend.close(handle)
+                    monitors.append(previous)
+                else:
+                    monitors.append(Monitor(key, handle, description, edid))
+
+            current = {monitor.key: monitor for monitor in monitors}
+            for key, monitor in old.items():
+                if current.get(key) is not monitor:
+                    self.backend.close(monitor.handle)
+
+            added = current.keys() - old.keys()
+            removed = old.keys() - current.keys()
+            if added or removed:
+                log.info("Monitors attached: %s, detached: %s", sorted(added) or "none", sorted(removed) or "none")
+
+            self.monitors = monitors
+            self.by_key = current
+            self.by_serial = {monitor.edid.serial_id: monitor for monitor in monitors
+                              if monitor.edid is not None and monitor.edid.serial_id}
+            self.suspect.clear()
+            self.stale = False
+            return self.monitors
+
+    def invalidate(self, display_id=None):
+        """
+        Marks the cached handles as stale so the next lookup re-enumerates.
+
+        Args:
+            display_id: Display whose handle failed and must be reopened, or
+                        None if only the topology may have changed
+        """
+        with self.lock:
+            if display_id is not None:
+                monitor = self.resolve(display_id)
+                if monitor is not None:
+                    self.suspect.add(monitor.key)
+            self.stale = True
+
+    def check_topology(self):
+        """
+        Invalidates the cache if the backend reports a display change.
+
+        Returns:
+            bool: True if the display topology changed since the last check
+        """
+        topology = getattr(self.backend, "topology", None)
+        if topology is None:
+            return False
+
+        current = topology()
+        changed = self.topology is not None and current != self.topology
+        self.topology = current
+        if changed:
+            self.invalidate()
+        return changed
+
+    def resolve(self, display_id):
+        selector = self.selectors.get(display_id)
+        if selector is not None:
+            return self.by_key.get(selector) or self.by_serial.get(selector)
+        if isinstance(display_id, int) and 0 <= display_id < len(self.monitors):
+            return self.monitors[display_id]
+        return None
+
+    def get(self, display_id):
+        """
+        Returns the Monitor bound to a display.
+
+        Args:
+            display_id: Display id from the config
+
+        Returns:
+            Monitor: The monitor entry, or None if the monitor is not attached
+        """
+        with self.lock:
+            if self.stale:
+                self.refresh()
+            return self.resolve(display_id)
+
+    def key(self, display_id):
+        """
+        Returns the key of the monitor a display was last bound to, without re-enumerating, or None.
+        """
+        with self.lock:
+            monitor = self.resolve(display_id)
+            return monitor.key if monitor is not None else None
+
+    def handle(self, display_id):
+        """
+        Returns the open physical monitor handle for a display.
+
+        Args:
+            display_id: Display id from the config
+
+        Returns:
+            The physical monitor handle, or None if the monitor is not attached
+        """
+        monitor = self.get(display_id)
+        return monitor.handle if monitor is not None else None
+
+    def close(self):
+        """
+        Closes every handle held by the registry.
+        """
+        with self.lock:
+            for monitor in self.monitors:
+                self.backend.close(monitor.handle)
+            self.monitors = []
+            self.by_key = {}
+            self.by_serial = {}
+            self.stale = True
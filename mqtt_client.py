@@ -1,37 +1,210 @@
 import paho.mqtt.client as mqtt
 import json
-from timer import Timer
+import logging
+import random
+import threading
+import time
+from metrics import MQTT_MESSAGES, MQTT_CONNECTIONS, MQTT_RECONNECT_SECONDS
+
+log = logging.getLogger(__name__)
+
+class Backoff:
+    """
+    Exponential backoff with jitter, so a fleet of bridges does not reconnect in lockstep.
+
+    Each delay is drawn between half and all of min_delay * 2 ** attempts,
+    capped at max_delay.
+    """
+    def __init__(self, min_delay=1, max_delay=60, random=random.random):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.random = random
+        self.attempts = 0
+
+    def next(self):
+        delay = min(self.max_delay, self.min_delay * 2 ** self.attempts)
+        self.attempts += 1
+        return delay / 2 + self.random() * delay / 2
+
+    def reset(self):
+        self.attempts = 0
 
 class MQTTClient:
+    """
+    MQTT connection with automatic reconnects and a last will.
+
+    Subscriptions and retained publishes are remembered, and every connect
+    replays them in one burst after marking the bridge online, so a broker
+    restart loses neither commands nor discovery. Retained messages published
+    during the replay follow it. The last will marks the bridge offline if
+    the process dies.
+    """
     def on_connect(self, client, userdata, flags, rc):
-        print("Connected with result code " + str(rc))
+        if rc != 0:
+            MQTT_CONNECTIONS.inc(event="refused")
+            log.warning("Connection refused with result code %s", rc)
+            return
+
+        MQTT_CONNECTIONS.inc(event="connect")
+        if self.disconnected_at is not None:
+            MQTT_RECONNECT_SECONDS.observe(time.monotonic() - self.disconnected_at)
+            self.disconnected_at = None
+        self.backoff.reset()
+
+        with self.lock:
+            topics = set(self.subscriptions)
+            retained = [(topic, payload) for topic, payload in self.retained.items() if topic not in self.restored]
+            self.restored.clear()
+            self.changed.clear()
+            self.first_connect = False
+
+        self.client.publish(self.availability_topic, "online", qos=1, retain=True)
+        replayed = len(retained)
+        subscribe = topics
+        # Messages published during the replay are sent after it, so none is overwritten by an older value.
+        # The client is only marked connected once nothing is left, under the lock publish() takes.
+        while True:
+            if subscribe:
+                self.client.subscribe([(topic, 0) for topic in subscribe])
+            for topic, payload in retained:
+                self.client.publish(topic, payload, retain=True)
+            with self.lock:
+                subscribe = self.subscriptions - topics
+                topics |= subscribe
+                retained = [(topic, self.retained[topic]) for topic in self.changed]
+                self.changed.clear()
+                replayed += len(retained)
+                if not subscribe and not retained:
+                    self.connected = True
+                    break
+        log.info("Connected, subscribed to %d topics and replayed %d retained messages", len(topics), replayed)
 
     def on_disconnect(self, client, userdata, rc):
-        self.timer.reset()
-        self.timer.active = True
+        MQTT_CONNECTIONS.inc(event="disconnect")
+        self.connected = False
+        if self.disconnected_at is None:
+            self.disconnected_at = time.monotonic()
+        if self.running:
+            log.warning("Disconnected with result code %s", rc)
 
     def on_message(self, client, userdata, msg):
+        # Runs on the network thread, hand the message over to the scheduler
+        MQTT_MESSAGES.inc()
         if self.delegate != None:
-            self.delegate.on_message(msg.topic, msg.payload)
+            self.scheduler.call_soon(self.delegate.on_message, msg.topic, msg.payload)
 
-    def __init__(self, username, password, host, port):
+    def __init__(self, username, password, host, port, scheduler,
+                 availability_topic="winddc/bridge/availability", keepalive=60, min_delay=1, max_delay=60):
         self.client = mqtt.Client()
 
         self.client.username_pw_set(username, password)
 
         self.host = host
         self.port = port
+        self.keepalive = keepalive
+        self.scheduler = scheduler
+        self.availability_topic = availability_topic
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
-        self.client.connect(host, port, 60)
+        self.client.will_set(availability_topic, "offline", qos=1, retain=True)
         self.delegate = None
-        self.timer = Timer(60, self)
-        self.timer.active = False
 
-    def on_timer(self, timer, elapsed):
-        self.client.connect(self.host, self.port, 60)
+        self.backoff = Backoff(min_delay, max_delay)
+        self.subscriptions = set()
+        self.retained = {}
+        self.restored = set()
+        self.changed = set()
+        self.first_connect = True
+        self.lock = threading.Lock()
+        self.connected = False
+        self.disconnected_at = None
+        self.running = False
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def subscribe(self, topic):
+        """
+        Subscribes to a topic now if connected, and again after every reconnect.
+        """
+        with self.lock:
+            self.subscriptions.add(topic)
+        if self.connected:
+            self.client.subscribe(topic)
+
+    def unsubscribe(self, topic):
+        with self.lock:
+            self.subscriptions.discard(topic)
+        if self.connected:
+            self.client.unsubscribe(topic)
+
+    def publish(self, topic, payload, retain=False):
+        """
+        Publishes a message. Retained messages are also replayed after every reconnect.
+        """
+        with self.lock:
+            if retain:
+                self.retained[topic] = payload
+                self.restored.discard(topic)
+                if not self.connected:
+                    self.changed.add(topic)
+            connected = self.connected
+        if connected:
+            self.client.publish(topic, payload, retain=retain)
+
+    def restore(self, topic, payload):
+        """
+        Remembers a retained message the broker still holds from a previous run.
+
+        It is not sent on the first connect, only replayed after reconnects.
+        """
+        with self.lock:
+            self.retained[topic] = payload
+            if self.first_connect:
+                self.restored.add(topic)
+
+    def run(self):
+        """
+        Network thread, connects and reconnects with a jittered exponential backoff.
+        """
+        socket_open = False
+        while self.running:
+            if not socket_open:
+                try:
+                    self.client.connect(self.host, self.port, self.keepalive)
+                    socket_open = True
+                except (OSError, ValueError) as e:
+                    delay = self.backoff.next()
+                    if self.disconnected_at is None:
+                        self.disconnected_at = time.monotonic()
+                    log.warning("Could not connect to %s:%s (%s), retrying in %.1fs", self.host, self.port, e, delay)
+                    self.stopping.wait(delay)
+                    continue
+
+            rc = self.client.loop(timeout=1.0)
+            if rc != mqtt.MQTT_ERR_SUCCESS and self.running:
+                socket_open = False
+                delay = self.backoff.next()
+                log.warning("Connection lost (%s), reconnecting in %.1fs", mqtt.error_string(rc), delay)
+                self.stopping.wait(delay)
+
+    def start(self):
+        """
+        Starts the background network thread.
+        """
+        self.running = True
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="mqtt", daemon=True)
+        self.thread.start()
 
-    def step(self, dt):
-        self.client.loop()
-        self.timer.step(dt)
\ No newline at end of file
+    def stop(self):
+        """
+        Marks the bridge offline and disconnects.
+        """
+        self.running = False
+        self.stopping.set()
+        if self.connected:
+            self.client.publish(self.availability_topic, "offline", qos=1, retain=True)
+            self.client.disconnect()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,329 @@
+import logging
+import time
+
+from capabilities import parse_capabilities
+from health import POWER_MODE, POWER_ON
+from metrics import record_ddc
+
+log = logging.getLogger(__name__)
+
+
+class Poller:
+    """
+    Reads several VCP codes from a display in a single pass.
+
+    Each pass runs as one job on the display's worker, so monitors are read
+    concurrently while the reads to a single monitor are spaced by the
+    DDC/CI minimum delay between commands.
+
+    Args:
+        backend: DDCBackend used for the reads
+        monitors: MonitorRegistry providing the cached handles
+        workers: WorkerPool running the passes
+        delay: Seconds to wait between two reads on the same monitor
+    """
+    def __init__(self, backend, monitors, workers, delay=0.05):
+        self.backend = backend
+        self.monitors = monitors
+        self.workers = workers
+        self.delay = delay
+
+    def read(self, display_id, codes):
+        """
+        Reads the given VCP codes from a display. Runs on the worker thread.
+
+        Returns:
+            dict: VCP code to (current_value, maximum_value), or None if the monitor is missing
+        """
+        monitor_handle = self.monitors.handle(display_id)
+        if monitor_handle is None:
+            # Enumerate again on the next pass, the monitor may be plugged back in meanwhile
+            self.monitors.invalidate()
+            return None
+
+        # A monitor in standby only answers its power mode, the other reads would time out
+        if POWER_MODE in codes:
+            codes = (POWER_MODE,) + tuple(code for code in codes if code != POWER_MODE)
+
+        results = {}
+        for index, code in enumerate(codes):
+            if index and self.delay:
+                time.sleep(self.delay)
+            started = time.perf_counter()
+            results[code] = self.backend.get_vcp(monitor_handle, code)
+            record_ddc(self.backend, display_id, "get", code, time.perf_counter() - started,
+                       results[code][0] is not None)
+            if code == POWER_MODE and results[code][0] not in (None, POWER_ON):
+                break
+
+        # A code the monitor does not support fails on every pass, only a pass that got no answer
+        # at all means the handle may be bad
+        if all(current is None for current, _ in results.values()):
+            self.monitors.invalidate(display_id)
+        return results
+
+    def read_code(self, display_id, code):
+        """
+        Reads a single VCP code from a display. Runs on the worker thread.
+
+        Unlike a polling pass, a failed read does not mark the handle suspect.
+
+        Returns:
+            tuple: (current_value, maximum_value), or None if the monitor is missing
+        """
+        monitor_handle = self.monitors.handle(display_id)
+        if monitor_handle is None:
+            return None
+        started = time.perf_counter()
+        result = self.backend.get_vcp(monitor_handle, code)
+        record_ddc(self.backend, display_id, "get", code, time.perf_counter() - started, result[0] is not None)
+        return result
+
+    def query(self, display_id, code, callback):
+        """
+        Queues a one-off read of a VCP code.
+
+        Args:
+            display_id: Display to read
+            code: VCP code to read
+            callback: Called on the scheduler with (current, maximum), or None
+
+        Returns:
+            bool: False if the display's queue is full
+        """
+        return self.workers.submit(display_id, lambda: self.read_code(display_id, code), callback,
+                                   key=("query", code))
+
+    def poll(self, display_id, codes, callback):
+        """
+        Queues a polling pass for a display.
+
+        Args:
+            display_id: Display to read
+            codes: VCP codes to read
+            callback: Called on the scheduler with (display_id, results)
+
+        Returns:
+            bool: False if the display's queue is full
+        """
+        codes = tuple(codes)
+        # An identical pass still waiting in the queue is not queued twice
+        return self.workers.submit(display_id, lambda: self.read(display_id, codes),
+                                   lambda results: callback(display_id, results), key=("poll", codes))
+
+    def read_capabilities(self, display_id, cache):
+        """
+        Returns the capabilities of a display, from the cache if the monitor
+        is known. Runs on the worker thread.
+
+        Returns:
+            Capabilities: The parsed capabilities, or None if unavailable
+        """
+        monitor = self.monitors.get(display_id)
+        if monitor is None:
+            return None
+
+        text = cache.get(monitor.key)
+        if text is None:
+            started = time.perf_counter()
+            text = self.backend.capabilities(monitor.handle)
+            record_ddc(self.backend, display_id, "capabilities", 0xF3, time.perf_counter() - started,
+                       text is not None)
+            if text is None:
+                return None
+            cache.put(monitor.key, text)
+
+        try:
+            return parse_capabilities(text)
+        except ValueError as e:
+            log.warning("Display %s: %s", display_id, e)
+            return None
+
+    def capabilities(self, display_id, cache, callback):
+        """
+        Queues a capabilities request for a display.
+
+        Args:
+            display_id: Display to query
+            cache: CapabilitiesCache consulted first and updated on a miss
+            callback: Called on the scheduler with (display_id, capabilities)
+
+        Returns:
+            bool: False if the display's queue is full
+        """
+        return self.workers.submit(display_id, lambda: self.read_capabilities(display_id, cache),
+                                   lambda capabilities: callback(display_id, capabilities),
+                                   key=("capabilities",))
+
+
+class PollEntry:
+    """
+    Polling state of one VCP code on one display.
+    """
+    def __init__(self, interval, due):
+        self.interval = interval
+        self.due = due
+        self.boost = 0
+
+
+class PollSchedule:
+    """
+    Decides when each VCP code of each display is read.
+
+    Every code has its own interval. After a command the code is polled
+    boost_count times at boost_interval to confirm the change, and a display
+    whose reads fail is backed off exponentially up to max_backoff. Codes of
+    a display that fall due within window seconds of each other are read in
+    the same pass.
+
+    The schedule arms a single wake-up on the Scheduler for the earliest due
+    code and calls callback with a dict of display_id to due codes, so it
+    can be driven by a fake clock.
+    """
+    def __init__(self, scheduler, callback, interval=20, boost_interval=1, boost_count=3,
+                 max_backoff=300, window=1):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.interval = interval
+        self.boost_interval = boost_interval
+        self.boost_count = boost_count
+        self.max_backoff = max_backoff
+        self.window = window
+        self.entries = {}
+        self.failures = {}
+        self.suspended = set()
+        self.call = None
+
+    def add(self, display_id, code, interval=None):
+        """
+        Starts polling a VCP code, the first read is due immediately.
+        """
+        interval = self.interval if interval is None else interval
+        self.entries.setdefault(display_id, {})[code] = PollEntry(interval, self.scheduler.clock())
+        self.failures.setdefault(display_id, 0)
+        self.arm()
+
+    def set(self, display_id, poll):
+        """
+        Polls exactly the VCP codes of poll, a map of code to interval.
+
+        Codes already polled keep their schedule, their next read only moves
+        earlier if the interval got shorter. New codes are read immediately.
+        """
+        now = self.scheduler.clock()
+        entries = self.entries.setdefault(display_id, {})
+        for code in set(entries) - set(poll):
+            del entries[code]
+        for code, interval in poll.items():
+            entry = entries.get(code)
+            if entry is None:
+                entries[code] = PollEntry(interval, now)
+            elif entry.interval != interval:
+                entry.due = min(entry.due, now + interval)
+                entry.interval = interval
+        self.failures.setdefault(display_id, 0)
+        self.arm()
+
+    def remove(self, display_id, code=None):
+        """
+        Stops polling a VCP code, or every code of the display if code is None.
+        """
+        if code is None:
+            self.entries.pop(display_id, None)
+            self.failures.pop(display_id, None)
+            self.suspended.discard(display_id)
+        else:
+            self.entries.get(display_id, {}).pop(code, None)
+        self.arm()
+
+    def suspend(self, display_id):
+        """
+        Stops polling a display until resume(), keeping its codes and intervals.
+        """
+        self.suspended.add(display_id)
+        self.arm()
+
+    def resume(self, display_id):
+        """
+        Polls a suspended display again, starting right away.
+        """
+        self.suspended.discard(display_id)
+        now = self.scheduler.clock()
+        for entry in self.entries.get(display_id, {}).values():
+            entry.due = now
+        if display_id in self.failures:
+            self.failures[display_id] = 0
+        self.arm()
+
+    def boost(self, display_id, code):
+        """
+        Polls a code quickly for a while, e.g. after a command was sent.
+        """
+        entry = self.entries.get(display_id, {}).get(code)
+        if entry is None:
+            return
+        entry.boost = self.boost_count
+        entry.due = min(entry.due, self.scheduler.clock() + self.boost_interval)
+        self.arm()
+
+    def backoff(self, display_id):
+        """
+        Returns:
+            float: Extra delay applied to a display after consecutive failures
+        """
+        failures = self.failures.get(display_id, 0)
+        entries = self.entries.get(display_id)
+        if not failures or not entries:
+            return 0
+        interval = min(entry.interval for entry in entries.values())
+        return max(interval, min(interval * 2 ** failures, self.max_backoff))
+
+    def report(self, display_id, success):
+        """
+        Records the outcome of a polling pass, failures back off the whole display.
+        """
+        if display_id not in self.failures:
+            return
+        if success:
+            self.failures[display_id] = 0
+            return
+
+        self.failures[display_id] += 1
+        due = self.scheduler.clock() + self.backoff(display_id)
+        for entry in self.entries[display_id].values():
+            entry.due = max(entry.due, due)
+        self.arm()
+
+    def next_due(self):
+        due = [entry.due for display_id, entries in self.entries.items() if display_id not in self.suspended
+               for entry in entries.values()]
+        return min(due) if due else None
+
+    def arm(self):
+        if self.call is not None:
+            self.call.cancel()
+            self.call = None
+        deadline = self.next_due()
+        if deadline is not None:
+            self.call = self.scheduler.call_at(deadline, self.fire)
+
+    def fire(self):
+        self.call = None
+        now = self.scheduler.clock()
+        due = {}
+        for display_id, entries in self.entries.items():
+            if display_id in self.suspended or not any(entry.due <= now for entry in entries.values()):
+                continue
+            codes = []
+            for code, entry in entries.items():
+                if entry.due > now + self.window:
+                    continue
+                codes.append(code)
+                if entry.boost:
+                    entry.boost -= 1
+                entry.due = now + (self.boost_interval if entry.boost else entry.interval)
+            due[display_id] = codes
+
+        self.arm()
+        if due:
+            self.callback(due)
@@ -0,0 +1,60 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def decode_text(payload):
+    return payload.decode("utf-8")
+
+
+class Router:
+    """
+    Maps exact MQTT topics to pre-bound handlers.
+
+    Handlers are registered together with a codec that turns the raw
+    payload into the handler's argument, so dispatching a message is a
+    single dict lookup and topics that were never registered are dropped
+    without being parsed.
+    """
+    def __init__(self):
+        self.routes = {}
+        self.dispatched = 0
+        self.rejected = 0
+
+    def add(self, topic, handler, decode=decode_text):
+        """
+        Routes messages on topic to handler(decode(payload)).
+        """
+        self.routes[topic] = (handler, decode)
+
+    def remove(self, topic):
+        self.routes.pop(topic, None)
+
+    @property
+    def topics(self):
+        return list(self.routes)
+
+    def dispatch(self, topic, payload):
+        """
+        Calls the handler registered for a topic.
+
+        Returns:
+            bool: True if the message was handled, False if the topic is unknown
+                  or the payload could not be decoded
+        """
+        route = self.routes.get(topic)
+        if route is None:
+            self.rejected += 1
+            return False
+
+        handler, decode = route
+        try:
+            value = decode(payload)
+        except (UnicodeDecodeError, ValueError) as e:
+            log.warning("Invalid payload on %s: %s", topic, e)
+            self.rejected += 1
+            return False
+
+        self.dispatched += 1
+        handler(value)
+        return True
@@ -0,0 +1,148 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from metrics import LOOP_SECONDS
+
+log = logging.getLogger(__name__)
+
+
+class ScheduledCall:
+    """
+    A callback registered with the Scheduler, can be cancelled before it runs.
+    """
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Event loop that sleeps until the next timer deadline or posted callback.
+
+    Callbacks always run on the thread that calls run(), so state owned by
+    the service never needs locking. Other threads (the MQTT network thread,
+    DDC workers) hand work over with call_soon(), which wakes the loop
+    immediately.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.timers = []
+        self.ready = deque()
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+
+    def call_soon(self, callback, *args):
+        """
+        Runs a callback on the loop thread as soon as possible. Thread-safe.
+
+        Returns:
+            ScheduledCall: Handle that can be used to cancel the call
+        """
+        call = ScheduledCall(None, callback, args)
+        with self.condition:
+            self.ready.append(call)
+            self.condition.notify()
+        return call
+
+    def call_at(self, deadline, callback, *args):
+        """
+        Runs a callback once the clock reaches the given deadline. Thread-safe.
+
+        Returns:
+            ScheduledCall: Handle that can be used to cancel the call
+        """
+        call = ScheduledCall(deadline, callback, args)
+        with self.condition:
+            heapq.heappush(self.timers, (deadline, next(self.counter), call))
+            self.condition.notify()
+        return call
+
+    def call_later(self, delay, callback, *args):
+        """
+        Runs a callback after the given delay in seconds. Thread-safe.
+
+        Returns:
+            ScheduledCall: Handle that can be used to cancel the call
+        """
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def next_deadline(self):
+        """
+        Returns:
+            float: Deadline of the earliest pending timer, or None if there is none
+        """
+        with self.condition:
+            while self.timers and self.timers[0][2].cancelled:
+                heapq.heappop(self.timers)
+            return self.timers[0][0] if self.timers else None
+
+    def run_once(self, timeout=None):
+        """
+        Waits for due work and runs it.
+
+        Args:
+            timeout: Maximum number of seconds to wait, None waits indefinitely
+
+        Returns:
+            int: Number of callbacks that were run
+        """
+        with self.condition:
+            if not self.ready:
+                wait = timeout
+                deadline = None
+                while self.timers and self.timers[0][2].cancelled:
+                    heapq.heappop(self.timers)
+                if self.timers:
+                    deadline = self.timers[0][0]
+                    delay = max(0, deadline - self.clock())
+                    wait = delay if wait is None else min(wait, delay)
+                if wait is None or wait > 0:
+                    self.condition.wait(wait)
+
+            now = self.clock()
+            while self.timers and self.timers[0][0] <= now:
+                _, _, call = heapq.heappop(self.timers)
+                self.ready.append(call)
+
+            batch = self.ready
+            self.ready = deque()
+
+        count = 0
+        started = time.perf_counter()
+        for call in batch:
+            if call.cancelled:
+                continue
+            count += 1
+            try:
+                call.callback(*call.args)
+            except Exception:
+                log.exception("Error in scheduled callback %s", call.callback)
+        if count:
+            LOOP_SECONDS.observe(time.perf_counter() - started)
+        return count
+
+    def run(self):
+        """
+        Runs the loop until stop() is called.
+        """
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        """
+        Stops the loop after the current batch of callbacks. Thread-safe.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
@@ -0,0 +1,209 @@
+import random
+import threading
+import time
+
+from backend import DDCBackend
+from edid import build_edid
+
+# VCP codes every simulated monitor answers, as code: (value, maximum)
+DEFAULT_VCP = {
+    0x10: (50, 100),   # Brightness
+    0x12: (50, 100),   # Contrast
+    0x60: (15, 0x12),  # Input source, DisplayPort
+    0x62: (30, 100),   # Volume
+    0xD6: (1, 5),      # Power mode, on
+    0xDC: (0, 16),     # Gamer mode, off
+}
+
+DEFAULT_CAPABILITIES = (
+    "(prot(monitor)type(LCD)model(SIM)cmds(01 02 03 07 0C E3 F3)"
+    "vcp(10 12 60(0F 11) 62 D6(01 04 05) DC(00 0B 0C 0D 0E 0F 10))mccs_ver(2.2))"
+)
+
+
+class SimulatedMonitor:
+    """
+    In-memory state of one simulated physical monitor.
+    """
+    def __init__(self, description="Simulated Monitor", vcp=None, capabilities=DEFAULT_CAPABILITIES, edid=None):
+        self.description = description
+        self.vcp = {code: list(entry) for code, entry in (vcp or DEFAULT_VCP).items()}
+        self.capabilities = capabilities
+        self.edid = edid
+        # Acknowledged writes not yet visible to reads, as code: (value, visible_at)
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    @property
+    def asleep(self):
+        """
+        True while the power mode (VCP 0xD6) is anything but on.
+        """
+        return 0xD6 in self.vcp and self.vcp[0xD6][0] != 1
+
+    def apply_pending(self, now):
+        for code, (value, visible_at) in list(self.pending.items()):
+            if now >= visible_at:
+                self.vcp[code][0] = value
+                del self.pending[code]
+
+
+class SimulatedHandle:
+    """
+    Handle to a SimulatedMonitor, a new one is issued on every enumeration.
+    """
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.closed = False
+
+
+class SimulatedBackend(DDCBackend):
+    """
+    Deterministic in-memory DDC backend for benchmarks and headless runs.
+
+    Args:
+        monitors: Number of monitors or a list of SimulatedMonitor instances
+        latency: Seconds each VCP call takes
+        enumerate_latency: Seconds each enumeration takes
+        capabilities_latency: Seconds a capabilities request takes
+        failure_rate: Probability in [0, 1] that a VCP call fails
+        ignore_rate: Probability in [0, 1] that a write is acknowledged but not applied
+        apply_delay: Seconds before an acknowledged write shows up in reads
+        timeout: Seconds a call to a monitor in standby blocks before failing,
+                 only its power mode still answers
+        seed: Seed of the failure injection random generator
+    """
+    name = "simulator"
+
+    def __init__(self, monitors=2, latency=0.0, enumerate_latency=0.0, capabilities_latency=0.0,
+                 failure_rate=0.0, ignore_rate=0.0, apply_delay=0.0, timeout=0.0, seed=0):
+        if isinstance(monitors, int):
+            monitors = [SimulatedMonitor(f"Simulated Monitor {i}",
+                                         edid=build_edid("SIM", 1, i + 1, f"SIM{i:05d}", f"Simulated {i}"))
+                        for i in range(monitors)]
+        self.monitors = monitors
+        self.latency = latency
+        self.enumerate_latency = enumerate_latency
+        self.capabilities_latency = capabilities_latency
+        self.failure_rate = failure_rate
+        self.ignore_rate = ignore_rate
+        self.apply_delay = apply_delay
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.open_handles = 0
+        self.calls = {"enumerate": 0, "get": 0, "set": 0, "capabilities": 0}
+        self.generation = 0
+        self.errors = threading.local()
+
+    def inject_failures(self, count):
+        """
+        Makes the next count VCP calls fail regardless of failure_rate.
+        """
+        with self.lock:
+            self.failures += count
+
+    def plug(self, monitor):
+        """
+        Attaches a monitor, changing the topology.
+        """
+        with self.lock:
+            self.monitors.append(monitor)
+            self.generation += 1
+
+    def unplug(self, monitor):
+        """
+        Detaches a monitor, changing the topology.
+        """
+        with self.lock:
+            self.monitors.remove(monitor)
+            self.generation += 1
+
+    def should_fail(self, name):
+        with self.lock:
+            self.calls[name] += 1
+            if self.failures > 0:
+                self.failures -= 1
+                failed = True
+            else:
+                failed = self.failure_rate > 0 and self.random.random() < self.failure_rate
+        if failed:
+            self.errors.code = "injected"
+        return failed
+
+    def enumerate(self):
+        if self.enumerate_latency:
+            time.sleep(self.enumerate_latency)
+        with self.lock:
+            self.calls["enumerate"] += 1
+            self.open_handles += len(self.monitors)
+            return [(SimulatedHandle(monitor), monitor.description) for monitor in self.monitors]
+
+    def topology(self):
+        return self.generation
+
+    def edid(self, handle):
+        return handle.monitor.edid
+
+    def attached(self, handle):
+        """
+        Returns False once a handle was closed or its monitor unplugged.
+        """
+        with self.lock:
+            return not handle.closed and handle.monitor in self.monitors
+
+    def get_vcp(self, handle, code):
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.attached(handle) or self.should_fail("get"):
+            return None, None
+        monitor = handle.monitor
+        if code != 0xD6 and monitor.asleep:
+            time.sleep(self.timeout)
+            return None, None
+        with monitor.lock:
+            if code not in monitor.vcp:
+                return None, None
+            monitor.apply_pending(time.monotonic())
+            value, maximum = monitor.vcp[code]
+        return value, maximum
+
+    def set_vcp(self, handle, code, value):
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.attached(handle) or self.should_fail("set"):
+            return False
+        with self.lock:
+            ignored = self.ignore_rate > 0 and self.random.random() < self.ignore_rate
+        monitor = handle.monitor
+        if code != 0xD6 and monitor.asleep:
+            time.sleep(self.timeout)
+            return False
+        with monitor.lock:
+            if code not in monitor.vcp:
+                return False
+            if not ignored:
+                monitor.pending[code] = (min(value, monitor.vcp[code][1]), time.monotonic() + self.apply_delay)
+                monitor.apply_pending(time.monotonic())
+        return True
+
+    def capabilities(self, handle):
+        if self.capabilities_latency:
+            time.sleep(self.capabilities_latency)
+        with self.lock:
+            self.calls["capabilities"] += 1
+        if not self.attached(handle):
+            return None
+        return handle.monitor.capabilities
+
+    def last_error(self):
+        return getattr(self.errors, "code", None)
+
+    def close(self, handle):
+        if handle.closed:
+            return False
+        handle.closed = True
+        with self.lock:
+            self.open_handles -= 1
+        return True
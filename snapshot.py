@@ -0,0 +1,85 @@
+import json
+import logging
+
+from capabilities import write_atomic
+
+log = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+class Snapshot:
+    """
+    The last confirmed state of the bridge, persisted to a JSON file.
+
+    Holds the monitor each display was bound to, the VCP values last read
+    or confirmed on it, and the hashes of the discovery configs left on the
+    broker, so a restart can publish states and accept commands before
+    the monitors answered. The file is replaced atomically and only
+    written when its content changed.
+
+    Args:
+        path: JSON file holding the snapshot
+    """
+    def __init__(self, path):
+        self.path = path
+        self.saved = None
+
+    def load(self):
+        """
+        Reads the snapshot, which is ignored as a whole if anything in it is invalid.
+
+        Returns:
+            tuple: Display id as a string to (monitor key, {code: (current, maximum)}),
+                   and discovery config topic to payload hash, both empty without a snapshot
+        """
+        try:
+            with open(self.path, "r") as file:
+                data = json.load(file)
+            if data.get("version") != VERSION:
+                raise ValueError(f"unknown version {data.get('version')!r}")
+            displays = {
+                display_id: (entry["monitor"], {int(code): (current, maximum)
+                                                for code, (current, maximum) in entry["vcp"].items()})
+                for display_id, entry in data["displays"].items()
+            }
+            discovery = dict(data["discovery"])
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            log.warning("Ignoring snapshot %s: %s", self.path, e)
+            return {}, {}
+        self.saved = self.serialize(data)
+        return displays, discovery
+
+    def serialize(self, data):
+        return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+    def save(self, displays, discovery):
+        """
+        Writes the snapshot unless it is unchanged.
+
+        Args:
+            displays: Display id to (monitor key or None, {code: (current, maximum)})
+            discovery: Discovery config topic to payload hash
+
+        Returns:
+            bool: True if the file was written
+        """
+        text = self.serialize({
+            "version": VERSION,
+            "displays": {
+                str(display_id): {"monitor": monitor, "vcp": {str(code): list(value) for code, value in vcp.items()}}
+                for display_id, (monitor, vcp) in displays.items()
+            },
+            "discovery": discovery,
+        })
+        if text == self.saved:
+            return False
+        try:
+            write_atomic(self.path, text)
+        except OSError as e:
+            log.warning("Could not save snapshot %s: %s", self.path, e)
+            return False
+        self.saved = text
+        return True
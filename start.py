@@ -1,356 +1,908 @@
 from mqtt_client import MQTTClient
-from timer import Timer
-from timeit import default_timer as timer
+from scheduler import Scheduler
+from workers import WorkerPool
+from poller import Poller, PollSchedule
+from commands import CommandWriter
+from config import RESTART_SECTIONS, ConfigWatcher, config_path, load_config, validate_config
+from state import StateCache
+from router import Router, decode_text
+from functools import partial
 import yaml
 import json
-from devices import display_device, display_input_entity, gamer_mode_entity
-from ddc import (
-    get_physical_monitors, get_input_source, set_input_source,
-    INPUT_SOURCE_DP, INPUT_SOURCE_HDMI,
-    set_gamer_mode, get_gamer_mode,
-    GAMER_MODE_OFF, GAMER_MODE_FPS, GAMER_MODE_RTS,
-    GAMER_MODE_RACING, GAMER_MODE_GAMER1, GAMER_MODE_GAMER2, GAMER_MODE_GAMER3
+from discovery import (
+    Discovery, render_device, render_group_device, render_number, render_scene, render_select, render_shared
 )
+from monitors import MonitorRegistry
+from backend import get_backend
+from features import compile_display, compile_displays, compile_groups, compile_presets, preset_feature
+from throttle import Throttle
+from health import POWER_MODE, DisplayHealth
+from capabilities import CapabilitiesCache, parse_capabilities
+from snapshot import Snapshot
+from control import ControlServer
+from timer import Timer
+import metrics
+import time
+import logs
+import logging
+
+log = logging.getLogger("service")
 
 class Service:
-    def __init__(self):
-        self.dt = 0
+    def __init__(self, config=None, path=None):
+        self.scheduler = Scheduler()
         
-        try:
-            with open("config.yml", "r") as config:
-                config = yaml.safe_load(config)
-        except Exception as e:
-            with open("rename_to_config.yml", "r") as config:
-                config = yaml.safe_load(config)
+        if config is None:
+            path = path or config_path()
+            config = load_config(path)
+        validate_config(config)
+        self.config = config
+        
+        log_options = config.get("logging") or {}
+        self.log_listener = logs.setup(log_options.get("level", "INFO"),
+                                       log_options.get("rate_limit", 300),
+                                       log_options.get("levels"))
                 
         self.mqtt = MQTTClient(config["mqtt"]["username"],
                             config["mqtt"]["password"],
                             config["mqtt"]["host"],
-                            config["mqtt"]["port"])
+                            config["mqtt"]["port"],
+                            self.scheduler,
+                            config["mqtt"].get("availability_topic", "winddc/bridge/availability"),
+                            **(config["mqtt"].get("reconnect") or {}))
         
         poll_interval = 20 if "interval" not in config else config["interval"]
         
         self.mqtt.delegate = self
+        self.router = Router()
         
-        self.inputs = {}
-        self.gamer_modes = {}
-        display_data = config['display']
+        # Unchanged states are only resent after the heartbeat or when Home Assistant restarts
+        self.states = StateCache(self.mqtt, config.get("heartbeat", 300) or None)
+        self.birth_topic = config["mqtt"].get("birth_topic", "homeassistant/status")
+        self.subscribe(self.birth_topic, self.on_birth)
         
-        print(display_data)
-
-        self.inputs = {}
-        self.gamer_modes = {}
-        
-        for display in display_data:
-            display_id = display['id']
-            self.inputs[display_id] = {
-                "select": None,
-                "inputs": display['inputs']  # Store the input sources and their codes
-            }
-            self.gamer_modes[display_id] = { "select": None }
-            
-            for input_name, input_code in display['inputs'].items():
-                self.create_input_select(display_id, input_name, input_code)
-            
-            self.create_gamer_mode_select(display_id)
-            
-        self.timer = Timer(poll_interval, self)
-        self.update_inputs_states()
-        self.update_gamer_modes_states()
-        
-    def update_inputs_states(self):
-        monitors = get_physical_monitors()
-        for display_id in self.inputs.keys():
-            if display_id < len(monitors):
-                monitor_handle = monitors[display_id][0]
-                input_code = get_input_source(monitor_handle)
-                
-                print(f"Input code is {input_code}")
-                
-                # Map input codes to their corresponding names
-                input_map = {
-                    INPUT_SOURCE_DP: "DisplayPort",
-                    INPUT_SOURCE_HDMI: "HDMI"
-                    # Add more mappings as needed
-                }
-                
-                current_input_name = input_map.get(input_code, "Unknown")
-                
+        ddc_options = dict(config.get("ddc") or {})
+        backend_options = {key: value for key, value in ddc_options.items()
+                           if key not in ("backend", "poll_delay", "capabilities", "capabilities_cache")}
+        self.backend = get_backend(ddc_options.get("backend", "auto"), **backend_options)
+        self.monitors = MonitorRegistry(self.backend)
+        self.workers = WorkerPool(self.scheduler.call_soon, config.get("queue_size", 16))
+        self.poller = Poller(self.backend, self.monitors, self.workers, ddc_options.get("poll_delay", 0.05))
+        command_options = dict(config.get("commands") or {})
+        self.throttle = Throttle(self.scheduler, command_options.pop("throttle", 0.25))
+        self.writer = CommandWriter(self.backend, self.monitors, self.workers, **command_options)
+        self.poll_schedule = PollSchedule(self.scheduler, self.on_poll_due, poll_interval,
+                                          **(config.get("polling") or {}))
+        
+        self.setup_metrics(config.get("metrics") or {})
+        
+        # Name <-> code maps of every display, rebuilt once the capabilities of the monitor are known
+        self.poll_interval = poll_interval
+        self.display_configs = {display["id"]: display for display in config["display"]}
+        self.displays = compile_displays(config, poll_interval)
+        
+        # Capabilities are slow to read, they are cached per monitor across restarts
+        self.capabilities = None
+        if ddc_options.get("capabilities", True):
+            self.capabilities = CapabilitiesCache(ddc_options.get("capabilities_cache", "capabilities.json"))
+        
+        # Capabilities of each display once read, None if they could not be read
+        self.display_capabilities = {}
+        # Displays whose capabilities are being read
+        self.pending = set()
+        
+        # Displays in standby or not answering are only probed until they are back
+        self.health_options = dict(config.get("health") or {})
+        self.health = {}
+        self.probes = {}
+        
+        # Last values read from each display, as VCP code: (current, maximum)
+        self.vcp_state = {}
+        # Entities of each display id, of each ("group", name) and ("preset", name), by key
+        self.entities = {}
+        # Entities created during a reload, the others are removed once it finishes
+        self.registered = None
+        # Each display can publish the states of all its entities as one JSON document
+        self.json_state = config.get("json_state", False)
+        # Displays whose document is published once the current updates are done, and if forced
+        self.documents = {}
+        self.discovery = Discovery(self.mqtt)
+        
+        # The last confirmed states are published at startup, before the monitors answer
+        self.snapshot = None
+        self.snapshot_timer = None
+        saved, published = {}, {}
+        snapshot_options = config.get("snapshot", {})
+        if snapshot_options is not False:
+            snapshot_options = snapshot_options or {}
+            self.snapshot = Snapshot(snapshot_options.get("path", "snapshot.json"))
+            saved, published = self.snapshot.load()
+            self.snapshot_timer = Timer(snapshot_options.get("interval", 10), self, self.scheduler)
+        self.discovery.restore(published)
+        self.saved = {display_id: saved[str(display_id)] for display_id in self.displays if str(display_id) in saved}
+        # Monitor each display was bound to in the snapshot, until its capabilities confirm it
+        self.snapshot_monitors = {}
+        
+        for display in self.displays.values():
+            self.start_display(display)
+        
+        self.groups = compile_groups(config)
+        for group in self.groups.values():
+            self.add_group(group)
+        
+        self.presets = compile_presets(config)
+        self.preset_attributes = {}
+        for index, preset in enumerate(self.presets.values()):
+            self.add_preset(preset, full_device=index == 0)
+        
+        self.discovery.publish()
+        if not self.pending:
+            self.discovery.remove_stale()
+        
+        # Local clients such as hotkeys send commands without the broker round trip
+        self.control = None
+        control_options = dict(config.get("control") or {})
+        if control_options.get("port"):
+            self.control = ControlServer(self, **control_options)
+        
+        # Edits of the config file are applied without restarting
+        self.watcher = None
+        reload_interval = config.get("reload", 2)
+        if path is not None and reload_interval:
+            self.watcher = ConfigWatcher(path, self.scheduler, self.reload, reload_interval)
+    
+    def start_display(self, display):
+        """
+        Binds a display to its monitor and creates its entities, after reading its capabilities if enabled.
+        """
+        self.vcp_state.setdefault(display.id, {})
+        self.health.setdefault(display.id, DisplayHealth(**self.health_options))
+        
+        # Displays with a serial follow their monitor, the others use the enumeration order
+        self.monitors.assign(display.id, self.display_configs[display.id].get("serial"))
+        
+        saved = self.saved.pop(display.id, None)
+        if saved is not None:
+            monitor, values = saved
+            self.vcp_state[display.id].update(values)
+        
+        # Entities are created once the capabilities are read, or right away without them
+        if self.capabilities is not None and self.poller.capabilities(display.id, self.capabilities,
+                                                                      self.on_capabilities):
+            self.pending.add(display.id)
+            if saved is not None:
+                self.snapshot_monitors[display.id] = monitor
+                self.warm_start(display.id, monitor)
+        else:
+            self.add_display(display)
+            self.publish_states(display.id)
+    
+    def warm_start(self, display_id, monitor):
+        """
+        Creates the entities of a display from the cached capabilities of its monitor in the
+        snapshot, while the capabilities of the monitor actually attached are read.
+        """
+        text = self.capabilities.get(monitor) if monitor is not None else None
+        if text is None:
+            return
+        try:
+            capabilities = parse_capabilities(text)
+        except ValueError:
+            return
+        self.displays[display_id] = compile_display(self.display_configs[display_id], self.poll_interval,
+                                                    capabilities)
+        self.add_display(self.displays[display_id])
+        self.publish_states(display_id)
+    
+    def stop_display(self, display_id):
+        """
+        Stops polling and probing a display and forgets its capabilities and health.
+        """
+        self.poll_schedule.remove(display_id)
+        self.pending.discard(display_id)
+        self.snapshot_monitors.pop(display_id, None)
+        self.display_capabilities.pop(display_id, None)
+        self.health.pop(display_id, None)
+        probe = self.probes.pop(display_id, None)
+        if probe is not None:
+            probe.cancel()
+    
+    def add_display(self, display):
+        """
+        Creates the entities of a display and starts polling it.
+        """
+        # The first entity carries the display's device block for all of them
+        for index, feature in enumerate(display.features.values()):
+            self.create_entity(display.id, feature, full_device=index == 0, model=display.model)
+        
+        self.poll_schedule.set(display.id, display.poll)
+    
+    def add_group(self, group):
+        """
+        Creates the entities of a group of displays.
+        """
+        unknown = [display_id for display_id in group.displays if display_id not in self.displays]
+        if unknown:
+            log.warning("Group %s lists unknown displays %s", group.name, unknown)
+        
+        owner = ("group", group.name)
+        for index, feature in enumerate(group.features.values()):
+            entity = render_number(f"group_{group.name}_{feature.key}", feature, self.mqtt.availability_topic,
+                                   render_group_device(group.name, full=index == 0))
+            if self.add_entity(owner, feature.key, entity, partial(self.group_command, group.name, feature.key)):
+                # Groups have no state of their own to wait for
+                self.mqtt.publish(entity.availability_topic, "online", retain=True)
+    
+    def add_preset(self, preset, full_device=True):
+        """
+        Creates the scene entity of a preset.
+        """
+        unknown = [display_id for display_id in preset.displays if display_id not in self.displays]
+        if unknown:
+            log.warning("Preset %s lists unknown displays %s", preset.name, unknown)
+        
+        entity = render_scene(preset.name, self.mqtt.availability_topic, full_device)
+        if self.add_entity(("preset", preset.name), "scene", entity, partial(self.apply_preset, preset.name)):
+            self.mqtt.publish(entity.availability_topic, "online", retain=True)
+        self.preset_attributes[preset.name] = entity.config["json_attributes_topic"]
+    
+    def on_capabilities(self, display_id, capabilities):
+        """
+        Rebuilds the features of a display from its capabilities and creates its entities.
+        """
+        if display_id not in self.pending:
+            return  # Removed from the config meanwhile
+        self.pending.discard(display_id)
+        self.display_capabilities[display_id] = capabilities
+        
+        if capabilities is None:
+            log.warning("Could not read the capabilities of display %s, using config.yml only", display_id)
+        else:
+            log.info("Display %s is a %s supporting VCP codes %s", display_id, capabilities.model or "monitor",
+                     " ".join(f"{code:02X}" for code in sorted(capabilities.vcp)))
+        self.displays[display_id] = compile_display(self.display_configs[display_id], self.poll_interval,
+                                                    capabilities)
+        
+        # Values from the snapshot only stand for the monitor they were read from
+        if display_id in self.snapshot_monitors and self.snapshot_monitors.pop(display_id) != \
+                self.monitors.key(display_id):
+            log.info("Display %s is bound to another monitor than in the snapshot, reading it again", display_id)
+            self.vcp_state[display_id] = {}
+        
+        # Entities created from the snapshot that the monitor does not support are removed
+        warm = bool(self.entities.get(display_id))
+        if warm:
+            self.registered = set()
+        self.add_display(self.displays[display_id])
+        if warm:
+            for key in [key for key in self.entities[display_id] if (display_id, key) not in self.registered]:
+                self.remove_entity(display_id, key)
+            self.registered = None
+        self.publish_states(display_id)
+        
+        self.discovery.publish()
+        if not self.pending:
+            self.discovery.remove_stale()
+        
+    def on_poll(self, display_id, results):
+        """
+        Stores the values read by a polling pass and updates Home Assistant.
+        """
+        if display_id not in self.displays:
+            return  # Removed from the config meanwhile
+        if results is None:
+            self.poll_schedule.report(display_id, False)
+        else:
+            log.debug("Display %s read %s", display_id, results)
+            # Codes the monitor does not support fail on every pass, only a pass without any answer backs off
+            self.poll_schedule.report(display_id, any(current is not None for current, _ in results.values()))
+            self.vcp_state[display_id].update(results)
+        
+        self.update_health(display_id, results)
+        if results is None or not self.health[display_id].active:
+            return  # Monitor is not connected or asleep, its entities are unavailable
+        
+        features = self.displays[display_id].by_code
+        for code, (current, maximum) in results.items():
+            feature = features.get(code)
+            if feature is not None and current is not None:
                 # Update the state in Home Assistant
-                self.mqtt.client.publish(self.inputs[display_id]["select"]["topic"], current_input_name, retain=True)
-                self.inputs[display_id]["select"]["state"] = current_input_name
+                self.update_state(display_id, feature.key, feature.state_for(current, maximum))
             
-    def update_gamer_modes_states(self):
-        monitors = get_physical_monitors()
-        for display_id in self.gamer_modes.keys():
-            if display_id < len(monitors):
-                monitor_handle = monitors[display_id][0]
-                current_mode_code = get_gamer_mode(monitor_handle)
-                
-                # Debug log
-                print(f"Checking Gamer Mode for display {display_id}. Current mode code: {current_mode_code}")
-                
-                # Map mode codes to their corresponding names
-                mode_map = {
-                    GAMER_MODE_OFF: "OFF",
-                    GAMER_MODE_FPS: "FPS",
-                    GAMER_MODE_RTS: "RTS",
-                    GAMER_MODE_RACING: "Racing",
-                    GAMER_MODE_GAMER1: "Gamer 1",
-                    GAMER_MODE_GAMER2: "Gamer 2",
-                    GAMER_MODE_GAMER3: "Gamer 3"
-                }
-                
-                current_mode_name = mode_map.get(current_mode_code, "OFF")
-                
-                # Update the state in Home Assistant
-                self.mqtt.client.publish(self.gamer_modes[display_id]["select"]["topic"], current_mode_name, retain=True)
-                self.gamer_modes[display_id]["select"]["state"] = current_mode_name
+    def update_health(self, display_id, results):
+        """
+        Suspends polling and marks the entities of a display unavailable while it is
+        in standby or not answering, and restores them once it is back.
+        """
+        health = self.health[display_id]
+        if health.report(results):
+            log.info("Display %s is %s", display_id, health.state)
+            entities = self.entities.get(display_id, {}).values()
+            # Entities of a display may share one availability topic
+            if health.active:
+                self.poll_schedule.resume(display_id)
+                for topic in {entity["availability"] for entity in entities if entity["state"] is not None}:
+                    self.mqtt.publish(topic, "online", retain=True)
+            else:
+                self.poll_schedule.suspend(display_id)
+                for topic in {entity["availability"] for entity in entities}:
+                    self.mqtt.publish(topic, "offline", retain=True)
+        
+        if not health.active and display_id not in self.probes:
+            self.probes[display_id] = self.scheduler.call_later(health.probe_interval, self.probe, display_id)
+    
+    def probe(self, display_id):
+        """
+        Reads a display that is not active with a single request, to notice when it is back.
+        """
+        del self.probes[display_id]
+        display = self.displays.get(display_id)
+        if display is None or self.health[display_id].active or not display.poll:
+            return
+        
+        # Displays that were unplugged are only found again by enumerating
+        self.monitors.check_topology()
+        
+        # The power mode if the monitor reports it, else any code it is polled for
+        codes = [POWER_MODE] if POWER_MODE in display.poll else list(display.poll)[:1]
+        if not self.poller.poll(display_id, codes, self.on_poll):
+            self.probes[display_id] = self.scheduler.call_later(self.health[display_id].probe_interval,
+                                                                self.probe, display_id)
+    
+    def update_state(self, owner, key, state, force=False):
+        """
+        Publishes the state of an entity of a display or group.
+        """
+        entities = self.entities.get(owner, {})
+        entity = entities.get(key)
+        if entity is None:
+            return  # Written through a group, the display has no entity of its own
+        if entity["state"] is None and not any(other["state"] is not None and other["availability"] ==
+                                               entity["availability"] for other in entities.values()):
+            # The entity stays unavailable until its first real state is known
+            self.mqtt.publish(entity["availability"], "online", retain=True)
+        entity["state"] = state
+        if entity["shared"]:
+            self.queue_document(owner, force)
+        else:
+            self.states.publish(entity["topic"], state, force)
+    
+    def queue_document(self, display_id, force=False):
+        """
+        Publishes the JSON state document of a display once the current batch of updates is done.
+        """
+        if display_id not in self.documents:
+            self.scheduler.call_soon(self.publish_document, display_id)
+        self.documents[display_id] = self.documents.get(display_id, False) or force
+    
+    def publish_document(self, display_id):
+        """
+        Publishes the states of every entity of a display as one JSON document.
+        """
+        force = self.documents.pop(display_id)
+        entities = [entity for entity in self.entities.get(display_id, {}).values() if entity["shared"]]
+        if not entities:
+            return  # Removed meanwhile
+        document = {key: entity["state"] for key, entity in self.entities[display_id].items()
+                    if entity["shared"] and entity["state"] is not None}
+        self.states.publish(entities[0]["topic"], json.dumps(document, sort_keys=True, separators=(",", ":")),
+                            force)
             
     def on_message(self, topic, payload):
         """
-        Handles MQTT messages for input source select and Gamer Mode select entities.
+        Handles MQTT messages through the routes registered with subscribe().
         """
-        print(f"Received message on topic: {topic}, payload: {payload}")  # Debug print
-
-        if payload == 'OFF':
-            return  # Do nothing
-        
-        # Split the topic into parts
-        parts = topic.split("/")
+        log.debug("Received %r on %s", payload, topic)
+        self.router.dispatch(topic, payload)
+    
+    def subscribe(self, topic, handler, decode=decode_text):
+        """
+        Subscribes to a topic and routes its messages to handler(decode(payload)).
+        """
+        if topic not in self.router.routes:
+            self.mqtt.subscribe(topic)
+        self.router.add(topic, handler, decode)
+    
+    def unsubscribe(self, topic):
+        self.router.remove(topic)
+        self.mqtt.unsubscribe(topic)
+    
+    def on_birth(self, status):
+        if status == "online":
+            # Home Assistant restarted, send discovery and every state again
+            self.discovery.publish(force=True)
+            self.states.refresh()
+            log.info("Home Assistant is online, republished states %s", self.states.stats())
+    
+    def command(self, display_id, key, payload, callback=None):
+        """
+        Writes the VCP value of a command from Home Assistant or the control API to the monitor.
         
-        # Ensure the topic has the correct structure
-        if len(parts) < 4:
-            print(f"Invalid topic structure: {topic}")
+        Args:
+            callback: Called with the WriteResult, or None if the command was not written. Commands
+                      with a callback are written right away instead of being throttled.
+        """
+        feature = self.displays[display_id].features[key]
+        _, maximum = self.vcp_state[display_id].get(feature.code, (None, None))
+        value = feature.value_for(payload, maximum)
+        if value is None:
+            log.warning("Invalid %s for display %s: %s", feature.name, display_id, payload)
+            self.revert_state(display_id, key)
+            if callback is not None:
+                callback(None)
             return
         
-        # Extract display_id and command type
-        try:
-            # Extract display_id and command_type from the 3rd part of the topic
-            # Example: "display_0_gamer_mode" -> display_id = 0, command_type = "gamer_mode"
-            display_part = parts[2]  # "display_0_gamer_mode"
-            display_parts = display_part.split("_")  # Split into ["display", "0", "gamer", "mode"]
-            
-            display_id = int(display_parts[1])  # Extract display_id from "0"
-            command_type = "_".join(display_parts[2:])  # Combine "gamer" and "mode" to get "gamer_mode"
-        except (IndexError, ValueError) as e:
-            print(f"Failed to parse display_id or command_type from topic: {topic}. Error: {e}")
+        if callback is not None:
+            self.write_feature(display_id, feature, value, callback)
+            return
+        # A slider drag sends a burst of commands, only some of them are written
+        self.throttle.call((display_id, key), self.write_feature, display_id, feature, value)
+    
+    def write_feature(self, display_id, feature, value, callback=None):
+        """
+        Queues a verified write, callback is then called with the WriteResult.
+        """
+        if not self.health[display_id].active:
+            log.info("Display %s is %s, not sending %s command", display_id, self.health[display_id].state,
+                     feature.name)
+            self.revert_state(display_id, feature.key)
+            if callback is not None:
+                callback(None)
             return
         
-        print(f"Display ID: {display_id}, Command Type: {command_type}")  # Debug print
+        # Repeated writes while queued only send the last one
+        if not self.writer.submit(display_id, feature.code, value,
+                                  partial(self.on_written, display_id, feature, value, callback)):
+            log.warning("Display %s is busy, dropping %s command", display_id, feature.name)
+            self.revert_state(display_id, feature.key)
+            if callback is not None:
+                callback(None)
+            
+    def on_written(self, display_id, feature, value, callback, result):
+        """
+        Publishes the value the monitor confirmed, or reverts Home Assistant to the last known state.
+        """
+        if result is not None and result.confirmed:
+            # A write replaced by a later one while queued is confirmed with the later value
+            log.debug("Display %s confirmed %s %s after %d attempts in %.3fs",
+                      display_id, feature.name, result.value, result.attempts, result.seconds)
+            self.vcp_state[display_id][feature.code] = (result.value, result.maximum)
+            self.update_state(display_id, feature.key, feature.state_for(result.value, result.maximum))
+        else:
+            log.warning("Failed to set %s of display %s to %s: %s", feature.name, display_id, value,
+                        result.outcome if result is not None else "monitor not found")
+            if result is not None and result.value is not None:
+                # The monitor answered with another value, that is the real state
+                self.vcp_state[display_id][feature.code] = (result.value, result.maximum)
+                self.update_state(display_id, feature.key, feature.state_for(result.value, result.maximum),
+                                  force=True)
+            else:
+                self.revert_state(display_id, feature.key)
+            # Read it again soon in case the monitor applies the value late
+            self.poll_schedule.boost(display_id, feature.code)
         
-        if command_type == "input":
-            # The payload contains the selected input source (e.g., "HDMI" or "DisplayPort")
-            selected_input = payload.decode("utf-8")  # Get the selected input source
-            self.activate_input(display_id, selected_input)
-        elif command_type == "gamer_mode":
-            selected_mode = payload.decode("utf-8")  # Get the selected Gamer Mode
-            self.set_gamer_mode(display_id, selected_mode)
+        if callback is not None:
+            callback(result)
+    
+    def revert_state(self, owner, key):
+        """
+        Sends the last known state again, so Home Assistant drops the value it just sent.
+        """
+        entity = self.entities.get(owner, {}).get(key)
+        if entity is None or entity["state"] is None:
+            return
+        if entity["shared"]:
+            self.queue_document(owner, force=True)
         else:
-            print(f"Unknown command type: {command_type}")
+            self.states.publish(entity["topic"], entity["state"], force=True)
     
-    def activate_input_deactivate_rest(self, display_id, input_name):
-        print(f"Display {display_id} name {input_name}")
+    def group_command(self, name, key, payload):
+        """
+        Sets a number feature on every display of a group.
+        """
+        feature = self.groups[name].features[key]
+        if feature.value_for(payload) is None:
+            log.warning("Invalid %s for group %s: %s", feature.name, name, payload)
+            self.revert_state(("group", name), key)
+            return
         
-        monitors = get_physical_monitors()
-        if display_id < len(monitors):
-            monitor_handle = monitors[display_id][0]
-            
-            # Find the input code for the selected input name
-            input_code = None
-            for entry in self.inputs[display_id]["select"]["options"]:
-                if entry["name"] == input_name:
-                    input_code = entry["code"]
-                    break
-            
-            if input_code is not None:
-                # Set the input source
-                set_input_source(monitor_handle, int(input_code))
-                
-                # Update the state in Home Assistant
-                self.mqtt.client.publish(self.inputs[display_id]["select"]["topic"], input_name, retain=True)
-                self.inputs[display_id]["select"]["state"] = input_name
+        self.throttle.call(("group", name, key), self.write_group, self.groups[name], feature, payload)
+    
+    def write_group(self, group, feature, payload):
+        """
+        Writes to every display of a group at once, each on its own worker.
+        """
+        writes = []
+        for display_id in group.displays:
+            if display_id in self.displays:
+                # Displays without the feature of their own are written to all the same
+                member = self.displays[display_id].features.get(feature.key, feature)
+                _, maximum = self.vcp_state[display_id].get(member.code, (None, None))
+                writes.append((display_id, member, member.value_for(payload, maximum)))
+        started = time.perf_counter()
+        
+        def on_results(results):
+            confirmed = sum(result is not None and result.confirmed for result in results)
+            log.debug("Group %s set %s to %s on %d of %d displays in %.3fs", group.name, feature.name, payload,
+                      confirmed, len(results), time.perf_counter() - started)
+            if confirmed:
+                self.update_state(("group", group.name), feature.key, feature.state_for(feature.value_for(payload)))
             else:
-                print(f"Invalid input name: {input_name}")
+                self.revert_state(("group", group.name), feature.key)
+        
+        self.write_many(writes, on_results)
+    
+    def write_many(self, writes, callback):
+        """
+        Queues several verified writes and calls callback with their results once all of them finished.
+        
+        The writes of one display run in order on its worker, different
+        displays run at the same time, so the total is the time of the
+        slowest display rather than the sum of all of them.
+        
+        Args:
+            writes: List of (display_id, feature, value) in write order
+            callback: Called with the list of WriteResult, None for displays that were not found
+        """
+        results = []
+        if not writes:
+            callback(results)
+            return
+        
+        def on_result(result):
+            results.append(result)
+            if len(results) == len(writes):
+                callback(results)
+        
+        for display_id, feature, value in writes:
+            self.write_feature(display_id, feature, value, on_result)
     
-    def set_gamer_mode(self, display_id, mode_name):
+    def apply_preset(self, name, payload=None, callback=None):
+        """
+        Writes every value of a preset and publishes how long it took.
+        
+        Args:
+            callback: Called with the list of WriteResult once every write finished
+        """
+        preset = self.presets[name]
+        writes = []
+        for display_id, values in preset.displays.items():
+            display = self.displays.get(display_id)
+            if display is None:
+                continue
+            for key, option in values:
+                feature = preset_feature(display, key)
+                if feature is None:
+                    log.warning("Preset %s: display %s has no feature %s", name, display_id, key)
+                    continue
+                _, maximum = self.vcp_state[display_id].get(feature.code, (None, None))
+                value = feature.value_for(option, maximum)
+                if value is None:
+                    log.warning("Preset %s: invalid %s for display %s: %s", name, feature.name, display_id, option)
+                    continue
+                writes.append((display_id, feature, value))
+        
+        log.debug("Applying preset %s: %d writes to %d displays", name, len(writes), len(preset.displays))
+        started = time.perf_counter()
+        
+        def on_results(results):
+            seconds = time.perf_counter() - started
+            confirmed = sum(result is not None and result.confirmed for result in results)
+            metrics.PRESET_SECONDS.observe(seconds, preset=name)
+            log.info("Applied preset %s in %.3fs, %d of %d writes confirmed", name, seconds, confirmed, len(writes))
+            self.mqtt.publish(self.preset_attributes[name], json.dumps({
+                "seconds": round(seconds, 3),
+                "writes": len(writes),
+                "confirmed": confirmed
+            }), retain=True)
+            if callback is not None:
+                callback(results)
+        
+        self.write_many(writes, on_results)
+    
+    def set_gamer_mode(self, display_id, mode_name, callback=None):
         """
         Sets the Gamer Mode for the specified monitor and updates the state in Home Assistant.
         """
-        print(f"Setting Gamer Mode for display {display_id} to {mode_name}")
+        log.debug("Setting Gamer Mode for display %s to %s", display_id, mode_name)
+        self.command(display_id, "gamer_mode", mode_name, callback)
+    
+    def activate_input(self, display_id, input_name, callback=None):
+        """
+        Activates the specified input source for the monitor.
+        """
+        log.debug("Setting input of display %s to %s", display_id, input_name)
+        self.command(display_id, "input", input_name, callback)
+    
+    def read_vcp(self, display_id, code, callback):
+        """
+        Reads any VCP code of a display, callback is then called with (current, maximum) or None.
         
-        monitors = get_physical_monitors()
-        if display_id < len(monitors):
-            monitor_handle = monitors[display_id][0]
-            
-            # Map mode names to their corresponding codes
-            mode_map = {
-                "OFF": GAMER_MODE_OFF,
-                "FPS": GAMER_MODE_FPS,
-                "RTS": GAMER_MODE_RTS,
-                "Racing": GAMER_MODE_RACING,
-                "Gamer 1": GAMER_MODE_GAMER1,
-                "Gamer 2": GAMER_MODE_GAMER2,
-                "Gamer 3": GAMER_MODE_GAMER3
-            }
-            
-            if mode_name in mode_map:
-                # Set the Gamer Mode
-                success = set_gamer_mode(monitor_handle, mode_map[mode_name])
-                if success:
-                    # Update the state in Home Assistant
-                    self.mqtt.client.publish(self.gamer_modes[display_id]["select"]["topic"], mode_name, retain=True)
-                    self.gamer_modes[display_id]["select"]["state"] = mode_name
-                else:
-                    print(f"Failed to set Gamer Mode to {mode_name}")
-            else:
-                print(f"Invalid Gamer Mode: {mode_name}")
+        The value also updates the state of the feature using the code, if any. Unlike
+        polling passes, one-off reads neither back off nor change the health of the display.
+        """
+        def on_read(result):
+            if display_id in self.displays and result is not None and result[0] is not None:
+                self.vcp_state[display_id][code] = result
+                feature = self.displays[display_id].by_code.get(code)
+                if feature is not None and self.health[display_id].active:
+                    self.update_state(display_id, feature.key, feature.state_for(*result))
+            callback(result)
+        
+        if not self.poller.query(display_id, code, on_read):
+            callback(None)
     
-    def create_input_select(self, display_id, input_name, input_code):
+    def write_vcp(self, display_id, code, value, callback):
         """
-        Creates a dropdown (select) entity for an input source.
+        Writes any VCP code of a display, callback is then called with the WriteResult or None.
+        
+        Codes of a feature go through its command path and update its state.
+        Other codes, e.g. the power mode to wake a monitor up, are written
+        whatever the health of the display.
         """
-        # Replace wildcards in the topic templates
-        topic = display_input_entity["generic_select"].format(display_id=display_id)
-        availability_topic = display_input_entity["generic_select_config"]["availability_topic"].format(display_id=display_id)
-        state_topic = display_input_entity["generic_select_config"]["state_topic"].format(display_id=display_id)
-        command_topic = display_input_entity["generic_select_config"]["command_topic"].format(display_id=display_id)
-
-        config = display_input_entity["generic_select_config"].copy()
-        config["unique_id"] = f"display_{display_id}_input"
-        config["object_id"] = f"display_{display_id}_input"
-        config["name"] = "Input Source"
-        config["state_topic"] = state_topic
-        config["availability_topic"] = availability_topic
-        config["command_topic"] = command_topic
-
-        # Add the display_device dynamically
-        device = display_device.copy()
-        device["name"] = device["name"].format(display_id=display_id)
-        device["identifiers"] = [f"display_{display_id}"]  # Unique identifier for each monitor
-        config["device"] = device
-
-        # Publish initial state
-        self.mqtt.client.publish(availability_topic, "online", retain=True)
-        self.mqtt.client.publish(state_topic, "HDMI", retain=True)  # Default state
-        self.mqtt.client.publish(topic, json.dumps(config), retain=True)
-
-        # Subscribe to the command topic
-        self.mqtt.client.subscribe(command_topic)
-
-        # Store the select entity for later use
-        self.inputs[display_id]["select"] = {
-            "topic": state_topic,
-            "config": config,
-            "state": "HDMI",  # Default state
-            "options": []  # Initialize the options list
-        }
-
-        # Add the input source options
-        for input_name, input_code in self.inputs[display_id]["inputs"].items():
-            self.inputs[display_id]["select"]["options"].append({
-                "name": input_name,
-                "code": input_code
-            })
-
-    def create_gamer_mode_select(self, display_id):
+        feature = self.displays[display_id].by_code.get(code)
+        if feature is not None:
+            self.write_feature(display_id, feature, value, callback)
+            return
+        
+        def on_written(result):
+            if result is not None and result.confirmed:
+                self.vcp_state[display_id][code] = (result.value, result.maximum)
+            callback(result)
+        
+        if not self.writer.submit(display_id, code, value, on_written):
+            callback(None)
+    
+    def create_entity(self, display_id, feature, full_device=True, model=None):
         """
-        Creates a dropdown (select) entity for Gamer Mode.
+        Creates the select or number entity of a display feature.
         """
-        # Replace wildcards in the topic templates
-        topic = gamer_mode_entity["generic_select"].format(display_id=display_id)
-        availability_topic = gamer_mode_entity["generic_select_config"]["availability_topic"].format(display_id=display_id)
-        state_topic = gamer_mode_entity["generic_select_config"]["state_topic"].format(display_id=display_id)
-        command_topic = gamer_mode_entity["generic_select_config"]["command_topic"].format(display_id=display_id)
-
-        config = gamer_mode_entity["generic_select_config"].copy()
-        config["unique_id"] = f"display_{display_id}_gamer_mode"
-        config["object_id"] = f"display_{display_id}_gamer_mode"
-        config["name"] = "Gamer Mode"
-        config["state_topic"] = state_topic
-        config["availability_topic"] = availability_topic
-        config["command_topic"] = command_topic
-
-        # Add the display_device dynamically
-        device = display_device.copy()
-        device["name"] = device["name"].format(display_id=display_id)
-        device["identifiers"] = [f"display_{display_id}"]  # Unique identifier for each monitor
-        config["device"] = device
-
-        # Publish initial state
-        self.mqtt.client.publish(availability_topic, "online", retain=True)
-        self.mqtt.client.publish(state_topic, "OFF", retain=True)
-        self.mqtt.client.publish(topic, json.dumps(config), retain=True)
-
-        # Subscribe to the command topic
-        self.mqtt.client.subscribe(command_topic)
-
-        # Store the select entity for later use
-        self.gamer_modes[display_id] = {
-            "select": {
-                "topic": state_topic,
-                "config": config,
-                "state": "OFF"
-            }
+        if feature.component == "select":
+            entity = render_select(display_id, feature, self.mqtt.availability_topic, full_device, model)
+        else:
+            entity = render_number(f"display_{display_id}_{feature.key}", feature, self.mqtt.availability_topic,
+                                   render_device(display_id, full_device, model))
+        if self.json_state:
+            entity = render_shared(entity, display_id, feature.key)
+        self.add_entity(display_id, feature.key, entity, partial(self.command, display_id, feature.key),
+                        shared=self.json_state)
+    
+    def add_entity(self, owner, key, entity, handler, shared=False):
+        """
+        Registers the discovery config of an entity and routes its commands to handler.
+        
+        Args:
+            shared: The entity's state is a field of its owner's JSON state document
+        
+        Returns:
+            bool: True if the entity is new, False if it already existed and keeps its state
+        """
+        self.discovery.add(entity)
+        self.subscribe(entity.command_topic, handler)
+        if self.registered is not None:
+            self.registered.add((owner, key))
+        
+        entities = self.entities.setdefault(owner, {})
+        if key in entities:
+            return False
+        # Store the entity for later use, its state is published after the first read
+        entities[key] = {
+            "topic": entity.state_topic,
+            "availability": entity.availability_topic,
+            "config": entity.topic,
+            "command": entity.command_topic,
+            "state": None,
+            "shared": shared
         }
-
-    def activate_input(self, display_id, input_name):
+        return True
+    
+    def remove_entity(self, owner, key):
         """
-        Activates the specified input source for the monitor.
+        Deletes an entity from Home Assistant together with its retained topics.
         """
-        print(f"Display {display_id} name {input_name}")
+        entity = self.entities[owner].pop(key)
+        self.discovery.remove(entity["config"])
+        self.unsubscribe(entity["command"])
         
-        monitors = get_physical_monitors()
-        if display_id < len(monitors):
-            monitor_handle = monitors[display_id][0]
-            
-            # Find the input code for the selected input name
-            input_code = None
-            for entry in self.inputs[display_id]["select"]["options"]:
-                if entry["name"] == input_name:
-                    input_code = entry["code"]
-                    break
+        # Topics shared with the other entities of a display stay, the document just loses a field
+        others = self.entities[owner].values()
+        if all(other["availability"] != entity["availability"] for other in others):
+            self.mqtt.publish(entity["availability"], "", retain=True)
+        if entity["topic"] is not None and all(other["topic"] != entity["topic"] for other in others):
+            self.states.forget(entity["topic"])
+            self.mqtt.publish(entity["topic"], "", retain=True)
+        elif entity["shared"]:
+            self.queue_document(owner)
+    
+    def publish_states(self, display_id):
+        """
+        Publishes the states of a display from the values last read, e.g. after its options were renamed.
+        """
+        if not self.health[display_id].active:
+            return
+        features = self.displays[display_id].by_code
+        for code, (current, maximum) in self.vcp_state[display_id].items():
+            feature = features.get(code)
+            if feature is not None and current is not None:
+                self.update_state(display_id, feature.key, feature.state_for(current, maximum))
+    
+    def reload(self, path):
+        """
+        Applies the changes of the config file, keeping the running config if the new one is invalid.
+        """
+        started = time.perf_counter()
+        try:
+            config = load_config(path)
+            validate_config(config)
+            self.apply_config(config)
+        except (OSError, yaml.YAMLError, ValueError, TypeError) as e:
+            log.error("Not reloading %s, keeping the running config: %s", path, e)
+            return
+        log.info("Reloaded %s in %.1fms", path, (time.perf_counter() - started) * 1000)
+    
+    def apply_config(self, config):
+        """
+        Switches to a new config, changing only the entities, subscriptions and polls that differ.
+        
+        Monitor handles, worker threads and the MQTT connection are kept.
+        Entities that stay keep their state and availability, so Home
+        Assistant only sees the discovery configs that actually changed.
+        
+        Returns:
+            int: Number of discovery configs published
+        """
+        restart = [section for section in RESTART_SECTIONS if config.get(section) != self.config.get(section)]
+        if restart:
+            log.warning("Changes to %s take effect after a restart", ", ".join(restart))
+        
+        # Compile everything first, an invalid config must not be half applied
+        poll_interval = config.get("interval", 20)
+        display_configs = {display["id"]: display for display in config["display"]}
+        displays = {display_id: compile_display(display, poll_interval, self.display_capabilities.get(display_id))
+                    for display_id, display in display_configs.items()}
+        groups = compile_groups(config)
+        presets = compile_presets(config)
+        command_options = dict(config.get("commands") or {})
+        throttle = command_options.pop("throttle", 0.25)
+        writer = CommandWriter(self.backend, self.monitors, self.workers, **command_options)
+        polling = PollSchedule(self.scheduler, self.on_poll_due, poll_interval, **(config.get("polling") or {}))
+        health_options = dict(config.get("health") or {})
+        health = DisplayHealth(**health_options)
+        
+        self.config = config
+        self.poll_interval = poll_interval
+        self.states.heartbeat = config.get("heartbeat", 300) or None
+        self.throttle.interval = throttle
+        self.writer = writer
+        for key in ("interval", "boost_interval", "boost_count", "max_backoff", "window"):
+            setattr(self.poll_schedule, key, getattr(polling, key))
+        self.health_options = health_options
+        for display_health in self.health.values():
+            display_health.threshold = health.threshold
+            display_health.probe_interval = health.probe_interval
+        
+        self.registered = set()
+        previous = self.display_configs
+        self.display_configs = display_configs
+        for display_id in previous.keys() - display_configs.keys():
+            log.info("Display %s was removed", display_id)
+            self.stop_display(display_id)
+            self.monitors.assign(display_id, None)
+            self.displays.pop(display_id, None)
+        
+        for display_id, display in displays.items():
+            old = previous.get(display_id)
+            if old is not None and old.get("serial") == display_configs[display_id].get("serial"):
+                if display_id not in self.pending:
+                    self.displays[display_id] = display
+                    self.add_display(display)
+                    self.publish_states(display_id)
+                else:
+                    # Entities warm-started from the snapshot stay until the capabilities decide
+                    self.registered.update((display_id, key) for key in self.entities.get(display_id, {}))
+                continue
             
-            if input_code is not None:
-                # Set the input source
-                set_input_source(monitor_handle, int(input_code))
-                
-                # Update the state in Home Assistant
-                self.mqtt.client.publish(self.inputs[display_id]["select"]["topic"], input_name, retain=True)
-                self.inputs[display_id]["select"]["state"] = input_name
-            else:
-                print(f"Invalid input name: {input_name}")
-                
-    def step(self, dt):
+            # A new display, or one bound to another monitor whose capabilities must be read
+            log.info("Display %s was %s", display_id, "added" if old is None else "bound to another monitor")
+            self.stop_display(display_id)
+            self.vcp_state[display_id] = {}
+            self.displays[display_id] = compile_display(display_configs[display_id], poll_interval)
+            self.start_display(self.displays[display_id])
+        
+        self.groups = groups
+        for group in groups.values():
+            self.add_group(group)
+        for name in self.presets.keys() - presets.keys():
+            self.mqtt.publish(self.preset_attributes.pop(name), "", retain=True)
+        self.presets = presets
+        for index, preset in enumerate(presets.values()):
+            self.add_preset(preset, full_device=index == 0)
+        
+        removed = [(owner, key) for owner, entities in self.entities.items() for key in entities
+                   if (owner, key) not in self.registered]
+        for owner, key in removed:
+            self.remove_entity(owner, key)
+        self.registered = None
+        
+        published = self.discovery.publish()
+        log.info("Config applied: %d discovery configs published, %d entities removed", published, len(removed))
+        return published
+
+    def on_poll_due(self, due):
         """
-        Handles the main loop of the service.
+        Reads the VCP codes that are due, one pass per monitor.
         """
-        # Step the timer
-        self.timer.step(dt)
+        # Re-enumerate on the next lookup if the displays changed
+        self.monitors.check_topology()
         
-        # Step the MQTT client
-        self.mqtt.step(dt)
+        for display_id, codes in due.items():
+            if not self.poller.poll(display_id, codes, self.on_poll):
+                log.warning("Display %s is busy, skipping poll", display_id)
 
-    def on_timer(self, timer, elapsed):
+    def setup_metrics(self, options):
         """
-        Handles periodic tasks when the timer elapses.
+        Serves metrics on a local HTTP endpoint and optionally publishes them to MQTT.
         """
-        # Update the input source states
-        self.update_inputs_states()
+        metrics.QUEUE_DEPTH.set_function(
+            lambda: {(str(display_id),): stats["depth"] for display_id, stats in self.workers.stats().items()})
+        metrics.QUEUE_JOBS.set_function(lambda: {
+            (str(display_id), outcome): stats[outcome]
+            for display_id, stats in self.workers.stats().items()
+            for outcome in ("submitted", "coalesced", "rejected", "completed")
+        })
+        metrics.PUBLISHES.set_function(
+            lambda: {(result,): count for result, count in self.states.stats().items() if result != "topics"})
         
-        # Update the Gamer Mode states
-        self.update_gamer_modes_states()
+        self.metrics_server = None
+        if options.get("port"):
+            self.metrics_server = metrics.serve(options.get("host", "127.0.0.1"), options["port"])
         
-        # Reset the timer
-        self.timer.reset()
-        self.timer.active = True
+        self.metrics_topic = options.get("topic")
+        self.metrics_timer = None
+        if self.metrics_topic:
+            self.metrics_timer = Timer(options.get("interval", 60), self, self.scheduler)
+    
+    def on_timer(self, timer, elapsed):
+        """
+        Saves the state snapshot, or publishes the metrics snapshot to MQTT.
+        """
+        if timer is self.snapshot_timer:
+            self.save_snapshot()
+        else:
+            self.mqtt.publish(self.metrics_topic, json.dumps(metrics.REGISTRY.snapshot()))
+        timer.start()
+    
+    def save_snapshot(self):
+        """
+        Saves the monitor and last values of every display and the discovery hashes, if they changed.
+        """
+        if self.snapshot is None:
+            return
+        displays = {}
+        for display_id in self.displays:
+            monitor = self.snapshot_monitors.get(display_id) or self.monitors.key(display_id)
+            values = {code: value for code, value in self.vcp_state[display_id].items() if value[0] is not None}
+            displays[display_id] = (monitor, values)
+        self.snapshot.save(displays, {**self.discovery.restored, **self.discovery.published})
 
     def start(self):
-        while True:
-            t0 = timer()
-            self.step(self.dt)
-            t1 = timer()
-            self.dt = t1 - t0
+        """
+        Runs the service, sleeping until the next poll or incoming message.
+        """
+        self.mqtt.start()
+        try:
+            self.scheduler.run()
+        finally:
+            self.save_snapshot()
+            self.mqtt.stop()
+            self.workers.stop()
+            self.monitors.close()
+            if self.metrics_server is not None:
+                self.metrics_server.shutdown()
+            if self.control is not None:
+                self.control.shutdown()
+            self.log_listener.stop()
 
-service = Service()
-service.start()
\ No newline at end of file
+if __name__ == "__main__":
+    service = Service()
+    service.start()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import threading
+import time
+
+
+class StateCache:
+    """
+    Publishes retained state topics only when their payload changes.
+
+    Unchanged payloads are still republished once the heartbeat interval
+    has passed since the last publish, and refresh() republishes every
+    known topic, e.g. after Home Assistant comes back online.
+
+    Args:
+        client: MQTTClient used to publish
+        heartbeat: Seconds after which an unchanged state is sent again, None to never resend
+        clock: Time source, defaults to time.monotonic
+    """
+    def __init__(self, client, heartbeat=None, clock=time.monotonic):
+        self.client = client
+        self.heartbeat = heartbeat
+        self.clock = clock
+        self.values = {}
+        self.sent = 0
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def publish(self, topic, payload, force=False):
+        """
+        Publishes a retained state unless it is unchanged.
+
+        Returns:
+            bool: True if the message was sent, False if it was suppressed
+        """
+        now = self.clock()
+        with self.lock:
+            last = self.values.get(topic)
+            if (not force and last is not None and last[0] == payload
+                    and (self.heartbeat is None or now - last[1] < self.heartbeat)):
+                self.suppressed += 1
+                return False
+            self.values[topic] = (payload, now)
+            self.sent += 1
+        self.client.publish(topic, payload, retain=True)
+        return True
+
+    def get(self, topic):
+        """
+        Returns the last payload published on a topic, or None.
+        """
+        with self.lock:
+            last = self.values.get(topic)
+        return last[0] if last is not None else None
+
+    def refresh(self):
+        """
+        Republishes every known state regardless of changes.
+        """
+        with self.lock:
+            values = [(topic, payload) for topic, (payload, _) in self.values.items()]
+        for topic, payload in values:
+            self.publish(topic, payload, force=True)
+
+    def forget(self, topic):
+        with self.lock:
+            self.values.pop(topic, None)
+
+    def stats(self):
+        with self.lock:
+            return {"sent": self.sent, "suppressed": self.suppressed, "topics": len(self.values)}
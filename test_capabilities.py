@@ -0,0 +1,77 @@
+import pytest
+
+from capabilities import parse_capabilities
+
+DELL = (
+    "(prot(monitor)type(LCD)model(U2415)cmds(01 02 03 07 0C E3 F3)vcp(02 04 05 08 10 12 14(01 05 08 0B 0C) 16 18 "
+    "1A 52 60(0F 11 12 ) AA(01 02 04) AC AE B2 B6 C6 C8 C9 D6(01 04 05) DC(00 02 03 05) DF E0 E1 "
+    "E2(00 1D 01 02 04 0E 12 14 23 24 27) F0(00 05 06 0A) F1 F2 FD)mswhql(1)asset_eep(40)mccs_ver(2.1))"
+)
+
+LG = (
+    "(prot(monitor)type(LCD)model(LG FULL HD)cmds(01 02 03 0C E3 F3)vcp(02 04 05 08 10 12 14(05 08 0B ) 16 18 "
+    "1A 52 60( 01 03 11 0F) 6C 6E 70 87 AC AE B6 C0 C6 C8 C9 D6(01 04) DF E0 E1)mccs_ver(2.1)mswhql(1))"
+)
+
+
+def test_dell():
+    capabilities = parse_capabilities(DELL)
+    assert (capabilities.model, capabilities.type, capabilities.mccs_version) == ("U2415", "LCD", "2.1")
+    assert capabilities.commands == (0x01, 0x02, 0x03, 0x07, 0x0C, 0xE3, 0xF3)
+    assert capabilities.values(0x60) == (0x0F, 0x11, 0x12)
+    assert capabilities.values(0xD6) == (0x01, 0x04, 0x05)
+    assert capabilities.supports(0x10) and capabilities.values(0x10) == ()
+    assert len(capabilities.vcp) == 30
+
+
+def test_lg_spaces_inside_value_lists():
+    capabilities = parse_capabilities(LG)
+    assert capabilities.model == "LG FULL HD"
+    assert capabilities.values(0x60) == (0x01, 0x03, 0x11, 0x0F)
+    assert capabilities.values(0x14) == (0x05, 0x08, 0x0B)
+    assert capabilities.supports(0xE1)
+
+
+def test_nested_value_lists_are_skipped():
+    capabilities = parse_capabilities("(vcp(10 DC(00(01 02) 03) 60(0F(00) 11)))")
+    assert capabilities.values(0xDC) == (0x00, 0x03)
+    assert capabilities.values(0x60) == (0x0F, 0x11)
+    assert sorted(capabilities.vcp) == [0x10, 0x60, 0xDC]
+
+
+def test_hex_bytes_without_spaces():
+    capabilities = parse_capabilities("(cmds(01020307)vcp(1012 60(0F11)))")
+    assert capabilities.commands == (0x01, 0x02, 0x03, 0x07)
+    assert capabilities.vcp == {0x10: (), 0x12: (), 0x60: (0x0F, 0x11)}
+
+
+def test_trailing_nul_and_missing_outer_parentheses():
+    capabilities = parse_capabilities("prot(monitor)model(X)vcp(10 60(11))\x00\x00")
+    assert capabilities.model == "X"
+    assert capabilities.vcp == {0x10: (), 0x60: (0x11,)}
+
+
+def test_section_names_ignore_case_and_the_first_one_wins():
+    capabilities = parse_capabilities("(MODEL(A)model(B)VCP(10))")
+    assert capabilities.model == "A"
+    assert capabilities.vcp == {0x10: ()}
+
+
+@pytest.mark.parametrize("text", ["", "()", "(prot(monitor)type(LCD))", "garbage"])
+def test_missing_sections(text):
+    capabilities = parse_capabilities(text)
+    assert capabilities.model is None
+    assert capabilities.commands == ()
+    assert capabilities.vcp == {}
+
+
+@pytest.mark.parametrize("text", [
+    "(vcp(10 60(0F 11)",
+    "(vcp(10))model(X))",
+    "(vcp(10 ZZ))",
+    "(cmds(01 G2))",
+    "(vcp(10 60(0F 11))",
+])
+def test_garbage_is_rejected(text):
+    with pytest.raises(ValueError):
+        parse_capabilities(text)
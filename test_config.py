@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from config import ConfigWatcher, validate_config
+from scheduler import Scheduler
+
+
+def make_config(**sections):
+    config = {
+        "mqtt": {"username": "", "password": "", "host": "127.0.0.1", "port": 1883},
+        "display": [{"id": 0, "inputs": {"HDMI": 17}}],
+    }
+    config.update(sections)
+    return config
+
+
+def test_valid_config_passes():
+    validate_config(make_config(
+        groups={"desk": {"displays": [0], "numbers": ["brightness"]}},
+        presets={"work": {0: {"input": "HDMI", "brightness": 60}}},
+        polling={"boost_interval": 0.5, "boost_count": 0, "max_backoff": 300, "window": 0},
+        commands={"settle": 0.1, "retries": 0, "backoff": 0.2, "throttle": 0},
+        health={"threshold": 3, "probe_interval": 30},
+    ))
+
+
+@pytest.mark.parametrize("poll", [{0x10: 5}, [0x10, 0x12], None])
+def test_valid_poll_passes(poll):
+    validate_config(make_config(display=[{"id": 0, "poll": poll}]))
+
+
+@pytest.mark.parametrize("poll", [{0x10: "5"}, {0x10: 0}, {0x100: 5}, ["0x10"], [True], "0x10"])
+def test_invalid_poll_is_rejected(poll):
+    with pytest.raises(ValueError):
+        validate_config(make_config(display=[{"id": 0, "poll": poll}]))
+
+
+@pytest.mark.parametrize("sections", [
+    {"groups": ["desk"]},
+    {"groups": {"desk": {"displays": 0}}},
+    {"groups": {"desk": {"displays": [0], "numbers": ["sharpness"]}}},
+    {"presets": ["work"]},
+    {"presets": {"work": {0: ["HDMI"]}}},
+    {"presets": {"work": {0: {"input": None}}}},
+    {"presets": {"work": {0: {"brightness": {"value": 60}}}}},
+    {"polling": [1]},
+    {"polling": {"interval": 5}},
+    {"polling": {"boost_count": 1.5}},
+    {"polling": {"boost_interval": 0}},
+    {"polling": {"window": -1}},
+    {"commands": {"settle": "0.1"}},
+    {"commands": {"retries": True}},
+    {"commands": {"throttle": None}},
+    {"health": {"threshold": 0}},
+    {"health": {"probe_interval": "30"}},
+])
+def test_invalid_sections_are_rejected(sections):
+    with pytest.raises(ValueError):
+        validate_config(make_config(**sections))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_watcher_keeps_watching_after_a_failed_reload(tmp_path):
+    path = tmp_path / "config.yml"
+    path.write_text("a")
+    clock = FakeClock()
+    scheduler = Scheduler(clock)
+    reloads = []
+
+    def reload(path):
+        reloads.append(path)
+        if len(reloads) == 1:
+            raise AttributeError("unexpected")
+
+    def tick():
+        clock.now += 1
+        scheduler.run_once(0)
+
+    watcher = ConfigWatcher(str(path), scheduler, reload, interval=1)
+    for index, text in enumerate(("ab", "abc")):
+        path.write_text(text)
+        os.utime(path, ns=(index + 1, index + 1))
+        # The change is applied once the file is the same on two checks in a row
+        tick()
+        tick()
+    watcher.stop()
+    assert len(reloads) == 2
@@ -0,0 +1,73 @@
+import pytest
+
+from edid import EDID_HEADER, build_edid, parse_edid
+
+
+def with_checksum(data):
+    data = bytearray(data)
+    data[127] = -sum(data[:127]) & 0xFF
+    return bytes(data)
+
+
+def test_identity_is_decoded():
+    edid = parse_edid(build_edid("AOC", 0x2402, 12345, "ABC123", "24G2W1G4"))
+    assert edid.manufacturer == "AOC"
+    assert edid.product_code == 0x2402
+    assert edid.serial_number == 12345
+    assert edid.serial == "ABC123"
+    assert edid.name == "24G2W1G4"
+    assert edid.id == "AOC-2402-ABC123"
+
+
+def test_real_block():
+    # Identity fields of a Dell U2415, the serial descriptor first and the name second
+    data = bytearray(128)
+    data[:8] = EDID_HEADER
+    data[8:10] = bytes([0x10, 0xAC])  # DEL
+    data[10:12] = bytes([0xA0, 0xA0])
+    data[12:16] = bytes([0x4C, 0x39, 0x35, 0x30])
+    data[54:72] = bytes([0, 0, 0, 0xFF, 0]) + b"7MT0167B0L9L\n"
+    data[72:90] = bytes([0, 0, 0, 0xFC, 0]) + b"DELL U2415\n  "
+    edid = parse_edid(with_checksum(data))
+    assert (edid.manufacturer, edid.product_code) == ("DEL", 0xA0A0)
+    assert edid.serial_number == 0x3035394C
+    assert (edid.serial, edid.name) == ("7MT0167B0L9L", "DELL U2415")
+
+
+def test_numeric_serial_without_descriptor():
+    edid = parse_edid(build_edid("SAM", 0x0F33, 42))
+    assert edid.serial is None and edid.name is None
+    assert edid.serial_id == "42"
+    assert edid.id == "SAM-0F33-42"
+
+
+def test_monitors_without_serial_share_the_model_id():
+    assert parse_edid(build_edid("GSM", 0x5B09)).id == "GSM-5B09"
+
+
+def test_extension_blocks_are_ignored():
+    data = build_edid("AOC", 0x2402, 1, "ABC123")
+    assert parse_edid(data + bytes(128)).id == "AOC-2402-ABC123"
+
+
+@pytest.mark.parametrize("data", [
+    None,
+    b"",
+    # Bad header
+    bytes(8) + build_edid("AOC", 0x2402, 1, "ABC123")[8:],
+    # Truncated block
+    build_edid("AOC", 0x2402, 1, "ABC123")[:127],
+    build_edid("AOC", 0x2402, 1, "ABC123")[:64],
+])
+def test_invalid_blocks_are_rejected(data):
+    assert parse_edid(data) is None
+
+
+def test_bad_checksum_is_rejected():
+    data = bytearray(build_edid("AOC", 0x2402, 1, "ABC123"))
+    data[127] ^= 0x01
+    assert parse_edid(bytes(data)) is None
+    # A flipped byte in the serial descriptor is caught as well
+    data[127] ^= 0x01
+    data[60] ^= 0x01
+    assert parse_edid(bytes(data)) is None
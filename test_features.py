@@ -0,0 +1,22 @@
+import pytest
+
+from features import NUMBER_FEATURES, NumberFeature
+
+
+@pytest.fixture
+def brightness():
+    return NumberFeature(*NUMBER_FEATURES["brightness"])
+
+
+@pytest.mark.parametrize("payload, value", [("50", 50), ("40.4", 40), ("-5", 0), ("150", 100)])
+def test_percentages_are_clamped_and_scaled(brightness, payload, value):
+    assert brightness.value_for(payload, 100) == value
+
+
+def test_percentage_scales_to_the_maximum(brightness):
+    assert brightness.value_for("50", 200) == 100
+
+
+@pytest.mark.parametrize("payload", ["nan", "inf", "-inf", "NaN", "bright", ""])
+def test_non_finite_or_non_numeric_payloads_are_rejected(brightness, payload):
+    assert brightness.value_for(payload, 100) is None
@@ -0,0 +1,106 @@
+import os
+import threading
+
+import pytest
+
+from i2c import DDCError, I2CBackend, decode_message, display_bus, encode_message
+
+
+@pytest.mark.parametrize("payload, message", [
+    # Get VCP feature 0x10 (brightness)
+    ("01 10", "51 82 01 10 ac"),
+    # Set VCP feature 0x10 to 50
+    ("03 10 00 32", "51 84 03 10 00 32 9a"),
+    # Capabilities request at offset 0
+    ("f3 00 00", "51 83 f3 00 00 4f"),
+])
+def test_encode_message(payload, message):
+    assert encode_message(bytes.fromhex(payload)) == bytes.fromhex(message)
+
+
+@pytest.mark.parametrize("reply, payload", [
+    # VCP reply: brightness 50 of 100
+    ("6e 88 02 00 10 00 00 64 00 32 f2", "02 00 10 00 00 64 00 32"),
+    # Bytes after the checksum are ignored
+    ("6e 88 02 00 10 00 00 64 00 32 f2 00 00", "02 00 10 00 00 64 00 32"),
+])
+def test_decode_message(reply, payload):
+    assert decode_message(bytes.fromhex(reply)) == bytes.fromhex(payload)
+
+
+@pytest.mark.parametrize("reply, error", [
+    ("6e 88 02 00 10 00 00 64 00 32 f3", "checksum"),
+    ("6e 88 02 00 10 00 00 64", "Truncated"),
+    ("6e 8f 02 00 10 00 00 64 00 32 f2", "Truncated"),
+    ("00 88 02 00 10 00 00 64 00 32 f2", "header"),
+    ("6e 80", "header"),
+    ("6e 80 be", "Null"),
+])
+def test_decode_message_rejects_invalid_replies(reply, error):
+    with pytest.raises(DDCError, match=error):
+        decode_message(bytes.fromhex(reply))
+
+
+class FakeTransport:
+    def __init__(self, reply):
+        self.reply = bytes.fromhex(reply)
+        self.written = []
+
+    def set_address(self, address):
+        self.address = address
+
+    def write(self, data):
+        self.written.append((self.address, bytes(data)))
+
+    def read(self, length):
+        return self.reply[:length]
+
+
+class FakeDevice:
+    def __init__(self, transport):
+        self.path = "/dev/i2c-fake"
+        self.transport = transport
+        self.lock = threading.Lock()
+        self.ready_at = 0
+
+
+@pytest.mark.parametrize("reply, result", [
+    ("6e 88 02 00 10 00 00 64 00 32 f2", (50, 100)),
+    # Result code 1, unsupported VCP code
+    ("6e 88 02 01 10 00 00 00 00 00 a5", (None, None)),
+    ("6e 88 02 00 10 00 00 64 00 32 00", (None, None)),
+])
+def test_get_vcp(reply, result):
+    backend = I2CBackend(buses=[], reply_delay=0, command_delay=0)
+    transport = FakeTransport(reply)
+    assert backend.get_vcp(FakeDevice(transport), 0x10) == result
+    assert transport.written == [(0x37, bytes.fromhex("51 82 01 10 ac"))]
+
+
+def make_bus(sysfs, devices, bus, name, adapter, device_class=None):
+    os.makedirs(os.path.join(devices, adapter, bus))
+    if device_class is not None:
+        with open(os.path.join(devices, adapter, "class"), "w") as file:
+            file.write(device_class + "\n")
+    entry = os.path.join(sysfs, bus)
+    os.makedirs(entry)
+    with open(os.path.join(entry, "name"), "w") as file:
+        file.write(name + "\n")
+    os.symlink(os.path.join(devices, adapter, bus), os.path.join(entry, "device"))
+
+
+@pytest.mark.parametrize("bus, name, adapter, device_class, expected", [
+    ("i2c-0", "SMBus I801 adapter at efa0", "pci0000:00/0000:00:1f.4", "0x0c0500", False),
+    ("i2c-1", "i915 gmbus dpc", "pci0000:00/0000:00:02.0", "0x030000", True),
+    ("i2c-2", "AUX B/DDI B/PHY B", "pci0000:00/0000:00:02.0/drm/card0/card0-DP-1", None, True),
+    ("i2c-3", "AMDGPU SMU 0", "pci0000:00/0000:03:00.0", "0x030000", False),
+    ("i2c-4", "Synopsys DesignWare I2C adapter", "platform/i2c_designware.0", None, False),
+])
+def test_display_bus(tmp_path, bus, name, adapter, device_class, expected):
+    sysfs = str(tmp_path / "class")
+    make_bus(sysfs, str(tmp_path / "devices"), bus, name, adapter, device_class)
+    assert display_bus(f"/dev/{bus}", sysfs) is expected
+
+
+def test_unknown_bus_is_not_a_display_bus(tmp_path):
+    assert display_bus("/dev/i2c-9", str(tmp_path)) is False
@@ -0,0 +1,90 @@
+from monitors import MonitorRegistry
+from simulator import SimulatedBackend
+
+
+def make_registry(monitors=2):
+    backend = SimulatedBackend(monitors)
+    return backend, MonitorRegistry(backend)
+
+
+def test_handles_are_cached():
+    backend, registry = make_registry()
+    handle = registry.handle(0)
+    assert registry.handle(0) is handle
+    assert registry.handle(1) is not handle
+    assert backend.calls["enumerate"] == 1
+
+
+def test_invalidate_keeps_the_handles_of_attached_monitors():
+    backend, registry = make_registry()
+    handles = [registry.handle(0), registry.handle(1)]
+    registry.invalidate()
+    assert [registry.handle(0), registry.handle(1)] == handles
+    assert backend.calls["enumerate"] == 2
+    # The handles opened by the second enumeration were closed again
+    assert backend.open_handles == 2
+
+
+def test_suspect_handle_is_reopened():
+    backend, registry = make_registry()
+    failed, other = registry.handle(0), registry.handle(1)
+    registry.invalidate(0)
+    handle = registry.handle(0)
+    assert handle is not failed and failed.closed
+    assert registry.handle(1) is other
+    assert backend.open_handles == 2
+
+
+def test_unplug_and_plug():
+    backend, registry = make_registry()
+    first, second = registry.handle(0), registry.handle(1)
+    assert not registry.check_topology()
+
+    monitor = backend.monitors[1]
+    backend.unplug(monitor)
+    assert registry.check_topology()
+    assert registry.handle(1) is None
+    assert registry.handle(0) is first
+    assert second.closed
+
+    backend.plug(monitor)
+    assert registry.check_topology()
+    handle = registry.handle(1)
+    assert handle is not None and handle.monitor is monitor
+    assert registry.handle(0) is first
+
+
+def test_display_follows_its_serial_to_another_index():
+    backend, registry = make_registry(3)
+    registry.assign("desk", "SIM00002")
+    handle = registry.handle("desk")
+    assert handle.monitor is backend.monitors[2]
+
+    backend.unplug(backend.monitors[0])
+    registry.check_topology()
+    # The monitor is now second in enumeration order and keeps its open handle
+    assert registry.handle("desk") is handle
+    assert registry.handle(1) is handle
+    assert registry.key("desk") == "SIM-0001-SIM00002"
+
+
+def test_display_can_be_bound_to_the_edid_id():
+    backend, registry = make_registry()
+    registry.assign(0, "SIM-0001-SIM00001")
+    assert registry.handle(0).monitor is backend.monitors[1]
+
+
+def test_display_bound_to_a_missing_serial_has_no_handle():
+    backend, registry = make_registry()
+    registry.assign(0, "SIM99999")
+    assert registry.handle(0) is None
+    registry.assign(0, None)
+    assert registry.handle(0) is not None
+
+
+def test_close_closes_every_handle():
+    backend, registry = make_registry()
+    handles = [registry.handle(0), registry.handle(1)]
+    registry.close()
+    assert all(handle.closed for handle in handles)
+    assert backend.open_handles == 0
@@ -0,0 +1,127 @@
+from poller import PollSchedule
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_schedule(**options):
+    """
+    Returns a PollSchedule on a fake clock, the run(seconds) function advancing it and the passes fired.
+    """
+    clock = FakeClock()
+    scheduler = Scheduler(clock)
+    passes = []
+    schedule = PollSchedule(scheduler, lambda due: passes.append((round(clock.now - 1000.0, 1), due)), **options)
+
+    def run(seconds, step=0.1):
+        end = clock.now + seconds
+        while clock.now < end - 1e-9:
+            clock.now += step
+            scheduler.run_once(0)
+
+    scheduler.run_once(0)
+    return schedule, run, passes
+
+
+def times(passes, display_id=0, code=None):
+    return [at for at, due in passes if display_id in due and (code is None or code in due[display_id])]
+
+
+def test_first_read_is_immediate_then_every_interval():
+    schedule, run, passes = make_schedule(interval=5)
+    schedule.add(0, 0x10)
+    run(12)
+    assert times(passes) == [0.1, 5.1, 10.1]
+
+
+def test_codes_have_their_own_interval():
+    schedule, run, passes = make_schedule(window=0)
+    schedule.add(0, 0x10, 2)
+    schedule.add(0, 0x60, 5)
+    run(6)
+    assert times(passes, code=0x10) == [0.1, 2.1, 4.1]
+    assert times(passes, code=0x60) == [0.1, 5.1]
+
+
+def test_window_reads_nearly_due_codes_in_the_same_pass():
+    schedule, run, passes = make_schedule(window=1)
+    schedule.add(0, 0x10, 5)
+    schedule.add(0, 0x60, 5.5)
+    run(6)
+    # 0x60 is due 0.5s after 0x10, close enough to be read with it
+    assert passes[1] == (5.1, {0: [0x10, 0x60]})
+
+
+def test_boost_polls_quickly_then_returns_to_interval():
+    schedule, run, passes = make_schedule(interval=20, boost_interval=1, boost_count=3)
+    schedule.add(0, 0x60)
+    run(0.1)
+    schedule.boost(0, 0x60)
+    run(25)
+    assert times(passes) == [0.1, 1.1, 2.1, 3.1, 23.1]
+
+
+def test_failures_back_off_exponentially_up_to_the_maximum():
+    schedule, run, passes = make_schedule(interval=1, max_backoff=5)
+    schedule.add(0, 0x10)
+    backoffs = []
+    for _ in range(4):
+        run(0.1)
+        schedule.report(0, False)
+        backoffs.append(schedule.backoff(0))
+    assert backoffs == [2, 4, 5, 5]
+    del passes[:]
+    run(6)
+    assert times(passes)[0] == 5.4
+
+
+def test_success_resets_the_backoff():
+    schedule, run, passes = make_schedule(interval=1)
+    schedule.add(0, 0x10)
+    run(0.1)
+    schedule.report(0, False)
+    assert schedule.backoff(0) == 2
+    schedule.report(0, True)
+    assert schedule.backoff(0) == 0
+
+
+def test_backoff_only_delays_the_failing_display():
+    schedule, run, passes = make_schedule(interval=1, window=0)
+    schedule.add(0, 0x10)
+    schedule.add(1, 0x10)
+    run(0.1)
+    schedule.report(0, False)
+    run(1.5)
+    assert times(passes, 0) == [0.1]
+    assert times(passes, 1) == [0.1, 1.1]
+
+
+def test_suspended_display_is_not_polled_until_resumed():
+    schedule, run, passes = make_schedule(interval=2, window=0)
+    schedule.add(0, 0x10)
+    schedule.add(1, 0x10)
+    run(0.1)
+    schedule.suspend(0)
+    run(5)
+    assert times(passes, 0) == [0.1]
+    assert times(passes, 1) == [0.1, 2.1, 4.1]
+
+    schedule.resume(0)
+    run(0.1)
+    assert times(passes, 0) == [0.1, 5.2]
+
+
+def test_resume_clears_the_backoff():
+    schedule, run, passes = make_schedule(interval=1)
+    schedule.add(0, 0x10)
+    run(0.1)
+    schedule.report(0, False)
+    schedule.suspend(0)
+    schedule.resume(0)
+    assert schedule.backoff(0) == 0
@@ -0,0 +1,44 @@
+class Throttle:
+    """
+    Lets one call per key through every interval seconds, keeping the leading and trailing calls.
+
+    The first call for a key runs at once and opens a window of interval
+    seconds. Calls made during the window replace each other, and the last
+    one runs when the window closes, opening the next window. A slider
+    drag in Home Assistant therefore sends its first value right away, at
+    most one value per interval while dragging, and always its final value.
+
+    Runs on the Scheduler thread.
+
+    Args:
+        scheduler: Scheduler that closes the windows
+        interval: Seconds between two calls for the same key, 0 to disable
+    """
+    def __init__(self, scheduler, interval=0.25):
+        self.scheduler = scheduler
+        self.interval = interval
+        self.windows = {}
+        self.passed = 0
+        self.dropped = 0
+
+    def call(self, key, fn, *args):
+        """
+        Calls fn(*args) now, or when the window of key closes if one is open.
+        """
+        if key in self.windows:
+            if self.windows[key] is not None:
+                self.dropped += 1
+            self.windows[key] = (fn, args)
+            return
+
+        self.passed += 1
+        if self.interval:
+            self.windows[key] = None
+            self.scheduler.call_later(self.interval, self.close, key)
+        fn(*args)
+
+    def close(self, key):
+        pending = self.windows.pop(key, None)
+        if pending is not None:
+            fn, args = pending
+            self.call(key, fn, *args)
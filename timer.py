@@ -1,20 +1,44 @@
 class Timer:
-    def __init__(self, time, delegate):
+    """
+    One-shot timer that calls delegate.on_timer(timer, elapsed) on the scheduler.
+
+    Call start() (or reset()) from on_timer to make it periodic.
+    """
+    def __init__(self, time, delegate, scheduler, active=True):
         self.delegate = delegate
         self.time = time
-        self.elapsed = 0
-        self.active = True
+        self.scheduler = scheduler
         self.payload = None
         self.name = ""
+        self.started = None
+        self.call = None
+        if active:
+            self.start()
+
+    @property
+    def active(self):
+        return self.call is not None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0
+        return self.scheduler.clock() - self.started
 
-    def step(self, dt):
-        if not self.active:
-            return
-        self.elapsed += dt
-        if self.elapsed >= self.time:
-            self.active = False
-            self.delegate.on_timer(self, self.elapsed)
-            self.elapsed = 0
+    def start(self):
+        self.stop()
+        self.started = self.scheduler.clock()
+        self.call = self.scheduler.call_later(self.time, self.fire)
+
+    def stop(self):
+        if self.call is not None:
+            self.call.cancel()
+            self.call = None
 
     def reset(self):
-        self.elapsed = 0
\ No newline at end of file
+        self.start()
+
+    def fire(self):
+        elapsed = self.elapsed
+        self.call = None
+        self.delegate.on_timer(self, elapsed)
@@ -0,0 +1,163 @@
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    A unit of DDC work queued on a MonitorWorker, with the callbacks of every submit it stands for.
+    """
+    def __init__(self, key, fn, callback):
+        self.key = key
+        self.fn = fn
+        self.callbacks = [callback] if callback is not None else []
+
+
+class MonitorWorker:
+    """
+    Runs DDC calls for a single physical monitor on its own thread.
+
+    Jobs run in submission order. A job submitted with a key replaces any
+    queued job with the same key, keeping its place in the queue, so a burst
+    of writes to one VCP code only sends the last value. Every caller of a
+    coalesced job still gets its callback, with the result of the job that
+    ran. The queue is bounded, submit() refuses new jobs once it is full.
+    """
+    def __init__(self, name, dispatch, maxsize=16):
+        self.name = name
+        self.dispatch = dispatch
+        self.maxsize = maxsize
+        self.queue = deque()
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.running = True
+        self.busy = False
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.completed = 0
+        self.max_depth = 0
+
+        self.thread = threading.Thread(target=self.run, name=f"ddc-{name}", daemon=True)
+        self.thread.start()
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    def submit(self, fn, callback=None, key=None):
+        """
+        Queues a call to run on the worker thread.
+
+        Args:
+            fn: Callable run on the worker thread, its result is passed to callback
+            callback: Callable run through dispatch with the result of fn, or of the job replacing it
+            key: Jobs with the same key are coalesced while still queued
+
+        Returns:
+            bool: True if the job was queued or coalesced, False if the queue is full
+        """
+        with self.condition:
+            if key is not None and key in self.pending:
+                job = self.pending[key]
+                job.fn = fn
+                if callback is not None:
+                    job.callbacks.append(callback)
+                self.coalesced += 1
+                return True
+
+            if len(self.queue) >= self.maxsize:
+                self.rejected += 1
+                return False
+
+            job = Job(key, fn, callback)
+            self.queue.append(job)
+            if key is not None:
+                self.pending[key] = job
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.condition.notify()
+            return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.busy = False
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                job = self.queue.popleft()
+                if job.key is not None:
+                    del self.pending[job.key]
+                self.busy = True
+
+            try:
+                result = job.fn()
+            except Exception:
+                log.exception("Error in DDC worker %s", self.name)
+                result = None
+
+            with self.condition:
+                self.completed += 1
+            for callback in job.callbacks:
+                self.dispatch(callback, result)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.queue.clear()
+            self.pending.clear()
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "depth": len(self.queue),
+                "max_depth": self.max_depth,
+                "busy": self.busy,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "completed": self.completed,
+            }
+
+
+class WorkerPool:
+    """
+    One MonitorWorker per display, created on first use.
+
+    Args:
+        dispatch: Callable used to run job callbacks, usually Scheduler.call_soon
+        maxsize: Queue bound of each worker
+    """
+    def __init__(self, dispatch, maxsize=16):
+        self.dispatch = dispatch
+        self.maxsize = maxsize
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def get(self, display_id):
+        with self.lock:
+            worker = self.workers.get(display_id)
+            if worker is None:
+                worker = MonitorWorker(display_id, self.dispatch, self.maxsize)
+                self.workers[display_id] = worker
+            return worker
+
+    def submit(self, display_id, fn, callback=None, key=None):
+        return self.get(display_id).submit(fn, callback, key)
+
+    def stats(self):
+        with self.lock:
+            workers = dict(self.workers)
+        return {display_id: worker.stats() for display_id, worker in workers.items()}
+
+    def stop(self):
+        with self.lock:
+            for worker in self.workers.values():
+                worker.stop()
+            self.workers = {}